@@ -2,14 +2,30 @@
 Module to build a concrete model from a Specification object
 """
 import json
+import copy
 from tempfile import NamedTemporaryFile
 import re
 import importlib
+import inspect
+import itertools
+import functools
+import os
+import sys
+import types
+import pickle
+import hashlib
 
 import pandas as pd
+import pyomo.environ as pe
+import pyomo.version
 from pyomo.environ import units as pu
+from pyomo.dataportal.plugins.json_dict import tuplize
 
 import mola.utils as mu
+import mola.output as mo
+import mola.dataimport as di
+import mola.dataview as dv
+import mola.sqlgenerator as sq
 
 
 def get_config(json_file_name):
@@ -37,7 +53,7 @@ def get_config(json_file_name):
     parameters = spec.get_default_parameters(sets)
     if 'indexed_sets' in config:
         indexed_sets.update(config['indexed_sets'])
-    parameters.update(config['parameters'])
+    update_parameters(parameters, config['parameters'])
 
     # copy back to config dict
     config['sets'] = sets
@@ -47,31 +63,175 @@ def get_config(json_file_name):
     return config
 
 
+def update_parameters(parameters, saved_parameters):
+    """
+    Update default parameters in place with saved parameters, converting saved dense parameters to the sparse
+    format of their default.
+
+    :param dict parameters: default parameters of a specification
+    :param dict saved_parameters: parameters of a configuration
+    """
+    for p, value in saved_parameters.items():
+        if is_sparse_parameter(parameters.get(p)) and isinstance(value, list):
+            value = get_sparse_parameter(value, parameters[p]['default'])
+        parameters[p] = value
+
+
+def is_sparse_parameter(value):
+    """
+    Parameters are either a list of index-value dicts for every index or in the sparse format of a dict of a default
+    value and a list of the index-value dicts of the indices whose value is not the default, e.g.
+    {'default': 0, 'values': [{'index': ['f1', 'p1'], 'value': 1}]}.
+
+    :param value: parameter value from a configuration
+    :return: True if the parameter is in the sparse format
+    """
+    return isinstance(value, dict) and 'default' in value
+
+
+def get_sparse_parameter(value, default):
+    """
+    Convert a parameter to the sparse format.
+
+    :param list | dict value: list of index-value dicts or sparse parameter, which keeps its own default
+    :param default: default value of the parameter
+    :return: sparse parameter dict
+    """
+    if is_sparse_parameter(value):
+        return value
+    return {'default': default, 'values': [el for el in value if el['value'] != default]}
+
+
+def get_parameter_elements(value, index_sets=None):
+    """
+    Get the index-value dicts of a parameter.
+
+    :param list | dict value: list of index-value dicts or sparse parameter
+    :param list[list] index_sets: members of the sets indexing a sparse parameter, which are needed to include
+        indices with the default value
+    :return: list of index-value dicts
+    """
+    if not is_sparse_parameter(value):
+        return value
+    if index_sets is None:
+        return value['values']
+    values = {tuple(el['index']): el['value'] for el in value['values']}
+    return [{'index': list(index), 'value': values.get(index, value['default'])}
+            for index in itertools.product(*index_sets)]
+
+
+def set_parameter_value(value, index, new_value):
+    """
+    Set the value of an index of a parameter in place. A sparse parameter only keeps the values that differ from its
+    default, a list of index-value dicts is only changed if it holds the index.
+
+    :param list | dict value: list of index-value dicts or sparse parameter
+    :param list index: index of the value
+    :param new_value: value
+    """
+    elements = value['values'] if is_sparse_parameter(value) else value
+    for i, el in enumerate(elements):
+        if el['index'] == index:
+            elements[i] = {'index': index, 'value': new_value}
+            break
+    else:
+        if is_sparse_parameter(value):
+            elements.append({'index': index, 'value': new_value})
+    if is_sparse_parameter(value):
+        value['values'] = [el for el in elements if el['value'] != value['default']]
+
+
+def get_parameter_defaults(sets, parameters, spec, indexed_sets=dict()):
+    """
+    Get the default values of the parameters in the sparse format, which are those with a sparse default in the
+    specification or stored in the sparse format, which keep their own default.
+
+    :param dict sets: sets for optimisation
+    :param dict parameters: parameters
+    :param Specification spec: Specification object
+    :param dict indexed_sets: indexed sets for optimisation
+    :return: dict of parameter name to default value
+    """
+    default_parameters = spec.get_default_parameters(sets, user_indexed_sets=indexed_sets)
+    return {p: parameters[p]['default'] if is_sparse_parameter(parameters.get(p)) else default['default']
+            for p, default in default_parameters.items()
+            if is_sparse_parameter(default) or is_sparse_parameter(parameters.get(p))}
+
+
+def get_index_value_parameters(par, defaults):
+    """
+    Turn a dict of DataFrames of parameters from build_parameters back into configuration parameters.
+
+    :param dict par: dict of DataFrames of parameters
+    :param dict defaults: default values of the parameters in the sparse format, see get_parameter_defaults
+    :return: dict of lists of index-value dicts, sparse parameters or values
+    """
+    return {p: get_sparse_parameter(v, defaults[p]) if p in defaults and isinstance(v, list) else v
+            for p, v in mu.get_index_value(par).items()}
+
+
+def load_data(data_portal, data, model):
+    """
+    Load sets and parameters into a DataPortal as DataPortal.load does for a json file, also loading
+    parameters in the sparse format by setting the default of the model parameter and its other values.
+
+    :param pyomo.DataPortal data_portal: DataPortal to load
+    :param dict | str data: dict of sets and parameters in configuration format or a json file of them
+    :param model: abstract model of the DataPortal
+    """
+    if not isinstance(data, dict):
+        load_json(data_portal, data, model)
+        return
+    for name, value in data.items():
+        if is_sparse_parameter(value):
+            model.component(name).set_default(value['default'])
+            value = value['values']
+        data_portal.__setitem__(name, tuplize(value))
+
+
+def load_json(data_portal, json_file, model):
+    """
+    Load sets and parameters from a json file into a DataPortal, see load_data.
+
+    :param pyomo.DataPortal data_portal: DataPortal to load
+    :param str json_file: json file of sets and parameters
+    :param model: abstract model of the DataPortal
+    """
+    with open(json_file) as fp:
+        data = json.load(fp)
+    load_data(data_portal, data, model)
+
+
+def config_to_data(config):
+    """
+    Extract the sets and parameters from a mola configuration for Specification.populate, which loads them
+    straight into its DataPortal with load_data.
+
+    :param config: dict of configuration data
+    :return: list of dicts of sets, parameters and indexed sets
+    """
+    data_list = [config['sets'], config['parameters']]
+    if 'indexed_sets' in config and len(config['indexed_sets']) > 0:
+        data_list.append(config['indexed_sets'])
+
+    return data_list
+
+
 def config_to_json(config):
     """
     Extract the sets and parameters from a mola configuration file and save them to temporary json files.
 
-    A pyomo DataPortal uses json files to load data so we need this intermediate step.
+    build_instance passes the configuration to Specification.populate with config_to_data instead, this is kept for
+    populating from files.
 
     :param config: dict of configuration data
     :return: list of temporary json files
     """
-    sets_json = NamedTemporaryFile(suffix='.json', delete=False)
-    indexed_sets_json = NamedTemporaryFile(suffix='.json', delete=False)
-    parameters_json = NamedTemporaryFile(suffix='.json', delete=False)
-    json_list = [sets_json.name, parameters_json.name]
-    with open(sets_json.name, 'w') as fp:
-        json.dump(config['sets'], fp)
-    if 'indexed_sets' in config and len(config['indexed_sets']) > 0:
-        with open(indexed_sets_json.name, 'w') as fp:
-            json.dump(config['indexed_sets'], fp)
-        json_list.append(indexed_sets_json.name)
-    with open(parameters_json.name, 'w') as fp:
-        json.dump(config['parameters'], fp)
-
-    sets_json.close()
-    indexed_sets_json.close()
-    parameters_json.close()
+    json_list = []
+    for data in config_to_data(config):
+        with NamedTemporaryFile('w', suffix='.json', delete=False) as fp:
+            json.dump(data, fp)
+        json_list.append(fp.name)
 
     return json_list
 
@@ -92,13 +252,186 @@ def build_instance(config, settings=None):
         settings = config['settings']
     spec = create_specification(config['specification'], settings)
 
-    # populate sets and parameters using DataPortal and temp files
-    json_list = config_to_json(config)
-    concrete_model = spec.populate(json_list)
+    # a model built before from the same configuration and database is loaded from the model cache
+    cache_file = get_model_cache_file(config, settings)
+    concrete_model = read_model(cache_file)
+    if concrete_model is None:
+        # populate sets and parameters from the configuration using DataPortal and the configured database if there
+        # is one
+        data_list = config_to_data(config)
+        if config.get('db_file') is not None:
+            concrete_model = spec.populate(data_list, db_file=str(config['db_file']))
+        else:
+            concrete_model = spec.populate(data_list)
+        save_model(cache_file, concrete_model)
+
+    # keep the configuration the model was built from for update_instance
+    concrete_model._mola_config = copy.deepcopy({**config, 'settings': settings})
+
+    if mu.Package.config('show.footprint'):
+        print(mo.get_footprint_frame(concrete_model).to_string())
 
     return concrete_model
 
 
+def get_model_cache_file(config, settings):
+    """
+    Get the file of the cached model of a configuration. Models are cached in the models folder of the cache.folder
+    config or the query cache folder of the database, under a key from a hash of the configuration data used by
+    populate, the specification settings, the build.mutable_parameters config and the fingerprints of the database
+    file and of the modules that build the model, so a changed configuration, database or build code misses the cache.
+
+    Cached models are unpickled, so models are only cached if the cache.models config is set and the cache folder
+    must only be writable by the user.
+
+    :param config: dict of configuration data
+    :param settings: dict of specification settings
+    :return: full path to cached model or None if models are not cached, see the cache.models config, or the
+        database read by populate does not exist
+    """
+    spec_class = get_specification_class(config['specification'])
+    db_file = config.get('db_file')
+    if db_file is None:
+        # populate reads the default database of the specification if the configuration has none
+        db_file = inspect.signature(spec_class.populate).parameters.get('db_file')
+        db_file = None if db_file is None or db_file.default is inspect.Parameter.empty else db_file.default
+    folder = mu.Package.config('cache.folder') or (dv.get_query_cache_folder(db_file) if db_file else None)
+    if not mu.Package.config('cache.models') or folder is None or (db_file and not os.path.exists(db_file)):
+        return None
+
+    spec_module = sys.modules[spec_class.__module__]
+    key = {k: config.get(k) for k in ['specification', 'sets', 'indexed_sets', 'parameters']}
+    key.update({
+        'settings': settings,
+        'build.mutable_parameters': mu.Package.config('build.mutable_parameters'),
+        'modules': [di.get_file_fingerprint(m.__file__) for m in [sys.modules[__name__], dv, sq, spec_module]],
+        'pyomo': pyomo.version.version,
+        'db_file': str(db_file) if db_file else None,
+        'db': di.get_file_fingerprint(db_file) if db_file else None
+    })
+    h = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode('utf-8'))
+
+    return os.path.join(folder, 'models', h.hexdigest() + '.pkl')
+
+
+class ModelPickler(pickle.Pickler):
+    """
+    Pickler of built models that leaves out the rules of their components, which are local functions of the mola
+    specification modules or of pyomo only needed to construct the model. Local functions of other modules, such as
+    a rule added to a built model by a user, cannot be pickled so the model is not cached.
+    """
+
+    def persistent_id(self, obj):
+        if isinstance(obj, types.FunctionType) and '<locals>' in obj.__qualname__ and \
+                obj.__module__.startswith(('mola.specification', 'pyomo.')):
+            return 'rule'
+        return None
+
+
+class ModelUnpickler(pickle.Unpickler):
+    """
+    Unpickler of models pickled by ModelPickler, the component rules of which are None.
+    """
+
+    def persistent_load(self, pid):
+        return None
+
+
+def read_model(file_name):
+    """
+    :param str file_name: full path to cached model or None
+    :return: cached concreteModel or None if not cached
+    """
+    if file_name is None or not os.path.exists(file_name):
+        return None
+    os.utime(file_name)
+    try:
+        with open(file_name, 'rb') as fp:
+            return ModelUnpickler(fp).load()
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        print('Cached model not read:', e)
+        return None
+
+
+def save_model(file_name, model_instance):
+    """
+    Save a concrete model to the model cache then evict the least recently used models.
+
+    :param str file_name: full path to cached model or None if models are not cached
+    :param model_instance: concreteModel
+    """
+    if file_name is None:
+        return
+    folder = os.path.dirname(file_name)
+    tmp_file_name = file_name + '.%d.tmp' % os.getpid()
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(tmp_file_name, 'wb') as fp:
+            ModelPickler(fp, pickle.HIGHEST_PROTOCOL).dump(model_instance)
+        os.replace(tmp_file_name, file_name)
+        dv.evict_cache_files(folder, mu.Package.config('cache.max_bytes'))
+    except (OSError, pickle.PicklingError, AttributeError, TypeError, RecursionError) as e:
+        print('Model not cached:', e)
+        if os.path.exists(tmp_file_name):
+            os.remove(tmp_file_name)
+
+
+def update_instance(model_instance, config, settings=None):
+    """
+    Update a concrete model built by build_instance in place with the parameter values of a configuration, so that
+    it can be re-solved after parameters are edited without being rebuilt. The model is rebuilt with build_instance
+    if the specification, database, settings or sets have changed, or a changed parameter is not mutable, see the
+    build.mutable_parameters package setting.
+
+    :param model_instance: concrete model built by build_instance
+    :param config: dict of configuration data
+    :param settings: dict of specification settings
+    :return: concreteModel, which is model_instance if it was updated in place
+    """
+    if settings is None and 'settings' in config:
+        settings = config['settings']
+    built = getattr(model_instance, '_mola_config', None)
+    if built is None or built['settings'] != settings or \
+            any(built.get(k) != config.get(k) for k in ['specification', 'db_file', 'sets', 'indexed_sets']):
+        return build_instance(config, settings)
+
+    # only parameters that are mutable and do not define the model structure can be updated in place
+    structural = getattr(get_specification_class(config['specification']), 'structural_parameters', [])
+    changed = [p for p in set(config['parameters']) | set(built['parameters'])
+               if config['parameters'].get(p) != built['parameters'].get(p)]
+    for p in changed:
+        cpt = model_instance.component(p)
+        if p not in config['parameters'] or not isinstance(cpt, pe.Param) or not cpt.mutable or p in structural:
+            return build_instance(config, settings)
+
+    for p in changed:
+        set_parameter(model_instance.component(p), config['parameters'][p])
+    model_instance._mola_config = copy.deepcopy({**config, 'settings': settings})
+
+    return model_instance
+
+
+def set_parameter(param, value):
+    """
+    Set the values of a mutable parameter of a concrete model to those of a configuration parameter, changing only
+    the indices whose value differs.
+
+    :param param: mutable pyomo Param of a concrete model
+    :param list | dict value: list of index-value dicts or sparse parameter
+    """
+    if is_sparse_parameter(value):
+        default = value['default']
+        param.set_default(default)
+    else:
+        default = param.default()
+    values = {tuple(el['index']) if len(el['index']) > 1 else el['index'][0]: el['value']
+              for el in get_parameter_elements(value)}
+    for index in param.index_set():
+        new_value = values.get(index, default)
+        if new_value is not pe.Param.NoValue and pe.value(param[index]) != new_value:
+            param[index] = new_value
+
+
 def create_specification(spec_class, settings=None):
     """
     Create a Specification object and update its configuration settings from
@@ -107,12 +440,7 @@ def create_specification(spec_class, settings=None):
     :param settings: dict of specification settings
     :return: Specification object
     """
-    search = re.search("<class '(.*?)\.(.*?)\.(.*?)'>", spec_class)
-    module_name = search.group(1) + '.' + search.group(2)
-    class_name = search.group(3)
-    module = importlib.import_module(module_name)
-    class_ = getattr(module, class_name)
-    spec = class_()
+    spec = get_specification_class(spec_class)()
 
     # update specification settings from stored configuration
     if settings is not None:
@@ -122,6 +450,22 @@ def create_specification(spec_class, settings=None):
     return spec
 
 
+@functools.lru_cache(maxsize=None)
+def get_specification_class(spec_class):
+    """
+    Get a Specification class from its name in a configuration, which is resolved once and then cached.
+
+    :param spec_class: name of class
+    :return: Specification class
+    """
+    search = re.search("<class '(.*?)\.(.*?)\.(.*?)'>", spec_class)
+    module_name = search.group(1) + '.' + search.group(2)
+    class_name = search.group(3)
+    module = importlib.import_module(module_name)
+
+    return getattr(module, class_name)
+
+
 def build_parameters(sets, parameters, spec, index_value=False, indexed_sets=dict()):
     """
     Build a dictionary of DataFrames of default parameters from sets using existing parameter values.
@@ -129,33 +473,35 @@ def build_parameters(sets, parameters, spec, index_value=False, indexed_sets=dic
     :param dict sets: sets for optimisation
     :param dict parameters: parameters
     :param Specification spec: Specification object
-    :param boolean index_value: return output in index-value form
+    :param boolean index_value: return output in index-value form, which is the sparse format for the parameters
+        with sparse defaults
     :param dict indexed_sets: indexed sets for optimisation
     :return: dict of DataFrames or dict of index-value dicts
     """
     par = {}
     default_parameters = spec.get_default_parameters(sets, user_indexed_sets=indexed_sets)
-    for p, element_list in default_parameters.items():
+    for p, default in default_parameters.items():
         print(p + ': ' + spec.user_defined_parameters[p]['doc'])
         if 'index' in spec.user_defined_parameters[p]:
-            row_list = []
-            for el in element_list:
-                v = el['value']
-                # update if parameter was already defined
-                if p in parameters:
-                    for item in parameters[p]:
-                        if item['index'] == el['index']:
-                            v = item['value']
-                new_row = pd.DataFrame({'Index': [el['index']], 'Value': v}, index=[0])
-                row_list.append(new_row)
+            # a sparse parameter keeps its own default value
+            if is_sparse_parameter(parameters.get(p)):
+                default = default_parameters[p] = {'default': parameters[p]['default'], 'values': []}
+            index_sets = [sets[s] for s in spec.user_defined_parameters[p]['index']] \
+                if is_sparse_parameter(default) else None
+
+            # update if parameter was already defined
+            values = {tuple(item['index']): item['value'] for item in get_parameter_elements(parameters.get(p, []))}
+            row_list = [[el['index'], values.get(tuple(el['index']), el['value'])]
+                        for el in get_parameter_elements(default, index_sets)]
             if len(row_list) > 0:
-                par[p] = pd.concat(row_list, ignore_index=True)
+                par[p] = pd.DataFrame(row_list, columns=['Index', 'Value'])
             else:
                 par[p] = pd.DataFrame({'Index': [], 'Value': []})
         else:
             par[p] = pd.DataFrame([parameters[p]], columns=['Value'])
     if index_value:
-        par = mu.get_index_value(par)
+        par = get_index_value_parameters(par, {p: v['default'] for p, v in default_parameters.items()
+                                               if is_sparse_parameter(v)})
 
     return par
 
@@ -197,13 +543,15 @@ def build_indexed_sets(sets, indexed_sets, spec):
     return ind_sets
 
 
-def map_units(unit=None):
+@functools.lru_cache(maxsize=None)
+def get_unit_map():
     """
-    A dictionary that maps openLCA database units for product flows to pyomo units.
+    A dictionary that maps openLCA database units for product flows to pyomo units, created once as the pint unit
+    objects are expensive to build.
 
-    :return: dict or pyomo unit object
+    :return: dict of pyomo unit objects keyed by openLCA unit
     """
-    d = {
+    return {
         'h': pu.hour,
         'ha': pu.ha,
         'kg': pu.kg,
@@ -229,10 +577,44 @@ def map_units(unit=None):
         'm*a': pu.m*pu.year,
     }
 
+
+def map_units(unit=None):
+    """
+    A dictionary that maps openLCA database units for product flows to pyomo units.
+
+    :return: dict or pyomo unit object
+    """
+    d = get_unit_map()
+
     if unit is None:
-        return d
+        return dict(d)
     else:
         return d[unit]
 
 
+@functools.lru_cache(maxsize=None)
+def get_transport_unit_conversion(material_unit, transport_unit):
+    """
+    Conversion factor from a material flow unit moved one km to a transport flow unit, memoised across builds.
+
+    :param str material_unit: openLCA unit of the material flow
+    :param str transport_unit: openLCA unit of the transport flow
+    :return: float conversion factor
+    """
+    return pu.convert_value(1, from_units=map_units(material_unit) * pu.km, to_units=map_units(transport_unit))
+
+
+def get_unit_conversion_table(links, units):
+    """
+    Table of conversion factors from material flow units times km to transport flow units for the links between
+    material and transport flows in a model, so that constraint rules only need a lookup.
+
+    :param links: iterable of (fm, pm, ft, pt) tuples
+    :param dict units: openLCA units keyed by (f, p), with an empty string for a missing unit
+    :return: dict of conversion factors keyed by (fm, pm, ft, pt)
+    """
+    return {(fm, pm, ft, pt): get_transport_unit_conversion(units.get((fm, pm), ''), units.get((ft, pt), ''))
+            for fm, pm, ft, pt in links}
+
+
 
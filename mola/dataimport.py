@@ -12,6 +12,14 @@ import os
 import gc
 import time
 import platform
+import collections
+import itertools
+import collections.abc
+import re
+import shutil
+import tempfile
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 def get_default_db_file():
@@ -102,7 +110,8 @@ def derby_to_csv(db_conn, db_folder, separate_lob=False):
     return Path(csv_path)
 
 
-def csv_to_sqlite(csv_folder, db_file, table_cols, method=None, chunk_size=1000000):
+def csv_to_sqlite(csv_folder, db_file, table_cols, method=None, chunk_size=1000000, processes=None,
+                  bulk_load=False, table_types=None, resume=False, incremental=False):
     """
     Get openLCA CSV data in a folder and convert to a sqlite database.
 
@@ -111,9 +120,25 @@ def csv_to_sqlite(csv_folder, db_file, table_cols, method=None, chunk_size=10000
     :param table_cols dictionary of table column names
     :param method argument passed to DataFrame.to_sql
     :param chunk_size: chunk size for pandas
+    :param processes: number of worker processes for a parallel import or None for a serial import
+    :param bulk_load: write with journaling and fsync off, one transaction per table and build the
+        indices in create_csv_indices after all the rows are in
+    :param table_types: dictionary of (column name, Derby type) lists from get_derby_table_column_types
+        used to create typed tables and read the CSVs with explicit dtypes instead of table_cols
+    :param resume: keep an existing db and continue from the table and chunk checkpoints in MOLA_IMPORT
+    :param incremental: keep an existing db and write only the rows whose content hash has changed since the
+        last import, see csv_table_to_sqlite_incremental. Resumable and incremental imports are serial.
     :return: Path of sqlite db
     """
 
+    if resume or incremental:
+        return csv_to_sqlite_incremental(csv_folder, db_file, table_cols, chunk_size=chunk_size,
+                                         table_types=table_types, incremental=incremental)
+
+    if processes is not None:
+        return csv_to_sqlite_parallel(csv_folder, db_file, table_cols, method=method, chunk_size=chunk_size,
+                                      processes=processes, bulk_load=bulk_load, table_types=table_types)
+
     # get all the CSVs in folder
     csv_name = [f for f in os.listdir(str(csv_folder)) if f.endswith('.csv')]
 
@@ -121,6 +146,8 @@ def csv_to_sqlite(csv_folder, db_file, table_cols, method=None, chunk_size=10000
     if os.path.exists(str(db_file)):
         os.remove(str(db_file))
     sqlite_conn = get_sqlite_connection(str(db_file))
+    if bulk_load:
+        begin_bulk_load(sqlite_conn)
 
     # write each CSV file to sqlite db
     for tbl in csv_name:
@@ -129,22 +156,304 @@ def csv_to_sqlite(csv_folder, db_file, table_cols, method=None, chunk_size=10000
         if os.path.getsize(csv_file) > 0:
             print("Importing file", tbl)
             tbl_name = os.path.splitext(tbl)[0]
-            chunk_num = 0
-            for chunk in pd.read_csv(csv_file, chunksize=chunk_size, header=None, index_col=None, low_memory=False):
-                chunk.columns = table_cols[tbl_name]
-                chunk.to_sql(tbl_name, sqlite_conn, if_exists='append', index=False, method=method)
-                print('Exported chunk', chunk_num)
-                chunk_num += 1
-                del chunk
-                gc.collect()
+            csv_table_to_sqlite(csv_file, tbl_name, table_cols[tbl_name] if table_cols else None, sqlite_conn,
+                                method=method, chunk_size=chunk_size, bulk_load=bulk_load,
+                                column_types=table_types[tbl_name] if table_types else None)
+
+    if bulk_load:
+        create_csv_indices(sqlite_conn)
+        end_bulk_load(sqlite_conn)
+    sqlite_conn.close()
+
+    return db_file
+
+
+def csv_table_to_sqlite(csv_file, tbl_name, cols, sqlite_conn, method=None, chunk_size=1000000, verbose=True,
+                        bulk_load=False, column_types=None):
+    """
+    Append the content of a headerless CSV file exported from Derby to a table in a sqlite database.
+
+    :param csv_file: full path to CSV file
+    :param tbl_name: name of table in sqlite database
+    :param cols: list of column names
+    :param sqlite_conn: sqlite database connection
+    :param method: argument passed to DataFrame.to_sql
+    :param chunk_size: chunk size for pandas
+    :param verbose: print a message for each chunk
+    :param bulk_load: write all the chunks in one transaction using insert_dataframe
+    :param column_types: list of (column name, Derby type) to create a typed table and read with explicit dtypes
+    :return: number of chunks written
+    """
+    read_args = {}
+    if column_types is not None:
+        cols = [col for col, col_type in column_types]
+        read_args = {'names': cols, 'dtype': get_pandas_dtypes(column_types)}
+        create_typed_table(sqlite_conn, tbl_name, column_types)
+
+    chunk_num = 0
+    if bulk_load:
+        sqlite_conn.execute('BEGIN')
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, header=None, index_col=None, low_memory=False,
+                             **read_args):
+        chunk.columns = cols
+        if bulk_load:
+            insert_dataframe(sqlite_conn, tbl_name, chunk)
+        else:
+            chunk.to_sql(tbl_name, sqlite_conn, if_exists='append', index=False, method=method)
+        if verbose:
+            print('Exported chunk', chunk_num)
+        chunk_num += 1
+        del chunk
+        gc.collect()
+    if bulk_load:
+        sqlite_conn.commit()
+
+    return chunk_num
+
+
+def csv_to_sqlite_incremental(csv_folder, db_file, table_cols, chunk_size=1000000, table_types=None,
+                              incremental=True):
+    """
+    Import openLCA CSV data into an existing or new sqlite database with a checkpoint per table and chunk
+    in the MOLA_IMPORT table, so that an interrupted import continues where it stopped. A table whose CSV
+    file is unchanged since its last complete import is skipped.
+
+    :param csv_folder: folder containing CSV files for each table
+    :param db_file: full path to sqlite db
+    :param table_cols: dictionary of table column names
+    :param chunk_size: chunk size for pandas
+    :param table_types: dictionary of (column name, Derby type) lists, see csv_to_sqlite
+    :param incremental: write only inserted, changed and deleted rows using row content hashes, otherwise
+        a table is emptied and imported again when its CSV file changes
+    :return: Path of sqlite db
+    """
+
+    # get all the CSVs in folder
+    csv_name = [f for f in os.listdir(str(csv_folder)) if f.endswith('.csv')]
+
+    sqlite_conn = get_sqlite_connection(str(db_file))
+    sqlite_conn.execute('CREATE TABLE IF NOT EXISTS MOLA_IMPORT (TABLE_NAME TEXT PRIMARY KEY, SOURCE TEXT, '
+                        'RUN INTEGER, CHUNKS INTEGER, COMPLETE INTEGER)')
+    sqlite_conn.commit()
+
+    for tbl in csv_name:
+        csv_file = str(csv_folder) + '/' + tbl
+        if os.path.getsize(csv_file) > 0:
+            tbl_name = os.path.splitext(tbl)[0]
+            csv_table_to_sqlite_incremental(csv_file, tbl_name, table_cols[tbl_name] if table_cols else None,
+                                            sqlite_conn, chunk_size=chunk_size, incremental=incremental,
+                                            column_types=table_types[tbl_name] if table_types else None)
+
+    create_csv_indices(sqlite_conn)
+    sqlite_conn.close()
+
+    return db_file
+
+
+def get_row_hashes(dfr):
+    """
+    Hash the content of each row of a DataFrame.
+
+    :param pd.DataFrame dfr: rows
+    :return: list of signed 64-bit hashes that fit in a sqlite INTEGER
+    """
+    return pd.util.hash_pandas_object(dfr.astype(str), index=False).values.view('int64').tolist()
+
+
+def csv_table_to_sqlite_incremental(csv_file, tbl_name, cols, sqlite_conn, chunk_size=1000000, incremental=True,
+                                    column_types=None):
+    """
+    Import a headerless CSV file exported from Derby into a sqlite table, committing a checkpoint in
+    MOLA_IMPORT with each chunk.
+
+    In incremental mode the content hash of each row is kept in MOLA_HASH_<tbl_name> keyed by ID along with the
+    import run that last saw the row. Only rows with a new or different hash are deleted and inserted, and rows
+    not seen by the current run are deleted at the end of the table. Tables without an ID column are emptied
+    and imported again.
+
+    :param csv_file: full path to CSV file
+    :param tbl_name: name of table in sqlite database
+    :param cols: list of column names
+    :param sqlite_conn: sqlite database connection with a MOLA_IMPORT table
+    :param chunk_size: chunk size for pandas
+    :param incremental: write only changed rows
+    :param column_types: list of (column name, Derby type), see csv_table_to_sqlite
+    :return: tuple of number of rows inserted or changed and number of rows deleted
+    """
+    read_args = {}
+    if column_types is not None:
+        cols = [col for col, col_type in column_types]
+        read_args = {'names': cols, 'dtype': get_pandas_dtypes(column_types)}
+        create_typed_table(sqlite_conn, tbl_name, column_types)
+    incremental = incremental and 'ID' in cols
+    hash_tbl = 'MOLA_HASH_' + tbl_name
+
+    # the source signature identifies the version of the CSV file
+    source = get_file_fingerprint(csv_file)
+    checkpoint = sqlite_conn.execute('SELECT SOURCE, RUN, CHUNKS, COMPLETE FROM MOLA_IMPORT WHERE TABLE_NAME = ?',
+                                     (tbl_name,)).fetchone()
+    if checkpoint is not None and checkpoint[0] == source:
+        if checkpoint[3]:
+            print("Table", tbl_name, "is up to date")
+            return 0, 0
+        run, chunks_done = checkpoint[1], checkpoint[2]
+        print("Resuming table", tbl_name, "after chunk", chunks_done)
+    else:
+        run, chunks_done = (checkpoint[1] + 1 if checkpoint is not None else 1), 0
+        print("Importing table", tbl_name)
+        if not incremental and sqlite_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND "
+                                                   "name = ?", (tbl_name,)).fetchone() is not None:
+            sqlite_conn.execute('DELETE FROM "%s"' % tbl_name)
+        sqlite_conn.execute('INSERT OR REPLACE INTO MOLA_IMPORT VALUES (?, ?, ?, 0, 0)', (tbl_name, source, run))
+        sqlite_conn.commit()
+    if incremental:
+        sqlite_conn.execute('CREATE TABLE IF NOT EXISTS "%s" (ID PRIMARY KEY, HASH INTEGER, RUN INTEGER)' % hash_tbl)
+        sqlite_conn.execute('CREATE TEMP TABLE IF NOT EXISTS MOLA_CHUNK_HASH (ID PRIMARY KEY, HASH INTEGER)')
+        # rows from an import without hashes, e.g. by csv_to_sqlite, are replaced or deleted like changed rows
+        if sqlite_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                               (tbl_name,)).fetchone() is not None:
+            sqlite_conn.execute('INSERT OR IGNORE INTO "%s" SELECT ID, NULL, 0 FROM "%s"' % (hash_tbl, tbl_name))
+
+    n_changed = 0
+    chunk_num = 0
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, header=None, index_col=None, low_memory=False,
+                             **read_args):
+        if chunk_num < chunks_done:
+            chunk_num += 1
+            continue
+        chunk.columns = cols
+
+        if incremental:
+            sqlite_conn.execute('DELETE FROM temp.MOLA_CHUNK_HASH')
+            sqlite_conn.executemany('INSERT INTO temp.MOLA_CHUNK_HASH VALUES (?, ?)',
+                                    zip(chunk['ID'].tolist(), get_row_hashes(chunk)))
+            changed_sql = 'SELECT c.ID FROM temp.MOLA_CHUNK_HASH c LEFT JOIN "%s" h ON c.ID = h.ID ' \
+                          'WHERE h.HASH IS NULL OR h.HASH != c.HASH' % hash_tbl
+            changed = [r[0] for r in sqlite_conn.execute(changed_sql)]
+            if len(changed) > 0:
+                chunk = chunk[chunk['ID'].isin(changed)]
+                sqlite_conn.execute('DELETE FROM "%s" WHERE ID IN (%s)' % (tbl_name, changed_sql))
+                insert_dataframe(sqlite_conn, tbl_name, chunk)
+            sqlite_conn.execute('INSERT OR REPLACE INTO "%s" SELECT ID, HASH, ? FROM temp.MOLA_CHUNK_HASH' % hash_tbl,
+                                (run,))
+            n_changed += len(changed)
+        else:
+            insert_dataframe(sqlite_conn, tbl_name, chunk)
+            n_changed += len(chunk)
+
+        chunk_num += 1
+        sqlite_conn.execute('UPDATE MOLA_IMPORT SET CHUNKS = ? WHERE TABLE_NAME = ?', (chunk_num, tbl_name))
+        sqlite_conn.commit()
+        print('Imported chunk', chunk_num - 1)
+        del chunk
+        gc.collect()
+
+    # rows not seen in this run have been deleted from the source
+    n_deleted = 0
+    if incremental:
+        sqlite_conn.execute('DELETE FROM "%s" WHERE ID IN (SELECT ID FROM "%s" WHERE RUN != ?)' % (tbl_name, hash_tbl),
+                            (run,))
+        n_deleted = sqlite_conn.execute('DELETE FROM "%s" WHERE RUN != ?' % hash_tbl, (run,)).rowcount
+    sqlite_conn.execute('UPDATE MOLA_IMPORT SET COMPLETE = 1 WHERE TABLE_NAME = ?', (tbl_name,))
+    sqlite_conn.commit()
+    print("Table", tbl_name, ":", n_changed, "rows inserted or changed,", n_deleted, "rows deleted")
+
+    return n_changed, n_deleted
+
+
+def _csv_table_to_staging(csv_file, staging_file, tbl_name, cols, method, chunk_size, bulk_load, column_types):
+    """ Process pool worker: import one CSV file into its own staging sqlite database """
+    conn = get_sqlite_connection(staging_file)
+    if bulk_load:
+        begin_bulk_load(conn)
+    try:
+        chunk_num = csv_table_to_sqlite(csv_file, tbl_name, cols, conn, method=method, chunk_size=chunk_size,
+                                        verbose=False, bulk_load=bulk_load, column_types=column_types)
+        conn.commit()
+    finally:
+        conn.close()
+
+    return tbl_name, chunk_num
+
+
+def csv_to_sqlite_parallel(csv_folder, db_file, table_cols, method=None, chunk_size=1000000, processes=None,
+                           bulk_load=False, table_types=None):
+    """
+    Get openLCA CSV data in a folder and convert to a sqlite database using a pool of processes.
+
+    Each table is parsed and written to its own staging sqlite database by a worker process. The staging
+    databases are then merged into db_file with ATTACH and INSERT in the same table order as the serial
+    import in csv_to_sqlite so that the output is identical.
+
+    :param csv_folder: folder containing CSV files for each table
+    :param db_file: full path to sqlite db
+    :param table_cols: dictionary of table column names
+    :param method: argument passed to DataFrame.to_sql
+    :param chunk_size: chunk size for pandas
+    :param processes: number of worker processes, None uses the number of processors on the machine
+    :param bulk_load: stage and merge the tables in bulk-load mode, see csv_to_sqlite
+    :param table_types: dictionary of (column name, Derby type) lists, see csv_to_sqlite
+    :return: Path of sqlite db
+    """
+
+    # get all the non-empty CSVs in folder in the serial import order
+    csv_name = [f for f in os.listdir(str(csv_folder)) if f.endswith('.csv')]
+    csv_file = {os.path.splitext(f)[0]: str(csv_folder) + '/' + f for f in csv_name}
+    tbl_names = [t for t, f in csv_file.items() if os.path.getsize(f) > 0]
+
+    # connect to sqlite database
+    if os.path.exists(str(db_file)):
+        os.remove(str(db_file))
+    sqlite_conn = get_sqlite_connection(str(db_file))
+    if bulk_load:
+        begin_bulk_load(sqlite_conn)
+
+    # stage each table in a separate db in the same folder as the output db, largest tables first
+    staging_dir = tempfile.mkdtemp(prefix='staging_', dir=os.path.dirname(os.path.abspath(str(db_file))))
+    staging_file = {t: os.path.join(staging_dir, t + '.sqlite') for t in tbl_names}
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(_csv_table_to_staging, csv_file[t], staging_file[t], t,
+                                table_cols[t] if table_cols else None, method, chunk_size, bulk_load,
+                                table_types[t] if table_types else None)
+                for t in sorted(tbl_names, key=lambda t: os.path.getsize(csv_file[t]), reverse=True)
+            ]
+            for table_num, future in enumerate(as_completed(futures), start=1):
+                tbl_name, chunk_num = future.result()
+                print("Imported table {0} in {1} chunks [{2}/{3}]".format(tbl_name, chunk_num,
+                                                                        table_num, len(tbl_names)))
+
+        # merge the staging databases
+        c = sqlite_conn.cursor()
+        for tbl_name in tbl_names:
+            print("Merging table", tbl_name)
+            c.execute("ATTACH DATABASE ? AS staging", (staging_file[tbl_name],))
+            c.execute("SELECT sql FROM staging.sqlite_master WHERE type='table' AND name=?", (tbl_name,))
+            row = c.fetchone()
+            if row is not None:
+                c.execute(row[0])
+                c.execute('INSERT INTO main."%s" SELECT * FROM staging."%s"' % (tbl_name, tbl_name))
+            sqlite_conn.commit()
+            c.execute("DETACH DATABASE staging")
+
+        if bulk_load:
+            create_csv_indices(sqlite_conn)
+            end_bulk_load(sqlite_conn)
+    finally:
+        sqlite_conn.close()
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
     return db_file
 
 
 def derby_to_sqlite(db, derby_input_folder, csv_output_folder, sqlite_output_folder,
-                    derby_driver_path='C:/share/db-derby-10.15.1.3-bin/lib/derby.jar', version=None):
+                    derby_driver_path='C:/share/db-derby-10.15.1.3-bin/lib/derby.jar', version=None, bulk_load=False,
+                    resume=False, incremental=False):
     """
     Bulk export from derby to CSV and then use pandas to write the CSVs to a sqlite database
+    :param resume: continue an interrupted import into sqlite_file, see csv_to_sqlite
+    :param incremental: update sqlite_file with only the changed rows, see csv_to_sqlite
     :return: full path to sqlite database
     """
 
@@ -156,12 +465,13 @@ def derby_to_sqlite(db, derby_input_folder, csv_output_folder, sqlite_output_fol
     # convert Derby database to CSV
     conn = get_jdbc_connection(derby_input_folder + '/' + db, derby_driver_path)
     table_names = get_derby_tables(conn)
-    table_cols = get_derby_table_column_names(conn, table_names)
+    table_types = get_derby_table_column_types(conn, table_names)
     csv_folder = derby_to_csv(conn, db_folder, separate_lob=True)
     conn.close()
 
     # generate sqlite db
-    output_db = csv_to_sqlite(csv_folder, sqlite_file, table_cols, chunk_size=1000000)
+    output_db = csv_to_sqlite(csv_folder, sqlite_file, None, chunk_size=1000000, bulk_load=bulk_load,
+                              table_types=table_types, resume=resume, incremental=incremental)
 
     return output_db
 
@@ -239,6 +549,79 @@ def get_derby_table_column_names(db_conn, table_name):
     return x
 
 
+# pandas dtype and sqlite column affinity for each Derby column type
+derby_type_map = {
+    'BIGINT': ('Int64', 'INTEGER'),
+    'INTEGER': ('Int64', 'INTEGER'),
+    'SMALLINT': ('Int64', 'INTEGER'),
+    'BOOLEAN': ('boolean', 'INTEGER'),
+    'DOUBLE': ('float64', 'REAL'),
+    'FLOAT': ('float64', 'REAL'),
+    'REAL': ('float64', 'REAL'),
+    'DECIMAL': ('float64', 'REAL'),
+    'NUMERIC': ('float64', 'REAL'),
+}
+
+
+def get_derby_table_column_types(db_conn, table_name):
+    """
+    Get a dictionary of table column names and Derby column types from sys.syscolumns in column order
+
+    :param db_conn: JDBC database connection
+    :param table_name: list of table names
+    :return: dictionary of lists of (column name, Derby type) keyed by table name
+    """
+
+    # construct query string
+    tbl_str = ','.join("'{0}'".format(t) for t in table_name if len(t) > 0)
+    curs = db_conn.cursor()
+    ex_str = """
+    SELECT TABLENAME, COLUMNNAME, COLUMNDATATYPE
+    FROM sys.systables t, sys.syscolumns
+    WHERE TABLEID = REFERENCEID and tablename IN (%s)
+    ORDER BY TABLENAME, COLUMNNUMBER
+    """ % tbl_str
+    curs.execute(ex_str)
+
+    # the type descriptor is a java object whose string starts with the type name e.g. BIGINT NOT NULL
+    x = {}
+    for tbl, col, col_type in curs.fetchall():
+        type_name = re.match(r'\s*([A-Z]+)', str(col_type).upper())
+        x.setdefault(tbl, []).append((col, type_name.group(1) if type_name else 'VARCHAR'))
+
+    return x
+
+
+def get_pandas_dtypes(column_types):
+    """
+    Map Derby column types to explicit pandas dtypes for reading CSV exports.
+
+    :param list column_types: list of (column name, Derby type)
+    :return: dict of pandas dtypes keyed by column name
+    """
+    return {col: derby_type_map.get(col_type, ('object', 'TEXT'))[0] for col, col_type in column_types}
+
+
+def create_typed_table(sqlite_conn, tbl_name, column_types):
+    """
+    Create a sqlite table with column affinities mapped from Derby column types. An integer ID column
+    becomes the INTEGER PRIMARY KEY so that joins on the openLCA ids can use the rowid without casts.
+
+    :param sqlite3.Connection sqlite_conn: database connection
+    :param str tbl_name: name of table
+    :param list column_types: list of (column name, Derby type)
+    :return: None
+    """
+    col_defs = []
+    for col, col_type in column_types:
+        affinity = derby_type_map.get(col_type, ('object', 'TEXT'))[1]
+        if col == 'ID' and affinity == 'INTEGER':
+            affinity = 'INTEGER PRIMARY KEY'
+        col_defs.append('"%s" %s' % (col, affinity))
+    sqlite_conn.execute('CREATE TABLE IF NOT EXISTS "%s" (%s)' % (tbl_name, ', '.join(col_defs)))
+    sqlite_conn.commit()
+
+
 def get_derby_tables(db_conn):
     """
     Get table names from a Derby database.
@@ -300,7 +683,8 @@ LCA_cols_to_select = {
 }
 
 
-def derby_to_sqlite(db_conn, db_file, table_name=LCA_table, select_cols=LCA_cols_to_select, chunk_size=10000):
+def derby_to_sqlite(db_conn, db_file, table_name=LCA_table, select_cols=LCA_cols_to_select, chunk_size=10000,
+                    bulk_load=False):
     """ Get openLCA data from an uncompressed Derby directory and convert to a sqlite database.
 
         Can only load a character description with small tables because of memory issues with jpype.
@@ -311,6 +695,8 @@ def derby_to_sqlite(db_conn, db_file, table_name=LCA_table, select_cols=LCA_cols
     :param db_file: file name for sqlite db
     :param table_name: list of [scheme, table]
     :param chunk_size: chunk size for pandas
+    :param bulk_load: write with journaling and fsync off, one transaction per table and
+        build the DataFrame index after all the rows are in
     :return: file path of sqlite db
     """
 
@@ -322,11 +708,15 @@ def derby_to_sqlite(db_conn, db_file, table_name=LCA_table, select_cols=LCA_cols
     if os.path.exists(db_file):
         os.remove(db_file)
     sqlite_conn = get_sqlite_connection(db_file)
+    if bulk_load:
+        begin_bulk_load(sqlite_conn)
 
     # write each Derby table to sqlite db
     for tbl in table_name:
 
         print("Importing table", tbl)
+        if bulk_load:
+            sqlite_conn.execute('BEGIN')
 
         # get the table content
         chunk_num = 0
@@ -341,41 +731,123 @@ def derby_to_sqlite(db_conn, db_file, table_name=LCA_table, select_cols=LCA_cols
                 if i[1] == np.dtype('object'):
                     chunk[i[0]] = chunk[i[0]].astype(str)
 
-            chunk.to_sql(tbl, sqlite_conn, if_exists='append')
+            if bulk_load:
+                insert_dataframe(sqlite_conn, tbl, chunk, index=True)
+            else:
+                chunk.to_sql(tbl, sqlite_conn, if_exists='append')
             print('Exported chunk', chunk_num)
             chunk_num += 1
             del chunk
             gc.collect()
 
+        if bulk_load:
+            sqlite_conn.commit()
+            create_dataframe_index(sqlite_conn, tbl)
+
+    if bulk_load:
+        end_bulk_load(sqlite_conn)
+    sqlite_conn.close()
+
     return db_file
 
 
-def get_json_zip(zip_filename):
+def get_json_zip(zip_filename, max_bytes=256 * 2 ** 20):
     """ Get json files in a JSON-LD zip file
     :param zip_filename:
-    :return: dictionary of json files
+    :param max_bytes: memory budget of the parsed entity cache, see JsonZip
+    :return: lazy dictionary of json files keyed by zip member name
     """
+    json_zip = JsonZip(zip_filename, max_bytes=max_bytes)
+    print("Indexed", len(json_zip), "json files in", zip_filename)
 
-    # get the file names in the zip
-    zip_file = zipfile.ZipFile(zip_filename, 'r')
-    name_list = zip_file.namelist()
-
-    # build dictionary
-    print("Loading", len(name_list), "json files in", zip_filename)
-    json_dict = {}
-    for name in name_list:
-        raw = zip_file.read(name)
-        if len(raw) > 0:
-            json_dict[name] = json.loads(raw)
+    return json_zip
 
-    return json_dict
 
+class JsonZip(collections.abc.Mapping):
+    """
+    Read-only dictionary of the json files in a JSON-LD zip file keyed by zip member name.
+    Only the zip directory is read on open, with an index of entity type and @id to zip member taken from
+    the member paths e.g. processes/<@id>.json. A file is parsed when it is accessed and kept in an LRU cache.
+    The cache budget is measured in uncompressed json bytes, the python objects are a few times larger.
+    """
 
-def json_to_custom(zip_filename, db_file_base, limit=None):
+    def __init__(self, zip_filename, max_bytes=256 * 2 ** 20):
+        self.zip_file = zipfile.ZipFile(zip_filename, 'r')
+        self.max_bytes = max_bytes
+        self.cache_bytes = 0
+        self.cache = collections.OrderedDict()
+        self.info = {i.filename: i for i in self.zip_file.infolist() if i.file_size > 0}
+        self.index = {}
+        for name in self.info:
+            entity_type, _, file_name = name.rpartition('/')
+            if entity_type:
+                self.index.setdefault(entity_type, {})[os.path.splitext(file_name)[0]] = name
+
+    def __getitem__(self, name):
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+        info = self.info[name]
+        j = json.loads(self.zip_file.read(info))
+
+        # evict least recently used entities to fit the budget, always keeping the one just read
+        self.cache[name] = j
+        self.cache_bytes += info.file_size
+        while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+            old_name, _ = self.cache.popitem(last=False)
+            self.cache_bytes -= self.info[old_name].file_size
+        return j
+
+    def __iter__(self):
+        return iter(self.info)
+
+    def __len__(self):
+        return len(self.info)
+
+    def __contains__(self, name):
+        return name in self.info
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def entity_types(self):
+        """
+        :return: list of entity types i.e. the folders in the zip
+        """
+        return list(self.index)
+
+    def ids(self, entity_type):
+        """
+        :param str entity_type: e.g. processes
+        :return: list of @id of entities of the type
+        """
+        return list(self.index.get(entity_type, {}))
+
+    def get_entity(self, entity_type, entity_id):
+        """
+        Get a parsed entity by type and @id.
+
+        :param str entity_type: e.g. processes
+        :param str entity_id: @id of entity
+        :return: dict
+        """
+        return self[self.index[entity_type][entity_id]]
+
+    def close(self):
+        self.cache.clear()
+        self.cache_bytes = 0
+        self.zip_file.close()
+
+
+def json_to_custom(zip_filename, db_file_base, limit=None, bulk_load=False):
     """ Get json files in a JSON-LD zip file and store customised information in a sqlite database.
     :param zip_filename:
     :param db_file_base:
     :param limit: limit the number of processes to export
+    :param bulk_load: write with journaling and fsync off in one transaction
     :return: file path of time-stamped sqlite db
     """
 
@@ -411,6 +883,9 @@ def json_to_custom(zip_filename, db_file_base, limit=None):
         json_file_list = new_file_list
 
     print("Populating tables ...")
+    if bulk_load:
+        begin_bulk_load(conn)
+        conn.execute('BEGIN')
     file_num = 1
     for f in json_file_list:
 
@@ -420,7 +895,10 @@ def json_to_custom(zip_filename, db_file_base, limit=None):
             ex_dfr = pd.json_normalize(j['exchanges'], max_level=1)  # maybe use flatten here
             ex_dfr.insert(0, 'id', j['@id'])
             out_dfr = ex_dfr[['id', 'input', 'amount']]
-            out_dfr.to_sql(f[0], conn, if_exists='append')
+            if bulk_load:
+                insert_dataframe(conn, f[0], out_dfr, index=True)
+            else:
+                out_dfr.to_sql(f[0], conn, if_exists='append')
 
         work_done = file_num / len(json_file_list)
         print("\rProgress: [{0:50s}] {1:.1f}%".format('#' * int(work_done * 50), work_done * 100),
@@ -428,22 +906,67 @@ def json_to_custom(zip_filename, db_file_base, limit=None):
         file_num += 1
 
     conn.commit()
+    if bulk_load:
+        create_dataframe_index(conn, 'processes')
+        end_bulk_load(conn)
     conn.close()
     print()
     return db_file
 
 
-def json_to_sqlite(zip_filename, db_file_base, limit=None):
+_json_zip = None
+
+
+def _open_json_zip(zip_filename):
+    """ Process pool initializer: keep one open handle on the JSON-LD zip in each worker """
+    global _json_zip
+    _json_zip = zipfile.ZipFile(zip_filename, 'r')
+
+
+def _parse_json_members(names):
+    """
+    Process pool worker: decompress and parse a batch of JSON-LD zip members.
+
+    :param names: list of zip member names
+    :return: dictionary of row lists keyed by table name, including process_grid rows for processes
+    """
+    rows = {}
+    for name in names:
+        tbl = name.split('/')[0]
+        text = _json_zip.read(name).decode('utf-8')
+        j = json.loads(text)
+        rows.setdefault(tbl, []).append((text,))
+
+        # one process_grid row per exchange with the exchange amount as stored in the process
+        if tbl == 'processes':
+            for ex in j.get('exchanges', []):
+                rows.setdefault('process_grid', []).append(
+                    (j['@id'], ex.get('flow', {}).get('@id'), ex.get('amount', 0.0))
+                )
+    return rows
+
+
+def json_to_sqlite(zip_filename, db_file_base, limit=None, bulk_load=False, batch_size=1000, processes=None):
     """ Get json files in a JSON-LD zip file and store them in a sqlite database.
+
+    The zip members are decompressed and parsed in a pool of worker processes in batches of batch_size
+    and written by this process with executemany. At most two batches per worker are in flight so memory
+    does not grow with the size of the archive. process_grid holds the process id, flow id and amount of
+    each process exchange.
+
     :param zip_filename:
     :param db_file_base:
     :param limit: limit the number of processes to export
+    :param bulk_load: write with journaling and fsync off in one transaction and build the
+        indices in create_json_indices after all the rows are in
+    :param batch_size: number of zip members parsed by a worker and written in each executemany
+    :param processes: number of worker processes, defaults to the number of CPUs
     :return: file path of time-stamped sqlite db
     """
 
     # get the file names in the zip
-    zip_file = zipfile.ZipFile(zip_filename, 'r')
-    name_list = zip_file.namelist()
+    with zipfile.ZipFile(zip_filename, 'r') as zip_file:
+        name_list = zip_file.namelist()
     print("Loading", len(name_list), "json files in", zip_filename)
 
     # connect to sqlite database
@@ -486,27 +1009,39 @@ def json_to_sqlite(zip_filename, db_file_base, limit=None):
 
         json_file_list = new_file_list
 
-    # write each json file to db
+    # parse batches of zip members in the pool and write them here as they complete in order
     print("Populating tables ...")
-    file_num = 1
-    for f in json_file_list:
-        j = json.loads(zip_file.read('/'.join(f)))
-
-        # insert exchanges into dedicated table
-        if f[0] == "processes":
-            sql_stmt = "insert into process_grid values (?, ?, ?)"
-            c.execute(sql_stmt, [json.dumps(j), 0, 0])
-
-        # insert json chunk into table
-        sql_stmt = "insert into %s values (?)" % f[0]
-        c.execute(sql_stmt, [json.dumps(j)])
-
+    if bulk_load:
+        begin_bulk_load(conn)
+        conn.execute('BEGIN')
+    member_names = ['/'.join(f) for f in json_file_list]
+    batches = (member_names[i:i + batch_size] for i in range(0, len(member_names), batch_size))
+    processes = processes or os.cpu_count() or 1
+    file_num = 0
+
+    def write_batch(n, future):
+        nonlocal file_num
+        for tbl, rows in future.result().items():
+            c.executemany("insert into %s values (%s)" % (tbl, ','.join('?' * len(rows[0]))), rows)
+        file_num += n
         work_done = file_num / len(json_file_list)
         print("\rProgress: [{0:50s}] {1:.1f}%".format('#' * int(work_done * 50), work_done * 100),
               end="", flush=True)
-        file_num += 1
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_open_json_zip,
+                             initargs=(str(zip_filename),)) as executor:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append((len(batch), executor.submit(_parse_json_members, batch)))
+            if len(pending) >= 2 * processes:
+                write_batch(*pending.popleft())
+        while pending:
+            write_batch(*pending.popleft())
 
     conn.commit()
+    if bulk_load:
+        create_json_indices(conn)
+        end_bulk_load(conn)
     conn.close()
     print()
     return db_file
@@ -515,6 +1050,29 @@ def json_to_sqlite(zip_filename, db_file_base, limit=None):
     #     return (seq[pos:pos + size] for pos in range(0, len(seq), size))
 
 
+def get_file_fingerprint(file_name):
+    """
+    :param file_name: full path to file
+    :return: fingerprint of the version of a file from its size and modification time
+    """
+    stat = os.stat(file_name)
+    return '%d:%d' % (stat.st_size, stat.st_mtime_ns)
+
+
+def get_db_fingerprint(db_file):
+    """
+    Fingerprint of the content of a sqlite db from its 100 byte header, which holds the page count and a change
+    counter that is incremented by every transaction that writes to the db in the rollback journal modes used by mola.
+    Unlike get_file_fingerprint it is kept when the db is copied or extracted from a zip file, so the sidecar folders
+    of a db can be shipped with it.
+
+    :param db_file: full path to sqlite db
+    :return: fingerprint of the version of a db
+    """
+    with open(db_file, 'rb') as fp:
+        return hashlib.sha1(fp.read(100)).hexdigest()
+
+
 def get_sqlite_connection(db_file=get_default_db_file()):
     """
     Get a database connection to the SQLite database.
@@ -532,7 +1090,12 @@ def get_sqlite_connection(db_file=get_default_db_file()):
 
 
 def create_json_indices(db_file):
-    conn = get_sqlite_connection(db_file)
+    """
+    Create indices on tables in a sqlite database created from a JSON-LD zip file
+    :param db_file: database file or an open sqlite connection
+    :return: None
+    """
+    conn = db_file if isinstance(db_file, sqlite3.Connection) else get_sqlite_connection(db_file)
     c = conn.cursor()
 
     sql_stmt = """
@@ -544,49 +1107,437 @@ def create_json_indices(db_file):
     CREATE INDEX IF NOT EXISTS flows_name ON flows ( json_extract(data, '$.name') COLLATE NOCASE )
     """
     c.execute(sql_stmt)
+
+    sql_stmt = """
+    CREATE INDEX IF NOT EXISTS process_grid_id ON process_grid (id, flowid, amount)
+    """
+    c.execute(sql_stmt)
+    c.execute('ANALYZE')
     conn.commit()
 
-    conn.close()
+    if conn is not db_file:
+        conn.close()
+
+
+# indices covering the lookups and joins of the queries in mola.sqlgenerator and mola.dataview
+csv_indices = {
+    'TBL_EXCHANGES_ID': ('TBL_EXCHANGES', ['ID'], True),
+    'TBL_EXCHANGES_F_OWNER_COVER': ('TBL_EXCHANGES', ['F_OWNER', 'F_FLOW', 'F_UNIT', 'RESULTING_AMOUNT_VALUE',
+                                                      'COST_VALUE', 'F_CURRENCY'], False),
+    'TBL_EXCHANGES_F_FLOW': ('TBL_EXCHANGES', ['F_FLOW'], False),
+    'TBL_PROCESSES_REF_ID': ('TBL_PROCESSES', ['REF_ID', 'ID'], False),
+    'TBL_PROCESSES_ID_COVER': ('TBL_PROCESSES', ['ID', 'REF_ID', 'F_LOCATION'], False),
+    'TBL_FLOWS_ID_COVER': ('TBL_FLOWS', ['ID', 'FLOW_TYPE', 'REF_ID'], False),
+    'TBL_FLOWS_REF_ID': ('TBL_FLOWS', ['REF_ID'], False),
+    'TBL_FLOWS_FLOW_TYPE': ('TBL_FLOWS', ['FLOW_TYPE', 'REF_ID'], False),
+    'TBL_IMPACT_FACTORS_F_IMPACT_CATEGORY': ('TBL_IMPACT_FACTORS', ['F_IMPACT_CATEGORY', 'F_FLOW', 'VALUE'], False),
+    'TBL_IMPACT_CATEGORIES_REF_ID': ('TBL_IMPACT_CATEGORIES', ['REF_ID', 'ID'], False),
+    'TBL_UNITS_ID': ('TBL_UNITS', ['ID', 'NAME'], False),
+    'TBL_LOCATIONS_ID': ('TBL_LOCATIONS', ['ID', 'LONGITUDE', 'LATITUDE'], False),
+}
+
+# indices superseded by the covering indices above
+csv_indices_dropped = ['TBL_EXCHANGES_F_OWNER', 'TBL_FLOWS_ID']
 
 
 def create_csv_indices(db_file):
     """
-    Create indices on tables in a sqlite database created from CSVs exported from Derby
-    :param db_file: database file
+    Create indices on tables in a sqlite database created from CSVs exported from Derby using the csv_indices
+    specification and run ANALYZE. Tables or columns missing from the database are skipped.
+    :param db_file: database file or an open sqlite connection
     :return: None
     """
-    print("Building indices on", db_file)
-    conn = get_sqlite_connection(db_file)
+    if isinstance(db_file, sqlite3.Connection):
+        print("Building indices")
+        conn = db_file
+    else:
+        print("Building indices on", db_file)
+        conn = get_sqlite_connection(db_file)
     c = conn.cursor()
 
-    sql_stmt = """
-    CREATE UNIQUE INDEX IF NOT EXISTS TBL_EXCHANGES_ID ON TBL_EXCHANGES(ID)
+    for index_name in csv_indices_dropped:
+        c.execute('DROP INDEX IF EXISTS "%s"' % index_name)
+    for index_name, (tbl_name, cols, unique) in csv_indices.items():
+        tbl_cols = [r[1] for r in c.execute('PRAGMA table_info("%s")' % tbl_name)]
+        if all(col in tbl_cols for col in cols):
+            sql_stmt = 'CREATE %s INDEX IF NOT EXISTS "%s" ON "%s" (%s)' % \
+                       ('UNIQUE' if unique else '', index_name, tbl_name, ', '.join('"%s"' % col for col in cols))
+            c.execute(sql_stmt)
+    c.execute('ANALYZE')
+
+    conn.commit()
+    if conn is not db_file:
+        conn.close()
+
+
+# rows of each table referenced by a subset of processes and impact categories in the order they are copied,
+# a list of conditions is joined with OR leaving out conditions on tables not in the database
+subset_tables = [
+    ('TBL_PROCESSES', 'ID IN (SELECT ID FROM temp.MOLA_SUBSET_PROCESSES)'),
+    ('TBL_EXCHANGES', 'F_OWNER IN (SELECT ID FROM main.TBL_PROCESSES)'),
+    ('TBL_IMPACT_CATEGORIES', 'REF_ID IN (SELECT REF_ID FROM temp.MOLA_SUBSET_KPI)'),
+    ('TBL_IMPACT_METHODS', 'ID IN (SELECT F_IMPACT_METHOD FROM main.TBL_IMPACT_CATEGORIES)'),
+    ('TBL_FLOWS', 'ID IN (SELECT F_FLOW FROM main.TBL_EXCHANGES)'),
+    ('TBL_IMPACT_FACTORS', 'F_IMPACT_CATEGORY IN (SELECT ID FROM main.TBL_IMPACT_CATEGORIES) '
+                           'AND F_FLOW IN (SELECT ID FROM main.TBL_FLOWS)'),
+    ('TBL_FLOW_PROPERTIES', 'ID IN (SELECT F_REFERENCE_FLOW_PROPERTY FROM main.TBL_FLOWS)'),
+    ('TBL_UNIT_GROUPS', 'ID IN (SELECT F_UNIT_GROUP FROM main.TBL_FLOW_PROPERTIES)'),
+    ('TBL_UNITS', ['ID IN (SELECT F_UNIT FROM main.TBL_EXCHANGES UNION SELECT F_UNIT FROM main.TBL_IMPACT_FACTORS)',
+                   'F_UNIT_GROUP IN (SELECT ID FROM main.TBL_UNIT_GROUPS)']),
+    ('TBL_LOCATIONS', 'ID IN (SELECT F_LOCATION FROM main.TBL_PROCESSES)'),
+]
+
+# small tables copied whole to a subset database, other tables are created empty
+subset_full_tables = ['TBL_CATEGORIES', 'TBL_CURRENCIES']
+
+
+def create_subset_db(db_file, subset_db_file, process_ref_ids=None, impact_category_ref_ids=None, config=None,
+                     providers=False):
     """
-    c.execute(sql_stmt)
-    sql_stmt = """
-    CREATE INDEX IF NOT EXISTS TBL_FLOWS_ID ON TBL_FLOWS(ID)
+    Write a slim sqlite database with the same schema as an openLCA database holding only the processes of a
+    model and the exchanges, flows, units, locations, impact categories and impact factors they reference,
+    see subset_tables.
+
+    :param db_file: full path to sqlite db
+    :param subset_db_file: full path to the subset sqlite db, replaced if it exists
+    :param list[str] process_ref_ids: process reference ids
+    :param list[str] impact_category_ref_ids: impact category reference ids
+    :param dict config: model configuration whose P_m, P_s, P_t and KPI sets are added to the reference ids
+    :param boolean providers: add the default providers of the exchanges of the processes recursively
+    :return: full path to subset sqlite db
+    :raises sqlite3.OperationalError: if a table cannot be copied, the subset db is then removed
     """
-    c.execute(sql_stmt)
-    sql_stmt = """
-    CREATE INDEX IF NOT EXISTS TBL_EXCHANGES_F_FLOW ON TBL_EXCHANGES(F_FLOW)
+    process_ref_ids = list(process_ref_ids or [])
+    impact_category_ref_ids = list(impact_category_ref_ids or [])
+    if config is not None:
+        for set_name in ['P_m', 'P_s', 'P_t']:
+            process_ref_ids += config['sets'].get(set_name, [])
+        impact_category_ref_ids += config['sets'].get('KPI', [])
+
+    if os.path.exists(str(subset_db_file)):
+        os.remove(str(subset_db_file))
+    conn = get_sqlite_connection(str(subset_db_file))
+    conn.execute('ATTACH DATABASE ? AS src', (str(db_file),))
+
+    # openLCA ids of the processes in the subset
+    conn.execute('CREATE TEMP TABLE MOLA_SUBSET_REF_IDS (REF_ID TEXT PRIMARY KEY)')
+    conn.executemany('INSERT OR IGNORE INTO temp.MOLA_SUBSET_REF_IDS VALUES (?)', [(r,) for r in process_ref_ids])
+    conn.execute('CREATE TEMP TABLE MOLA_SUBSET_KPI (REF_ID TEXT PRIMARY KEY)')
+    conn.executemany('INSERT OR IGNORE INTO temp.MOLA_SUBSET_KPI VALUES (?)', [(r,) for r in impact_category_ref_ids])
+    process_ids = 'SELECT ID FROM src.TBL_PROCESSES WHERE REF_ID IN (SELECT REF_ID FROM temp.MOLA_SUBSET_REF_IDS)'
+    if providers:
+        process_ids = """
+        WITH RECURSIVE chain(ID) AS (
+            %s
+            UNION
+            SELECT e.F_DEFAULT_PROVIDER FROM src.TBL_EXCHANGES e JOIN chain ON e.F_OWNER = chain.ID
+            WHERE e.F_DEFAULT_PROVIDER IS NOT NULL AND e.F_DEFAULT_PROVIDER != 0
+        )
+        SELECT ID FROM chain
+        """ % process_ids
+    conn.execute('CREATE TEMP TABLE MOLA_SUBSET_PROCESSES AS ' + process_ids)
+
+    # create every table and copy the referenced rows
+    schema = conn.execute("SELECT type, name, sql FROM src.sqlite_master "
+                          "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite!_%' ESCAPE '!'").fetchall()
+    table_names = [name for obj_type, name, sql in schema if obj_type == 'table']
+    for obj_type, name, sql in schema:
+        if obj_type == 'table':
+            conn.execute(sql)
+    for tbl_name, where in [t for t in subset_tables if t[0] in table_names] + \
+            [(t, None) for t in subset_full_tables if t in table_names]:
+        if isinstance(where, list):
+            where = ' OR '.join('(%s)' % w for w in where
+                                if set(re.findall(r'main\.(\w+)', w)).issubset(table_names)) or '0'
+        print("Copying table", tbl_name)
+        try:
+            conn.execute('INSERT INTO main."%s" SELECT * FROM src."%s"%s' %
+                         (tbl_name, tbl_name, ' WHERE ' + where if where is not None else ''))
+        except sqlite3.OperationalError as e:
+            # a partial subset would give a model with missing data so remove it
+            conn.close()
+            os.remove(str(subset_db_file))
+            raise sqlite3.OperationalError('Unable to copy table %s to subset database: %s' % (tbl_name, e))
+    conn.commit()
+
+    for obj_type, name, sql in schema:
+        if obj_type == 'index':
+            conn.execute(sql)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.execute('DETACH DATABASE src')
+    conn.close()
+
+    return subset_db_file
+
+
+# sparse matrices built from the sqlgenerator queries of the same name with their row key, column and value columns
+sparse_matrices = {
+    'process_elementary_flow': (['P', 'F'], 'E', 'EF'),
+    'impact_category_elementary_flow': (['KPI'], 'E', 'Ef'),
+}
+
+
+def get_sparse_matrix_folder(db_file):
     """
-    c.execute(sql_stmt)
-    sql_stmt = """
-    CREATE INDEX IF NOT EXISTS TBL_EXCHANGES_F_OWNER ON TBL_EXCHANGES(F_OWNER)
+    :param db_file: full path to sqlite db
+    :return: full path to the sidecar folder holding the sparse matrices of the db
     """
-    c.execute(sql_stmt)
+    return str(db_file) + '.matrices'
 
-    conn.commit()
+
+def save_sparse_matrix(folder, name, dfr, row_cols, col, value, db_fingerprint=None):
+    """
+    Save a table of row keys, column key and value as a CSR matrix in a folder of .npy files that can be memory
+    mapped. The key columns are stored as arrays of ref ids with None as an empty string. Where a row and column
+    appear more than once the last value is kept, as when the table is loaded into a DataPortal. The fingerprint of
+    the database the table was read from is kept in meta.json so that a matrix of another version is ignored.
+
+    :param folder: sidecar folder
+    :param str name: name of matrix
+    :param pd.DataFrame dfr: table of matrix entries
+    :param list[str] row_cols: names of the row key columns e.g. ['P', 'F']
+    :param str col: name of the column key column
+    :param str value: name of the value column
+    :param str db_fingerprint: fingerprint of the database, see get_db_fingerprint
+    :return: None
+    """
+    dfr = dfr.dropna(subset=[col] + [value]).fillna({c: '' for c in row_cols})
+    dfr = dfr.drop_duplicates(subset=row_cols + [col], keep='last')
+    row_codes, row_keys = pd.factorize(pd.MultiIndex.from_frame(dfr[row_cols]), sort=True)
+    col_codes, col_keys = pd.factorize(dfr[col], sort=True)
+    order = np.lexsort((col_codes, row_codes))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(row_codes, minlength=len(row_keys)))])
+
+    matrix_folder = os.path.join(folder, name)
+    os.makedirs(matrix_folder, exist_ok=True)
+    np.save(os.path.join(matrix_folder, 'indptr.npy'), indptr.astype(np.int64))
+    np.save(os.path.join(matrix_folder, 'indices.npy'), col_codes[order].astype(np.int32))
+    np.save(os.path.join(matrix_folder, 'data.npy'), dfr[value].to_numpy(dtype=np.float64)[order])
+    np.save(os.path.join(matrix_folder, 'cols.npy'), np.array(col_keys, dtype=str))
+    for i, row_col in enumerate(row_cols):
+        np.save(os.path.join(matrix_folder, 'rows_%s.npy' % row_col),
+                np.array(row_keys.get_level_values(i), dtype=str))
+    with open(os.path.join(matrix_folder, 'meta.json'), 'w') as fp:
+        json.dump({'rows': row_cols, 'col': col, 'value': value, 'columns': list(dfr.columns),
+                   'db_fingerprint': db_fingerprint}, fp)
+
+
+def build_sparse_matrices(db_file):
+    """
+    Materialise the process versus elementary flow and impact category versus elementary flow tables of a
+    sqlite openLCA database as CSR matrices in a sidecar folder next to the database, see dataview.get_sparse_matrix.
+
+    :param db_file: full path to sqlite db
+    :return: full path to sidecar folder
+    """
+    import mola.sqlgenerator as sq
+
+    folder = get_sparse_matrix_folder(db_file)
+    db_fingerprint = get_db_fingerprint(str(db_file))
+    conn = get_sqlite_connection(str(db_file))
+    for name, (row_cols, col, value) in sparse_matrices.items():
+        print("Building sparse matrix", name)
+        dfr = pd.read_sql(getattr(sq, 'build_' + name)(), conn)
+        save_sparse_matrix(folder, name, dfr, row_cols, col, value, db_fingerprint)
+    conn.close()
+
+    return folder
+
+
+# partition column of each table in the parquet dataset, exchanges are partitioned by a hash of the owner process
+parquet_partitions = {
+    'TBL_EXCHANGES': 'F_OWNER_BUCKET',
+    'TBL_FLOWS': 'FLOW_TYPE',
+}
+exchange_buckets = 64
+
+
+def get_parquet_folder(db_file):
+    """
+    :param db_file: full path to sqlite db
+    :return: full path to the sidecar folder holding the parquet dataset of the db
+    """
+    return str(db_file) + '.parquet'
+
+
+def get_owner_bucket(owner_ids):
+    """
+    :param pd.Series owner_ids: openLCA ids of processes owning exchanges
+    :return: Series of F_OWNER_BUCKET partition values
+    """
+    return pd.to_numeric(owner_ids, errors='coerce').fillna(0).astype('int64') % exchange_buckets
+
+
+def get_parquet_schema(conn, tbl_name):
+    """
+    Get the arrow schema of a sqlite table from its declared column types, so that every chunk of a table is
+    written with the same types even where a column is null in a whole chunk. Requires pyarrow.
+
+    :param sqlite3.Connection conn: database connection
+    :param str tbl_name: name of table
+    :return: pyarrow.Schema
+    """
+    import pyarrow as pa
+
+    fields = []
+    for cid, name, decl_type, notnull, default, pk in conn.execute('PRAGMA table_info("%s")' % tbl_name):
+        decl_type = (decl_type or '').upper()
+        if 'INT' in decl_type:
+            field_type = pa.int64()
+        elif any(t in decl_type for t in ['REAL', 'FLOA', 'DOUB', 'NUM', 'DEC']):
+            field_type = pa.float64()
+        elif 'BLOB' in decl_type:
+            field_type = pa.binary()
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(name, field_type))
+    return pa.schema(fields)
+
+
+def sqlite_to_parquet(db_file, parquet_folder=None, table_name=None, chunk_size=1000000):
+    """
+    Export the tables of a sqlite openLCA database to a parquet dataset with a folder for each table, partitioned
+    as in parquet_partitions, for reading with column projection and filters in dataview.read_parquet.
+    The fingerprint of the database and the exported tables are kept in meta.json so that the dataset of another
+    version of the database is ignored. Requires pyarrow.
+
+    :param db_file: full path to sqlite db
+    :param parquet_folder: output folder, defaults to the sidecar folder of the db
+    :param list[str] table_name: list of tables to export, defaults to all the openLCA TBL_ tables
+    :param chunk_size: number of rows written to each parquet file
+    :return: full path to parquet folder
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    folder = str(parquet_folder) if parquet_folder is not None else get_parquet_folder(db_file)
+    db_fingerprint = get_db_fingerprint(str(db_file))
+    conn = get_sqlite_connection(str(db_file))
+    if table_name is None:
+        table_name = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                                 "AND name LIKE 'TBL!_%' ESCAPE '!'")]
+
+    # tables exported before from the same version of the database are kept in the meta data
+    meta_file = os.path.join(folder, 'meta.json')
+    meta = {'db_fingerprint': db_fingerprint, 'tables': []}
+    if os.path.exists(meta_file):
+        with open(meta_file) as fp:
+            old_meta = json.load(fp)
+        if old_meta.get('db_fingerprint') == db_fingerprint:
+            meta['tables'] = [t for t in old_meta['tables'] if t not in table_name]
+
+    for tbl in table_name:
+        print("Exporting table", tbl)
+        tbl_folder = os.path.join(folder, tbl)
+        if os.path.exists(tbl_folder):
+            shutil.rmtree(tbl_folder)
+        os.makedirs(tbl_folder)
+        partition_col = parquet_partitions.get(tbl)
+        schema = get_parquet_schema(conn, tbl)
+        if tbl == 'TBL_EXCHANGES':
+            schema = schema.append(pa.field('F_OWNER_BUCKET', pa.int64()))
+        string_cols = [field.name for field in schema if field.type == pa.string()]
+        chunks = pd.read_sql('SELECT * FROM "%s"' % tbl, conn, chunksize=chunk_size)
+        for chunk_num, chunk in enumerate(itertools.chain(chunks, [None])):
+            if chunk is None:
+                # an empty table is written as an empty file so that it can be read
+                if chunk_num > 0:
+                    break
+                chunk = pd.DataFrame({field.name: pd.Series(dtype=object) for field in schema})
+            if tbl == 'TBL_EXCHANGES':
+                chunk['F_OWNER_BUCKET'] = get_owner_bucket(chunk['F_OWNER'])
+            for col in string_cols:
+                if chunk[col].dtype != object:
+                    chunk[col] = chunk[col].where(chunk[col].isna(), chunk[col].astype(str))
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if partition_col is not None and len(chunk) > 0:
+                pq.write_to_dataset(table, tbl_folder, partition_cols=[partition_col])
+            else:
+                pq.write_table(table, os.path.join(tbl_folder, 'part-%d.parquet' % chunk_num))
+        meta['tables'].append(tbl)
     conn.close()
 
+    with open(meta_file, 'w') as fp:
+        json.dump(meta, fp)
+
+    return folder
+
+
+def begin_bulk_load(conn):
+    """
+    Switch a sqlite connection to bulk-load mode by keeping the rollback journal in memory and not
+    waiting for writes to reach the disk. A crash during a bulk load can leave a corrupt database so
+    only use it when the database is being created from scratch.
+
+    :param sqlite3.Connection conn: database connection
+    :return: None
+    """
+    conn.commit()
+    conn.execute('PRAGMA journal_mode=MEMORY')
+    conn.execute('PRAGMA synchronous=OFF')
+
+
+def end_bulk_load(conn):
+    """
+    Restore the default durability settings of a sqlite connection after a bulk load and
+    gather table and index statistics for the query planner.
+
+    :param sqlite3.Connection conn: database connection
+    :return: None
+    """
+    conn.commit()
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.execute('PRAGMA synchronous=FULL')
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def insert_dataframe(conn, tbl_name, dfr, index=False):
+    """
+    Append a DataFrame to a sqlite table using executemany on a prepared INSERT. The table is created
+    with the same column types as DataFrame.to_sql if it does not exist. No transaction is committed so
+    that the caller can write a whole table in one transaction.
+
+    :param sqlite3.Connection conn: database connection
+    :param str tbl_name: name of table
+    :param DataFrame dfr: rows to append
+    :param boolean index: write the DataFrame index as a column called index like DataFrame.to_sql
+    :return: None
+    """
+    if index:
+        dfr = dfr.reset_index()
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (tbl_name,))
+    if c.fetchone() is None:
+        c.execute(pd.io.sql.get_schema(dfr, tbl_name, con=conn))
+
+    sql_stmt = 'INSERT INTO "%s" VALUES (%s)' % (tbl_name, ','.join('?' * dfr.shape[1]))
+    rows = dfr.astype(object).where(dfr.notna(), None).itertuples(index=False, name=None)
+    c.executemany(sql_stmt, rows)
+
+
+def create_dataframe_index(conn, tbl_name):
+    """
+    Create the index on the index column that DataFrame.to_sql builds for a table written with
+    insert_dataframe(..., index=True).
+
+    :param sqlite3.Connection conn: database connection
+    :param str tbl_name: name of table
+    :return: None
+    """
+    conn.execute('CREATE INDEX IF NOT EXISTS "ix_%s_index" ON "%s" ("index")' % (tbl_name, tbl_name))
+    conn.commit()
+
 
-def bulk_import(input_dir, output_dir, zip_file, import_fn=json_to_custom, limit=None):
+def bulk_import(input_dir, output_dir, zip_file, import_fn=json_to_custom, limit=None, bulk_load=False):
     """ Convert a directory of db files using import_fn
     :param input_dir: full path to location of zip folder
     :param output_dir: full path to output folder
     :param zip_file: list of zip file names
     :param import_fn: function to convert zip to output format
     :param limit the number of processes to export
+    :param bulk_load: pass bulk-load mode to import_fn
     :return: list of db names
     """
 
@@ -596,7 +1547,7 @@ def bulk_import(input_dir, output_dir, zip_file, import_fn=json_to_custom, limit
         input_db = os.path.join(input_dir, z)
         output_db = os.path.join(output_dir, db_base_name)
         print("Importing", input_db, "...")
-        fn.append(import_fn(input_db, output_db, limit))
+        fn.append(import_fn(input_db, output_db, limit, bulk_load=bulk_load))
         print("Exported to", output_db)
 
     return fn
@@ -3,17 +3,23 @@ Views of openLCA data
 
 Functions designed to give reasonable looking output on the console or in a Jupyter script.
 """
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
 import pandas as pd
 from pypika import Query, Table, Criterion
-import pypika.functions as pf
 
 from mola import Package
-from mola.dataimport import get_sqlite_connection
+from mola.dataimport import get_sqlite_connection, get_sparse_matrix_folder, get_parquet_folder, get_owner_bucket, \
+    get_file_fingerprint, get_db_fingerprint
+import mola.sqlgenerator as sq
 
 get_sqlite_connection = get_sqlite_connection
 
 
-def get_df(conn, q, chunk_size=None, index_col=None):
+def get_df(conn, q, chunk_size=None, index_col=None, params=None):
     """
     Get dataframe from database using query string.
     Wrapper function to display the built SQL query if desired.
@@ -22,14 +28,27 @@ def get_df(conn, q, chunk_size=None, index_col=None):
     :param str q: query string
     :param int chunk_size: number of rows to include in each chunk
     :param str index_col: column name to set as index
+    :param dict params: values of the named parameters of the query, see sqlgenerator.bind_value
     :return: Dataframe
     """
     if Package.config('show.SQL'):
         print(q)
-    df = pd.read_sql(str(q), conn, index_col=index_col, chunksize=chunk_size)
+        if params:
+            print(params)
+    df = pd.read_sql(str(q), conn, index_col=index_col, chunksize=chunk_size, params=params)
     return df
 
 
+def get_db_file(conn):
+    """
+    Get the file of the main database of a connection.
+
+    :param sqlite3.Connection conn: database connection
+    :return: full path to database file or empty string for an in-memory database
+    """
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
 def get_table_names(conn):
     """
     Get table names from sqlite database.
@@ -84,18 +103,69 @@ def get_ids(conn, ref_ids, table_name):
     """
     Get ids from ref ids in a table
     :param conn: database connection
-    :param ref_ids: list of ref_ids or a ref_id
+    :param ref_ids: list of ref_ids or a ref_id or None for all ids
     :param table_name: name of table
     :return: dict
     """
-    if not isinstance(ref_ids, list):
-        ref_ids = [ref_ids]
     tbl = Table(table_name)
-    q = tbl.select(tbl.ID, tbl.REF_ID).where(tbl.REF_ID.isin(ref_ids))
+    q = tbl.select(tbl.ID, tbl.REF_ID)
+    if ref_ids is not None:
+        if not isinstance(ref_ids, (list, sq.RefIdTable)):
+            ref_ids = [ref_ids]
+        q = q.where(sq.isin_ref_ids(tbl.REF_ID, query_ref_ids(conn, table_name, ref_ids)))
     dfr = get_df(conn, q)
     return dict(zip(dfr.ID, dfr.REF_ID))
 
 
+def bind_ref_ids(conn, set_name, ref_ids):
+    """
+    Load reference ids into a temporary table of the connection with an index on REF_ID. The table is reused by
+    later calls on the same connection with the same reference ids.
+
+    :param sqlite3.Connection conn: database connection
+    :param str set_name: name of the set of reference ids e.g. processes, must be a valid identifier
+    :param list[str] ref_ids: reference ids
+    :return: sqlgenerator.RefIdTable to pass to queries in place of ref_ids
+    """
+    if not set_name.isidentifier():
+        raise ValueError('Invalid set name ' + set_name)
+    ref_ids = sorted(set(ref_ids))
+    digest = hashlib.sha1('\n'.join(ref_ids).encode('utf-8')).hexdigest()
+    ref_id_table = sq.RefIdTable(set_name)
+    table_name = sq.ref_id_table_prefix + set_name
+
+    # the digest of the bound reference ids of each set is kept in another temporary table
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS MOLA_REF_ID_SETS (SET_NAME TEXT PRIMARY KEY, DIGEST TEXT)")
+    row = conn.execute("SELECT DIGEST FROM MOLA_REF_ID_SETS WHERE SET_NAME = ?", (set_name,)).fetchone()
+    if row is not None and row[0] == digest:
+        return ref_id_table
+
+    conn.execute("DROP TABLE IF EXISTS temp." + table_name)
+    conn.execute("CREATE TEMP TABLE " + table_name + " (REF_ID TEXT PRIMARY KEY)")
+    conn.executemany("INSERT INTO temp." + table_name + " (REF_ID) VALUES (?)", [(r,) for r in ref_ids])
+    conn.execute("INSERT OR REPLACE INTO MOLA_REF_ID_SETS (SET_NAME, DIGEST) VALUES (?, ?)", (set_name, digest))
+    conn.execute("ANALYZE temp")
+    conn.commit()
+
+    return ref_id_table
+
+
+def query_ref_ids(conn, set_name, ref_ids):
+    """
+    Reference ids to pass to a query, bound to a temporary table if the sql.bind_ref_ids config is set.
+
+    :param sqlite3.Connection conn: database connection
+    :param str set_name: name of the set of reference ids
+    :param list[str] | str ref_ids: reference id or list of reference ids
+    :return: list[str] | sqlgenerator.RefIdTable
+    """
+    if isinstance(ref_ids, (str, sq.RefIdTable)):
+        return [ref_ids] if isinstance(ref_ids, str) else ref_ids
+    if Package.config('sql.bind_ref_ids'):
+        return bind_ref_ids(conn, set_name, ref_ids)
+    return list(ref_ids)
+
+
 def get_ref_id_dicts(conn, table_dict):
     """
     Get dictionary of ref id -> name for each table in table_dict
@@ -156,9 +226,9 @@ def get_lookup_tables(conn, single_column=False):
     locations = Table('TBL_LOCATIONS')
     q = Query \
         .from_(processes) \
-        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
         .select(processes.REF_ID.as_('PROCESS_REF_ID'), processes.NAME.as_('PROCESS_NAME'),
-                locations.NAME.as_('LOCATION_NAME'))  # FIXME
+                locations.NAME.as_('LOCATION_NAME'))
     d['processes'] = get_df(conn, q, index_col='PROCESS_REF_ID')
     d['P'] = d['P_m'] = d['P_s'] = d['P_t'] = d['processes']
 
@@ -270,6 +340,12 @@ def get_process_elementary_flow(conn, ref_ids=None, units=True, limit_exchanges=
     :return: Dataframe
     """
 
+    # slice the sparse matrix if it has been built and no units are needed
+    matrix = get_sparse_matrix(get_db_file(conn), 'process_elementary_flow') if ref_ids and not units else None
+    if matrix is not None and limit_exchanges is None:
+        matrix_dfr = get_sparse_matrix_rows(matrix, ref_ids).drop_duplicates(subset=['E', 'P'])
+        return pd.DataFrame.pivot(matrix_dfr, index='E', columns='P', values='EF').rename_axis('REF_ID')
+
     process_dict = get_ids(conn, ref_ids=ref_ids, table_name="TBL_PROCESSES")
     process_id = list(process_dict.keys())
 
@@ -366,6 +442,12 @@ def get_impact_category_elementary_flow(conn, ref_ids=None, units=True):
     :return: Dataframe
     """
 
+    # slice the sparse matrix if it has been built and no units are needed
+    matrix = get_sparse_matrix(get_db_file(conn), 'impact_category_elementary_flow') if ref_ids and not units else None
+    if matrix is not None:
+        matrix_dfr = get_sparse_matrix_rows(matrix, ref_ids)
+        return pd.DataFrame.pivot(matrix_dfr, index='E', columns='KPI', values='Ef').rename_axis('FLOW_REF_ID')
+
     # table for joins
     impact_factors = Table('TBL_IMPACT_FACTORS')  # maps impact factors to impact categories
     impact_categories = Table('TBL_IMPACT_CATEGORIES')
@@ -376,7 +458,7 @@ def get_impact_category_elementary_flow(conn, ref_ids=None, units=True):
         .as_('ic')
 
     if ref_ids:
-        ic = ic.where(impact_categories.REF_ID.isin(ref_ids))
+        ic = ic.where(sq.isin_ref_ids(impact_categories.REF_ID, query_ref_ids(conn, 'impact_categories', ref_ids)))
 
     # no need to select ELEMENTARY_FLOW
     q = Query\
@@ -461,8 +543,8 @@ def get_processes(conn, name=None, location=None,
     fields = [f if f != 'LOCATION' else locations.NAME.as_('LOCATION') for f in fields]
     q = Query \
         .from_(processes) \
-        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
-        .select(*fields)  # FIXME
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
+        .select(*fields)
     if name:
         q = q.where(Criterion.any([processes.NAME.like(p) for p in name]))
     if location:
@@ -486,9 +568,9 @@ def get_process_locations(conn, ref_ids=None):
     locations = Table('TBL_LOCATIONS')
     q = Query \
         .from_(processes) \
-        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
         .select(processes.REF_ID, processes.NAME, locations.LATITUDE, locations.LONGITUDE)\
-        .where(processes.REF_ID.isin(ref_ids)) # FIXME
+        .where(sq.isin_ref_ids(processes.REF_ID, query_ref_ids(conn, 'processes', ref_ids)))
 
     return get_df(conn, q)
 
@@ -509,9 +591,8 @@ def get_flow_reference_units(conn, flow_ref_ids=None):
 
     # convert reference ids to openLCA flow ids
     if flow_ref_ids:
-        if isinstance(flow_ref_ids, str):
-            flow_ref_ids = [flow_ref_ids]
-        flow_id = flows.select(flows.ID).where(flows.REF_ID.isin(flow_ref_ids))
+        flow_ref_ids = query_ref_ids(conn, 'flows', flow_ref_ids)
+        flow_id = flows.select(flows.ID).where(sq.isin_ref_ids(flows.REF_ID, flow_ref_ids))
     else:
         flow_id = flows.select(flows.ID)
 
@@ -542,23 +623,25 @@ def get_product_flow_units(conn, flow_ref_ids=None):
     units = Table('TBL_UNITS')
 
     # convert reference ids to openLCA product flow ids
-    flow_id = flows.select(flows.ID).where(flows.FLOW_TYPE == 'PRODUCT_FLOW')
+    flow_id = flows.select(flows.ID)
     if flow_ref_ids:
-        flow_id = flow_id.where(flows.REF_ID.isin(flow_ref_ids))
+        flow_ref_ids = query_ref_ids(conn, 'flows', flow_ref_ids)
+        flow_id = flow_id.where(sq.isin_ref_ids(flows.REF_ID, flow_ref_ids))
+    flow_id = flow_id.where(flows.FLOW_TYPE == sq.bind_flow_type(flow_ref_ids, 'PRODUCT_FLOW'))
 
     # sub-query to restrict to exchanges to product flows
-    sq = Query \
+    sub_q = Query \
         .from_(exchanges) \
         .select(exchanges.ID, exchanges.F_FLOW, exchanges.F_UNIT) \
         .where(exchanges.F_FLOW.isin(flow_id))
 
     q = Query \
-        .from_(sq) \
-        .left_join(flows).on(sq.F_FLOW == flows.ID) \
-        .left_join(units).on(sq.F_UNIT == units.ID) \
+        .from_(sub_q) \
+        .left_join(flows).on(sub_q.F_FLOW == flows.ID) \
+        .left_join(units).on(sub_q.F_UNIT == units.ID) \
         .select(flows.NAME, units.NAME.as_('UNITS_NAME'))
 
-    return get_df(conn, q)
+    return get_df(conn, q, params=sq.get_params(flow_ref_ids))
 
 
 def get_process_product_flow(conn, process_ref_ids):
@@ -577,30 +660,29 @@ def get_process_product_flow(conn, process_ref_ids):
     locations = Table('TBL_LOCATIONS')
 
     # get the process ids from the ref ids
-    if isinstance(process_ref_ids, str):
-        process_ref_ids = [process_ref_ids]
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ref_ids = query_ref_ids(conn, 'processes', process_ref_ids)
+    process_ids = processes.select(processes.ID).where(sq.isin_ref_ids(processes.REF_ID, process_ref_ids))
 
     # sub-query exchanges table to limit join
-    sq = Query\
+    sub_q = Query\
         .from_(exchanges) \
         .select(exchanges.F_OWNER, exchanges.F_FLOW, exchanges.F_UNIT, exchanges.RESULTING_AMOUNT_VALUE) \
         .where(exchanges.F_OWNER.isin(process_ids))
 
     # join exchanges to flows, processes, locations
     q = Query\
-        .from_(sq) \
-        .left_join(flows).on(flows.ID == sq.F_FLOW) \
-        .left_join(processes).on(processes.ID == sq.F_OWNER) \
-        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
+        .from_(sub_q) \
+        .left_join(flows).on(flows.ID == sub_q.F_FLOW) \
+        .left_join(processes).on(processes.ID == sub_q.F_OWNER) \
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
         .select(
             processes.REF_ID.as_('PROCESS_REF_ID'), processes.NAME.as_('PROCESS_NAME'),
             locations.NAME.as_('LOCATION'),
             flows.REF_ID.as_('FLOW_REF_ID'), flows.NAME.as_('FLOW_NAME')
         )\
-        .where(flows.FlOW_TYPE == 'PRODUCT_FLOW')
+        .where(flows.FlOW_TYPE == sq.bind_flow_type(process_ref_ids, 'PRODUCT_FLOW'))
 
-    return get_df(conn, q)
+    return get_df(conn, q, params=sq.get_params(process_ref_ids))
 
 
 def get_process_product_flow_costs(conn, process_ref_ids):
@@ -621,12 +703,11 @@ def get_process_product_flow_costs(conn, process_ref_ids):
     currencies = Table('TBL_CURRENCIES')
 
     # get the process ids from the ref ids
-    if isinstance(process_ref_ids, str):
-        process_ref_ids = [process_ref_ids]
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ref_ids = query_ref_ids(conn, 'processes', process_ref_ids)
+    process_ids = processes.select(processes.ID).where(sq.isin_ref_ids(processes.REF_ID, process_ref_ids))
 
     # sub-query the exchanges table to limit join
-    sq = Query\
+    sub_q = Query\
         .from_(exchanges) \
         .select(exchanges.F_OWNER, exchanges.COST_VALUE, exchanges.F_CURRENCY, exchanges.F_FLOW,
                 exchanges.F_UNIT, exchanges.RESULTING_AMOUNT_VALUE) \
@@ -634,21 +715,21 @@ def get_process_product_flow_costs(conn, process_ref_ids):
 
     # join exchanges to flows, processes, locations, units, currencies
     q = Query\
-        .from_(sq) \
-        .left_join(flows).on(flows.ID == sq.F_FLOW) \
-        .left_join(processes).on(processes.ID == sq.F_OWNER) \
-        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
-        .left_join(units).on(units.ID == sq.F_UNIT) \
-        .left_join(currencies).on(currencies.ID == sq.F_CURRENCY) \
+        .from_(sub_q) \
+        .left_join(flows).on(flows.ID == sub_q.F_FLOW) \
+        .left_join(processes).on(processes.ID == sub_q.F_OWNER) \
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
+        .left_join(units).on(units.ID == sub_q.F_UNIT) \
+        .left_join(currencies).on(currencies.ID == sub_q.F_CURRENCY) \
         .select(
             processes.REF_ID.as_('PROCESS_REF_ID'), processes.NAME.as_('PROCESS_NAME'),
             locations.NAME.as_('LOCATION'),
             flows.REF_ID.as_('FLOW_REF_ID'), flows.NAME.as_('FLOW_NAME'), \
-            sq.COST_VALUE, currencies.NAME.as_('CURRENCY'), units.NAME.as_('UNITS')
+            sub_q.COST_VALUE, currencies.NAME.as_('CURRENCY'), units.NAME.as_('UNITS')
         )\
-        .where(flows.FlOW_TYPE == 'PRODUCT_FLOW')
+        .where(flows.FlOW_TYPE == sq.bind_flow_type(process_ref_ids, 'PRODUCT_FLOW'))
 
-    return get_df(conn, q)
+    return get_df(conn, q, params=sq.get_params(process_ref_ids))
 
 
 def get_process_product_flow_units(conn, process_ref_ids, set_name='P'):
@@ -668,12 +749,11 @@ def get_process_product_flow_units(conn, process_ref_ids, set_name='P'):
     units = Table('TBL_UNITS')
 
     # get the process ids from the ref ids
-    if isinstance(process_ref_ids, str):
-        process_ref_ids = [process_ref_ids]
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ref_ids = query_ref_ids(conn, 'processes', process_ref_ids)
+    process_ids = processes.select(processes.ID).where(sq.isin_ref_ids(processes.REF_ID, process_ref_ids))
 
     # sub-query the exchanges table to limit join
-    sq = Query \
+    sub_q = Query \
         .from_(exchanges) \
         .select(exchanges.F_OWNER, exchanges.F_FLOW,
                 exchanges.F_UNIT, exchanges.RESULTING_AMOUNT_VALUE) \
@@ -681,16 +761,16 @@ def get_process_product_flow_units(conn, process_ref_ids, set_name='P'):
 
     # join exchanges to flows, processes, units
     q = Query \
-        .from_(sq) \
-        .left_join(flows).on(flows.ID == sq.F_FLOW) \
-        .left_join(processes).on(processes.ID == sq.F_OWNER) \
-        .left_join(units).on(units.ID == sq.F_UNIT) \
+        .from_(sub_q) \
+        .left_join(flows).on(flows.ID == sub_q.F_FLOW) \
+        .left_join(processes).on(processes.ID == sub_q.F_OWNER) \
+        .left_join(units).on(units.ID == sub_q.F_UNIT) \
         .select(
             processes.REF_ID.as_(set_name), units.NAME.as_('Units')
         )\
-        .where(flows.FlOW_TYPE == 'PRODUCT_FLOW')
+        .where(flows.FlOW_TYPE == sq.bind_flow_type(process_ref_ids, 'PRODUCT_FLOW'))
 
-    product_flow_dfr = get_df(conn, q)
+    product_flow_dfr = get_df(conn, q, params=sq.get_params(process_ref_ids))
     product_flow_dfr.set_index(set_name, inplace=True)
 
     return product_flow_dfr
@@ -729,6 +809,487 @@ def get_product_flows(conn, name=None, fields=['ID', 'REF_ID', 'NAME']):
     return get_df(conn, q)
 
 
+def explain_query(conn, q):
+    """
+    Get the sqlite query plan of a query.
+
+    :param sqlite3.Connection conn: database connection
+    :param str q: query string
+    :return: DataFrame of query plan steps
+    """
+    return pd.DataFrame(conn.execute('EXPLAIN QUERY PLAN ' + str(q)).fetchall(),
+                        columns=['id', 'parent', 'notused', 'detail'])
+
+
+def check_query_plans(conn, process_ref_ids=None, impact_category_ref_ids=None, time=('2020',), n_ref_ids=10):
+    """
+    Run EXPLAIN QUERY PLAN on every build_* query in mola.sqlgenerator and flag full scans of TBL_EXCHANGES.
+    The queries are built with the given reference ids or a sample of those in the database.
+
+    :param sqlite3.Connection conn: database connection
+    :param list[str] process_ref_ids: process reference ids
+    :param list[str] impact_category_ref_ids: impact category reference ids
+    :param list time: time labels
+    :param int n_ref_ids: number of reference ids to sample
+    :return: DataFrame of query plan steps with the query name and a FULL_SCAN flag
+    """
+    if process_ref_ids is None:
+        process_ref_ids = [r[0] for r in conn.execute('SELECT REF_ID FROM TBL_PROCESSES LIMIT ?', (n_ref_ids,))]
+    if impact_category_ref_ids is None:
+        impact_category_ref_ids = [r[0] for r in conn.execute('SELECT REF_ID FROM TBL_IMPACT_CATEGORIES LIMIT ?',
+                                                              (n_ref_ids,))]
+    args = {'process_ref_ids': process_ref_ids, 'ref_ids': impact_category_ref_ids, 'time': list(time)}
+
+    plans = []
+    for name, fn in inspect.getmembers(sq, inspect.isfunction):
+        if name.startswith('build_') and fn.__module__ == sq.__name__:
+            params = inspect.signature(fn).parameters
+            plan = explain_query(conn, fn(**{p: args[p] for p in params if p in args}))
+            plan.insert(0, 'query', name)
+            plans.append(plan)
+    plans = pd.concat(plans, ignore_index=True)
+
+    # a scan of the exchanges table that is not a lookup on an index
+    plans['FULL_SCAN'] = plans['detail'].str.match(r'SCAN (TABLE )?TBL_EXCHANGES\b')
+    for name in plans.loc[plans['FULL_SCAN'], 'query'].unique():
+        print('Warning:', name, 'scans the whole of TBL_EXCHANGES, run dataimport.create_csv_indices')
+
+    return plans
+
+
+def get_sidecar_meta(db_file, meta_file):
+    """
+    :param db_file: full path to sqlite db
+    :param str meta_file: full path to the meta data file of a sidecar folder of the db
+    :return: dict of meta data or None if the sidecar has not been built or was built from another version of the db
+    """
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as fp:
+        meta = json.load(fp)
+    if meta.get('db_fingerprint') != get_db_fingerprint(str(db_file)):
+        print('Warning: ignoring', os.path.dirname(meta_file), 'built from another version of the database')
+        return None
+    return meta
+
+
+def get_sparse_matrix(db_file, name):
+    """
+    Memory map a sparse matrix from the sidecar folder of a database built by dataimport.build_sparse_matrices.
+
+    :param db_file: full path to sqlite db
+    :param str name: name of matrix e.g. process_elementary_flow
+    :return: dict of arrays and the meta data of the matrix or None if the matrix has not been built from the
+        current version of the db
+    """
+    matrix_folder = os.path.join(get_sparse_matrix_folder(db_file), name)
+    matrix = get_sidecar_meta(db_file, os.path.join(matrix_folder, 'meta.json'))
+    if matrix is None:
+        return None
+    for f in os.listdir(matrix_folder):
+        if f.endswith('.npy'):
+            matrix[f[:-4]] = np.load(os.path.join(matrix_folder, f), mmap_mode='r')
+    return matrix
+
+
+def get_sparse_matrix_rows(matrix, ref_ids):
+    """
+    Slice the rows of a sparse matrix whose first row key is in a list of ref ids.
+
+    :param dict matrix: sparse matrix from get_sparse_matrix
+    :param list[str] ref_ids: reference ids of the first row key e.g. processes
+    :return: DataFrame with the row key, column key and value columns of the query the matrix was built from
+    """
+    rows = np.flatnonzero(np.isin(matrix['rows_' + matrix['rows'][0]], list(ref_ids)))
+    starts, ends = matrix['indptr'][rows], matrix['indptr'][rows + 1]
+    entries = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] + [np.arange(0)])
+    row_of_entry = np.repeat(rows, ends - starts)
+
+    dfr = pd.DataFrame({row_col: matrix['rows_' + row_col][row_of_entry] for row_col in matrix['rows']}, dtype=object)
+    dfr = dfr.where(dfr != '', None)
+    dfr[matrix['col']] = matrix['cols'][matrix['indices'][entries]]
+    dfr[matrix['value']] = matrix['data'][entries]
+
+    return dfr[matrix['columns']]
+
+
+# tables read by the parquet versions of the model table queries
+parquet_tables = {
+    'process_elementary_flow': ['TBL_PROCESSES', 'TBL_EXCHANGES', 'TBL_FLOWS'],
+    'impact_category_elementary_flow': ['TBL_IMPACT_CATEGORIES', 'TBL_IMPACT_FACTORS', 'TBL_FLOWS'],
+}
+
+
+def get_parquet_tables(db_file):
+    """
+    :param db_file: full path to sqlite db
+    :return: list of tables exported by dataimport.sqlite_to_parquet from the current version of the db
+    """
+    meta = get_sidecar_meta(db_file, os.path.join(get_parquet_folder(db_file), 'meta.json'))
+    if meta is None:
+        return []
+    return meta['tables']
+
+
+def read_parquet(db_file, table_name, columns=None, filters=None):
+    """
+    Read a table from the parquet dataset of a database exported by dataimport.sqlite_to_parquet.
+    Only the columns and the row groups and partitions passing the filters are read.
+
+    :param db_file: full path to sqlite db
+    :param str table_name: name of table e.g. TBL_EXCHANGES
+    :param list[str] columns: columns to read
+    :param list[tuple] filters: pyarrow filters e.g. [('FLOW_TYPE', '==', 'ELEMENTARY_FLOW')]
+    :return: DataFrame
+    """
+    if table_name not in get_parquet_tables(db_file):
+        raise ValueError('No parquet export of %s from the current version of %s' % (table_name, db_file))
+    dfr = pd.read_parquet(os.path.join(get_parquet_folder(db_file), table_name), columns=columns, filters=filters)
+
+    # partition columns are read as categories
+    for col in dfr.select_dtypes('category'):
+        dfr[col] = dfr[col].astype(str)
+    return dfr
+
+
+def get_process_elementary_flow_parquet(db_file, process_ref_ids):
+    """
+    Parquet version of the sqlgenerator.build_process_elementary_flow query.
+
+    :param db_file: full path to sqlite db
+    :param list[str] process_ref_ids: process reference ids
+    :return: DataFrame with columns E, F, P and EF
+    """
+    processes = read_parquet(db_file, 'TBL_PROCESSES', ['ID', 'REF_ID'], [('REF_ID', 'in', list(process_ref_ids))])
+    if len(processes) == 0:
+        return pd.DataFrame(columns=['E', 'F', 'P', 'EF'])
+    buckets = sorted(set(get_owner_bucket(processes['ID'])))
+    exchanges = read_parquet(db_file, 'TBL_EXCHANGES', ['F_OWNER', 'F_FLOW', 'RESULTING_AMOUNT_VALUE'],
+                             [('F_OWNER_BUCKET', 'in', buckets), ('F_OWNER', 'in', processes['ID'].tolist())])
+    flows = read_parquet(db_file, 'TBL_FLOWS', ['ID', 'REF_ID', 'FLOW_TYPE'],
+                         [('ID', 'in', exchanges['F_FLOW'].unique().tolist())])
+    exchanges = exchanges.merge(flows, left_on='F_FLOW', right_on='ID')
+
+    # join the elementary flows to the product flows of their process
+    product_flows = exchanges.loc[exchanges['FLOW_TYPE'] == 'PRODUCT_FLOW', ['F_OWNER', 'REF_ID']] \
+        .rename(columns={'REF_ID': 'F'})
+    dfr = exchanges[exchanges['FLOW_TYPE'] == 'ELEMENTARY_FLOW'] \
+        .merge(product_flows, on='F_OWNER', how='left') \
+        .merge(processes.rename(columns={'ID': 'F_OWNER', 'REF_ID': 'P'}), on='F_OWNER')
+
+    return dfr.rename(columns={'REF_ID': 'E', 'RESULTING_AMOUNT_VALUE': 'EF'})[['E', 'F', 'P', 'EF']]
+
+
+def get_impact_category_elementary_flow_parquet(db_file, ref_ids):
+    """
+    Parquet version of the sqlgenerator.build_impact_category_elementary_flow query.
+
+    :param db_file: full path to sqlite db
+    :param list[str] ref_ids: impact category reference ids
+    :return: DataFrame with columns KPI, E and Ef
+    """
+    categories = read_parquet(db_file, 'TBL_IMPACT_CATEGORIES', ['ID', 'REF_ID'], [('REF_ID', 'in', list(ref_ids))])
+    if len(categories) == 0:
+        return pd.DataFrame(columns=['KPI', 'E', 'Ef'])
+    factors = read_parquet(db_file, 'TBL_IMPACT_FACTORS', ['F_IMPACT_CATEGORY', 'F_FLOW', 'VALUE'],
+                           [('F_IMPACT_CATEGORY', 'in', categories['ID'].tolist())])
+    flows = read_parquet(db_file, 'TBL_FLOWS', ['ID', 'REF_ID'], [('ID', 'in', factors['F_FLOW'].unique().tolist())])
+    dfr = categories.rename(columns={'REF_ID': 'KPI'}) \
+        .merge(factors, left_on='ID', right_on='F_IMPACT_CATEGORY', how='left') \
+        .merge(flows.rename(columns={'ID': 'F_FLOW', 'REF_ID': 'E'}), on='F_FLOW', how='left')
+
+    return dfr.rename(columns={'VALUE': 'Ef'})[['KPI', 'E', 'Ef']]
+
+
+def get_process_exchanges(conn, process_ref_ids, flow_types=('PRODUCT_FLOW', 'ELEMENTARY_FLOW')):
+    """
+    Get the exchanges of processes with their flows, units and locations in a single scan,
+    see sqlgenerator.build_process_exchanges.
+
+    :param sqlite3.Connection conn: database connection
+    :param list[str] process_ref_ids: process reference ids
+    :param list[str] flow_types: types of exchange flows to include
+    :return: DataFrame
+    """
+    process_ref_ids = query_ref_ids(conn, 'processes', process_ref_ids)
+    q = sq.build_process_exchanges(process_ref_ids, flow_types)
+    return get_df(conn, q, params=sq.get_params(process_ref_ids))
+
+
+def get_process_elementary_flow_from_exchanges(exchanges_dfr):
+    """
+    Derive the table of the sqlgenerator.build_process_elementary_flow query from process exchanges.
+
+    :param pd.DataFrame exchanges_dfr: exchanges from get_process_exchanges including elementary flows
+    :return: DataFrame with columns E, F, P and EF
+    """
+    product_flows = exchanges_dfr.loc[exchanges_dfr['FLOW_TYPE'] == 'PRODUCT_FLOW', ['P', 'FLOW_REF_ID']] \
+        .rename(columns={'FLOW_REF_ID': 'F'})
+    dfr = exchanges_dfr[exchanges_dfr['FLOW_TYPE'] == 'ELEMENTARY_FLOW'].merge(product_flows, on='P', how='left')
+    return dfr.rename(columns={'FLOW_REF_ID': 'E', 'RESULTING_AMOUNT_VALUE': 'EF'})[['E', 'F', 'P', 'EF']]
+
+
+def get_model_table_source(db_file, name):
+    """
+    :param db_file: full path to sqlite db
+    :param str name: process_elementary_flow or impact_category_elementary_flow
+    :return: fastest source built for a model table, one of matrix, parquet or sqlite
+    """
+    if get_sidecar_meta(db_file, os.path.join(get_sparse_matrix_folder(db_file), name, 'meta.json')) is not None:
+        return 'matrix'
+    if set(parquet_tables[name]).issubset(get_parquet_tables(db_file)):
+        return 'parquet'
+    return 'sqlite'
+
+
+def get_query_cache_folder(db_file):
+    """
+    :param db_file: full path to sqlite db
+    :return: full path to the sidecar folder holding the cached query results of the db
+    """
+    return str(db_file) + '.cache'
+
+
+class QueryCache:
+    """
+    On-disk cache of the results of queries to a sqlite database.
+
+    Results are pickled to a folder, by default next to the database, under a key from the fingerprint of the
+    database file, the SQL and its bound reference ids, so a changed database misses the cache. The least recently
+    used results are evicted when the folder exceeds max_bytes. The database is only connected to on a miss.
+    Cached results are unpickled, so the cache is only used if the cache.queries config is set and its folder
+    should only be writable by the user.
+    """
+
+    def __init__(self, db_file, folder=None, max_bytes=None, enabled=None):
+        """
+        :param db_file: full path to sqlite db
+        :param str folder: cache folder, by default the cache.folder config or the sidecar folder of db_file
+        :param int max_bytes: size limit of the cache folder, by default the cache.max_bytes config
+        :param bool enabled: use the cache, by default the cache.queries config, otherwise always query the db
+        """
+        self.db_file = str(db_file)
+        self.folder = folder or Package.config('cache.folder') or get_query_cache_folder(db_file)
+        self.max_bytes = Package.config('cache.max_bytes') if max_bytes is None else max_bytes
+        self.enabled = Package.config('cache.queries') if enabled is None else enabled
+        self.fingerprint = get_file_fingerprint(self.db_file)
+        self.conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_conn(self):
+        """
+        :return: connection to the database, opened on first use
+        """
+        if self.conn is None:
+            self.conn = get_sqlite_connection(self.db_file)
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def get_key(self, q, ref_ids=None, params=None):
+        """
+        :param q: query
+        :param dict ref_ids: dict of set name to reference ids bound for the query
+        :param dict params: values of the named parameters of the query
+        :return: cache key of a query
+        """
+        h = hashlib.sha1(self.fingerprint.encode('utf-8'))
+        h.update(str(q).encode('utf-8'))
+        if params:
+            h.update(repr(sorted(params.items())).encode('utf-8'))
+        for set_name in sorted(ref_ids or {}):
+            h.update(('\n' + set_name + '\n' + '\n'.join(sorted(set(ref_ids[set_name])))).encode('utf-8'))
+        return h.hexdigest()
+
+    def get_df(self, q, ref_ids=None, params=None):
+        """
+        Get the table of a query from the cache or otherwise the database.
+
+        :param q: query
+        :param dict ref_ids: dict of set name to reference ids bound to temporary tables before the query is run,
+            see bind_ref_ids
+        :param dict params: values of the named parameters of the query
+        :return: DataFrame
+        """
+        file_name = os.path.join(self.folder, self.get_key(q, ref_ids, params) + '.pkl')
+        dfr = self.read_df(file_name)
+        if dfr is not None:
+            self.hits += 1
+            return dfr
+
+        self.misses += 1
+        dfr = self.query_df(q, ref_ids, params)
+        self.save_dfs({file_name: dfr})
+        return dfr
+
+    def get_build_df(self, build_fn, set_name, ref_ids, *args):
+        """
+        Get the table of a sqlgenerator build function of reference ids, which are bound to a temporary table if
+        the sql.bind_ref_ids config is set.
+
+        :param build_fn: sqlgenerator build function taking reference ids as its first argument
+        :param str set_name: name of the set of reference ids
+        :param list[str] ref_ids: reference ids
+        :param args: other arguments of build_fn
+        :return: DataFrame
+        """
+        if Package.config('sql.bind_ref_ids'):
+            ref_id_table = sq.RefIdTable(set_name)
+            q = build_fn(ref_id_table, *args)
+            return self.get_df(q, {set_name: list(ref_ids)}, ref_id_table.params)
+        return self.get_df(build_fn(list(ref_ids), *args))
+
+    def get_build_df_by_ref_id(self, build_fn, set_name, ref_ids, *args, ref_id_col='P'):
+        """
+        Get the table of a sqlgenerator build function of reference ids from the rows cached for each reference id,
+        so that only the reference ids not seen before are queried. Adding a process to a model then only queries
+        the new process. The rows are ordered by reference id.
+
+        :param build_fn: sqlgenerator build function taking reference ids as its first argument
+        :param str set_name: name of the set of reference ids
+        :param list[str] ref_ids: reference ids
+        :param args: other arguments of build_fn
+        :param str ref_id_col: column of the reference ids in the table
+        :return: DataFrame
+        """
+        ref_ids = list(dict.fromkeys(ref_ids))
+        if len(ref_ids) == 0:
+            return self.get_build_df(build_fn, set_name, ref_ids, *args)
+
+        # the rows of a reference id are keyed by the SQL of the build function with bound reference ids, which
+        # does not depend on the reference ids, so a change to the query misses the cache
+        template = sq.RefIdTable(set_name)
+        template_q = build_fn(template, *args)
+        file_names = {r: os.path.join(self.folder, self.get_key(template_q, {set_name: [r]}, template.params) + '.pkl')
+                      for r in ref_ids}
+        dfrs = {r: self.read_df(file_names[r]) for r in ref_ids}
+        new_ref_ids = [r for r in ref_ids if dfrs[r] is None]
+        self.hits += len(ref_ids) - len(new_ref_ids)
+        self.misses += len(new_ref_ids)
+
+        if new_ref_ids:
+            if Package.config('sql.bind_ref_ids'):
+                ref_id_table = sq.RefIdTable(set_name)
+                q = build_fn(ref_id_table, *args)
+                dfr = self.query_df(q, {set_name: new_ref_ids}, ref_id_table.params)
+            else:
+                dfr = self.query_df(build_fn(new_ref_ids, *args))
+            ref_id_dfrs = dict(list(dfr.groupby(ref_id_col, sort=False)))
+            for r in new_ref_ids:
+                dfrs[r] = ref_id_dfrs.get(r, dfr.iloc[:0])
+            self.save_dfs({file_names[r]: dfrs[r] for r in new_ref_ids})
+
+        non_empty_dfrs = [dfrs[r] for r in ref_ids if len(dfrs[r]) > 0]
+        return pd.concat(non_empty_dfrs or [dfrs[ref_ids[0]]], ignore_index=True)
+
+    def read_df(self, file_name):
+        """
+        :param str file_name: full path to cached table
+        :return: cached DataFrame or None if not cached
+        """
+        if not self.enabled or not os.path.exists(file_name):
+            return None
+        os.utime(file_name)
+        return pd.read_pickle(file_name)
+
+    def query_df(self, q, ref_ids=None, params=None):
+        """
+        Query the database bypassing the cache.
+
+        :param q: query
+        :param dict ref_ids: dict of set name to reference ids bound to temporary tables before the query is run
+        :param dict params: values of the named parameters of the query
+        :return: DataFrame
+        """
+        conn = self.get_conn()
+        for set_name, set_ref_ids in (ref_ids or {}).items():
+            bind_ref_ids(conn, set_name, set_ref_ids)
+        return get_df(conn, q, params=params)
+
+    def save_dfs(self, dfrs):
+        """
+        Save tables to the cache then evict the least recently used.
+
+        :param dict dfrs: dict of full path to DataFrame
+        """
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            for file_name, dfr in dfrs.items():
+                tmp_file_name = file_name + '.%d.tmp' % os.getpid()
+                dfr.to_pickle(tmp_file_name)
+                os.replace(tmp_file_name, file_name)
+            self.evict()
+        except OSError as e:
+            print('Query result not cached:', e)
+
+    def evict(self):
+        """
+        Delete the least recently used results until the cache folder is within max_bytes.
+        """
+        evict_cache_files(self.folder, self.max_bytes)
+
+
+def evict_cache_files(folder, max_bytes):
+    """
+    Delete the least recently used pickle files of a cache folder until it is within max_bytes.
+
+    :param str folder: cache folder
+    :param int max_bytes: size limit of the cache folder
+    """
+    entries = sorted(((e.stat(), e.path) for e in os.scandir(folder) if e.name.endswith('.pkl')),
+                     key=lambda e: e[0].st_mtime_ns)
+    total_bytes = sum(stat.st_size for stat, path in entries)
+    for stat, path in entries:
+        if total_bytes <= max_bytes:
+            break
+        os.remove(path)
+        total_bytes -= stat.st_size
+
+
+def get_model_table(db_file, name, ref_ids, exchanges_dfr=None, cache=None):
+    """
+    Get the table of a sqlgenerator query used to populate a model from the fastest source built for the
+    database: the sparse matrix sidecar, the parquet dataset or the sqlite database itself.
+
+    :param db_file: full path to sqlite db
+    :param str name: process_elementary_flow or impact_category_elementary_flow
+    :param list[str] ref_ids: reference ids of processes or impact categories
+    :param pd.DataFrame exchanges_dfr: exchanges of the processes from get_process_exchanges to derive the
+        process_elementary_flow table from instead of querying sqlite
+    :param QueryCache cache: query cache of db_file to query sqlite through, by default one is opened
+    :return: DataFrame
+    """
+    source = get_model_table_source(db_file, name)
+    if source == 'matrix':
+        return get_sparse_matrix_rows(get_sparse_matrix(db_file, name), ref_ids)
+    if source == 'parquet':
+        parquet_fn = {
+            'process_elementary_flow': get_process_elementary_flow_parquet,
+            'impact_category_elementary_flow': get_impact_category_elementary_flow_parquet,
+        }
+        return parquet_fn[name](db_file, ref_ids)
+    if exchanges_dfr is not None and name == 'process_elementary_flow':
+        return get_process_elementary_flow_from_exchanges(exchanges_dfr)
+    set_name = {'process_elementary_flow': 'processes', 'impact_category_elementary_flow': 'impact_categories'}
+    query_cache = QueryCache(db_file) if cache is None else cache
+    dfr = query_cache.get_build_df(getattr(sq, 'build_' + name), set_name[name], ref_ids)
+    if cache is None:
+        query_cache.close()
+    return dfr
+
+
 class LookupTables:
     """
     Caches lookups to a database using a dict of DataFrames.
@@ -5,6 +5,8 @@ import pandas as pd
 from pathlib import Path
 import json
 
+import mola.build as mb
+
 
 def get_model_user_sets(spec, file_name):
     """
@@ -49,14 +51,14 @@ def get_model_user_parameters(spec, set_data, parameter_file_name, param_list=['
 
     # build DataFrame of default parameters
     param_dfr = pd.DataFrame({'Parameter': [], 'Description': [], 'Index': [], 'Value': []})
-    for p, element_list in parameter_data.items():
-        for el in element_list:
-            v = el['value']
+    for p, default in parameter_data.items():
+        index_sets = [set_data[s] for s in spec.user_defined_parameters[p]['index']] \
+            if mb.is_sparse_parameter(default) else None
+        values = {tuple(item['index']): item['value']
+                  for item in mb.get_parameter_elements(current_parameter_data.get(p, []))}
+        for el in mb.get_parameter_elements(default, index_sets):
             # update if parameter was already defined
-            if p in current_parameter_data:
-                for item in current_parameter_data[p]:
-                    if item['index'] == el['index']:
-                        v = item['value']
+            v = values.get(tuple(el['index']), el['value'])
             new_row = pd.DataFrame({'Parameter': p, 'Description': spec.user_defined_parameters[p]['doc'],
                                     'Index': [el['index']], 'Value': v}, index=[0])
             param_dfr = param_dfr.append(new_row, ignore_index=True)
@@ -0,0 +1,349 @@
+"""
+Matrix build engine for GeneralSpecification models.
+
+The constraint matrix, bounds and objective are assembled directly from the parameters of a populated model instance
+as sparse coefficient frames, written to a free MPS file for the solver and the solution loaded back into the pyomo
+variables of the instance, so that mola.output.get_entity works as for a model built from pyomo expressions.
+"""
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+
+
+def get_param_frame(param, columns):
+    """
+    Non-zero values of an indexed parameter as a frame. The stored values are used for a parameter with a zero or no
+    default and every index otherwise.
+
+    :param param: indexed pyomo Param of a concrete model
+    :param list columns: column names for the index of the parameter
+    :return: DataFrame with the index columns and a Value column
+    """
+    default = param.default()
+    if default is pe.Param.NoValue or default == 0:
+        values = dict(param.sparse_items())
+    else:
+        values = {k: param[k] for k in param.index_set()}
+    frame = pd.DataFrame([k if isinstance(k, tuple) else (k,) for k in values], columns=columns)
+    frame['Value'] = np.array([pe.value(v) for v in values.values()], dtype=float)
+
+    return frame[frame['Value'] != 0].reset_index(drop=True)
+
+
+def get_var_frame(var, columns, offset=0):
+    """
+    Index of an indexed variable as a frame with the matrix column of each element.
+
+    :param var: indexed pyomo Var of a concrete model
+    :param list columns: column names for the index of the variable
+    :param int offset: matrix column of the first element
+    :return: DataFrame with the index columns and a Col column
+    """
+    frame = pd.DataFrame([k if isinstance(k, tuple) else (k,) for k in var.index_set()], columns=columns)
+    frame['Col'] = np.arange(offset, offset + len(frame))
+
+    return frame
+
+
+def get_set_frame(columns, *sets):
+    """
+    Product of sets as a frame with a Row column numbering the elements.
+
+    :param list columns: column names for the sets
+    :param sets: pyomo sets or lists
+    :return: DataFrame with a column for each set and a Row column
+    """
+    frame = pd.MultiIndex.from_product([list(s) for s in sets], names=columns).to_frame(index=False)
+    frame['Row'] = np.arange(len(frame))
+
+    return frame
+
+
+class MatrixModel:
+    """
+    A linear program as sparse coefficient frames, which holds the pyomo variable and constraint that each matrix
+    column and row represents.
+    """
+    def __init__(self, variables, constraints, coefficients, objective):
+        """
+        :param variables: DataFrame of Var, Index and Binary columns with a row for each matrix column
+        :param constraints: DataFrame of Constraint, Index, Sense and RHS columns with a row for each matrix row
+        :param coefficients: DataFrame of non-zero Row, Col and Value entries of the constraint matrix
+        :param objective: Series of objective coefficients indexed by matrix column
+        """
+        self.variables = variables
+        self.constraints = constraints
+        self.coefficients = coefficients
+        self.objective = objective
+
+    def write_mps(self, file_name):
+        """
+        Writes the model as a free MPS file with rows named R<row> and columns named C<col>, minimising the
+        objective.
+
+        :param str file_name: path of the MPS file
+        """
+        objective = pd.DataFrame({'Row': -1, 'Col': self.objective.index, 'Value': self.objective.values})
+        # every column needs an entry to be declared, so columns without coefficients get a zero objective entry
+        missing = np.setdiff1d(np.arange(len(self.variables)),
+                               np.concatenate([self.coefficients['Col'].values, objective['Col'].values]))
+        columns = pd.concat([objective, self.coefficients, pd.DataFrame({'Row': -1, 'Col': missing, 'Value': 0.0})],
+                            ignore_index=True).sort_values(['Col', 'Row'], kind='stable')
+        row_names = np.where(columns['Row'] < 0, 'OBJ', 'R' + columns['Row'].astype(str))
+        rhs = self.constraints[self.constraints['RHS'] != 0]
+
+        with open(file_name, 'w') as fp:
+            fp.write('NAME mola\nROWS\n N OBJ\n')
+            fp.writelines(' ' + self.constraints['Sense'] + ' R' + self.constraints.index.astype(str) + '\n')
+            fp.write('COLUMNS\n')
+            fp.writelines(' C' + columns['Col'].astype(str) + ' ' + row_names + ' ' +
+                          columns['Value'].map('{:.17g}'.format) + '\n')
+            fp.write('RHS\n')
+            fp.writelines(' RHS R' + rhs.index.astype(str) + ' ' + rhs['RHS'].map('{:.17g}'.format) + '\n')
+            fp.write('BOUNDS\n')
+            fp.writelines(' BV BND C' + self.variables.index[self.variables['Binary'].values].astype(str) + '\n')
+            fp.write('ENDATA\n')
+
+    def load_solution(self, model_instance, values):
+        """
+        Sets the variables of a model instance to the solution values of the matrix columns.
+
+        :param model_instance: concrete model the matrix was built from
+        :param values: array of solution values indexed by matrix column
+        """
+        # binary columns are rounded so that the values are in the domain of their variables
+        values = np.where(self.variables['Binary'].values, np.round(values), values)
+        for (var, index), value in zip(self.variables[['Var', 'Index']].itertuples(index=False), values):
+            model_instance.component(var)[index].value = float(value)
+
+
+def get_objectives(model_instance):
+    """
+    Objectives of a GeneralSpecification model that can be passed to build_general_matrix and solve.
+
+    :param model_instance: concrete model populated by GeneralSpecification
+    :return: dict of objectives keyed by name
+    """
+    objectives = {'Environmental_Cost_Impact': 'Environmental_Cost_Impact', 'Cost': 'Cost'}
+    objectives.update({'Environmental_Impact[%s]' % kpi: ('Environmental_Impact', kpi) for kpi in model_instance.KPI})
+
+    return objectives
+
+
+def get_objective(model_instance, objective, flow, ssf, stf):
+    """
+    Coefficients of a GeneralSpecification objective.
+
+    :param model_instance: concrete model populated by GeneralSpecification
+    :param objective: Cost, Environmental_Cost_Impact, Environmental_Impact with a single KPI or a tuple of
+        Environmental_Impact and a KPI
+    :param flow: variable frame of Flow
+    :param ssf: variable frame of Storage_Service_Flow
+    :param stf: variable frame of Specific_Transport_Flow
+    :return: Series of objective coefficients indexed by matrix column
+    """
+    m = model_instance
+    # product flows in the objective
+    product_flows = pd.concat([
+        flow.rename(columns={'fm': 'f', 'pm': 'p'}),
+        ssf[ssf['f'].isin(list(m.F_s)) & ssf['p'].isin(list(m.P_s))],
+        stf.rename(columns={'ft': 'f', 'pt': 'p'})
+    ], ignore_index=True)
+
+    def environment(kpis):
+        ei = get_param_frame(m.EI, ['kpi', 'f', 'p'])
+        ei = ei[ei['kpi'].isin(list(kpis))]
+        return ei.merge(product_flows, on=['f', 'p'])[['kpi', 'Col', 'Value']]
+
+    def cost():
+        phi = get_param_frame(m.phi, ['f', 'p', 't'])
+        return phi.merge(product_flows, on=['f', 'p', 't'])[['Col', 'Value']]
+
+    if objective == 'Environmental_Impact' and len(m.KPI) == 1:
+        objective = ('Environmental_Impact', m.KPI.first())
+    if objective == 'Cost':
+        terms = cost()
+    elif objective == 'Environmental_Cost_Impact':
+        env = environment(m.KPI)
+        env['Value'] *= pe.value(m.u['environment']) * env['kpi'].map({kpi: pe.value(m.w[kpi]) for kpi in m.KPI})
+        terms = cost()
+        terms['Value'] *= pe.value(m.u['cost'])
+        terms = pd.concat([env[['Col', 'Value']], terms], ignore_index=True)
+    elif isinstance(objective, tuple) and objective[0] == 'Environmental_Impact' and objective[1] in m.KPI:
+        terms = environment([objective[1]])
+    else:
+        raise ValueError('Unknown objective %s' % str(objective))
+
+    terms = terms.groupby('Col')['Value'].sum()
+    return terms[terms != 0]
+
+
+def build_general_matrix(model_instance, objective='Environmental_Cost_Impact'):
+    """
+    Assembles the constraints and an objective of a GeneralSpecification model as a MatrixModel, from a model
+    instance populated with the matrix_build setting and so without pyomo constraints and objectives.
+
+    :param model_instance: concrete model populated by GeneralSpecification
+    :param objective: name of the objective, see get_objective
+    :return: MatrixModel
+    """
+    m = model_instance
+
+    # variables
+    var_columns = [
+        ('Flow', ['fm', 'pm', 'k', 't']),
+        ('Storage_Service_Flow', ['f', 'p', 'k', 't']),
+        ('Specific_Material_Transport_Flow', ['fm', 'pm', 'ft', 'pt', 'k', 't']),
+        ('Specific_Transport_Flow', ['ft', 'pt', 'k', 't']),
+        ('Demand_Selection', ['d', 'k', 't'])
+    ]
+    var_frames = {}
+    offset = 0
+    for name, columns in var_columns:
+        var_frames[name] = get_var_frame(m.component(name), columns, offset)
+        offset += len(var_frames[name])
+    flow, ssf, smtf, stf, ds = var_frames.values()
+    variables = pd.concat([
+        pd.DataFrame({'Var': name, 'Index': list(m.component(name).index_set()),
+                      'Binary': name == 'Demand_Selection'}, columns=['Var', 'Index', 'Binary'])
+        for name, _ in var_columns], ignore_index=True)
+
+    # parameters
+    c = get_param_frame(m.C, ['fm', 'k', 'd', 't'])
+    j = get_param_frame(m.J, ['fm', 'pm', 'ft', 'pt'])
+    ssf_m = ssf[ssf['p'].isin(list(m.P_m))].rename(columns={'f': 'fm', 'p': 'pm'})
+
+    # constraints as (name, rows, sense, rhs, terms) where terms are Row, Col and Value frames numbered by rows
+    families = []
+
+    rows = get_set_frame(['d', 'k'], m.D, m.K)
+    terms = c.merge(flow, on=['fm', 'k', 't']).merge(rows, on=['d', 'k'])
+    rhs = [pe.value(m.Total_Demand[d, k]) for d, k in zip(rows['d'], rows['k'])]
+    families.append(('total_demand_constraint', rows, 'G', rhs, terms))
+
+    rows = flow.drop(columns='Col').assign(Row=np.arange(len(flow)))
+    material = smtf.merge(j, on=['fm', 'pm', 'ft', 'pt']).merge(rows, on=['fm', 'pm', 'k', 't'])
+    terms = pd.concat([rows.assign(Col=flow['Col'].values, Value=1.0), material.assign(Value=-material['Value'])])
+    families.append(('material_flow_constraint', rows, 'E', 0, terms))
+
+    rows = stf.drop(columns='Col').assign(Row=np.arange(len(stf)))
+    transport = smtf.merge(j, on=['fm', 'pm', 'ft', 'pt']) \
+        .merge(get_param_frame(m.UC, ['fm', 'pm', 'ft', 'pt']), on=['fm', 'pm', 'ft', 'pt'], suffixes=('', '_uc')) \
+        .merge(get_param_frame(m.dd, ['pm', 'fm', 'k', 't']), on=['pm', 'fm', 'k', 't'], suffixes=('', '_dd')) \
+        .merge(rows, on=['ft', 'pt', 'k', 't'])
+    transport['Value'] = -transport['Value'] * transport['Value_uc'] * transport['Value_dd']
+    terms = pd.concat([rows.assign(Col=stf['Col'].values, Value=1.0), transport])
+    families.append(('transport_constraint', rows, 'E', 0, terms))
+
+    rows = get_set_frame(['k', 't'], m.K, m.T)
+    terms = ds.merge(rows, on=['k', 't']).assign(Value=1.0)
+    families.append(('demand_selection_constraint', rows, 'E', 1, terms))
+
+    rows = get_set_frame(['d', 'k', 't'], m.D, m.K, m.T)
+    time = list(m.T)
+    c_later = c[c['t'] != time[0]]
+    storage = c_later.merge(ssf_m, on=['fm', 'k', 't'])
+    carried = c_later.assign(t=c_later['t'].map(dict(zip(time[1:], time[:-1])))).merge(ssf_m, on=['fm', 'k', 't'])
+    carried['t'] = carried['t'].map(dict(zip(time[:-1], time[1:])))
+    demand = get_param_frame(m.Demand, ['d', 'k', 't']).merge(ds, on=['d', 'k', 't'])
+    terms = pd.concat([c.merge(flow, on=['fm', 'k', 't']), storage.assign(Value=-storage['Value']), carried,
+                       demand.assign(Value=-demand['Value'])]).merge(rows, on=['d', 'k', 't'])
+    families.append(('specific_demand_constraint', rows, 'G', 0, terms))
+
+    rows = get_set_frame(['fs', 'ps', 'k', 't'], m.F_s, m.P_s, m.K, m.T)
+    service = get_param_frame(m.L, ['fm', 'pm', 'fs', 'ps']).merge(rows, on=['fs', 'ps'])\
+        .merge(ssf_m, on=['fm', 'pm', 'k', 't'])
+    terms = pd.concat([rows.merge(ssf.rename(columns={'f': 'fs', 'p': 'ps'}), on=['fs', 'ps', 'k', 't'])
+                       .assign(Value=1.0), service.assign(Value=-service['Value'])])
+    families.append(('service_flow_link_constraint', rows, 'E', 0, terms))
+
+    # port equalities of the arcs between different tasks, the arcs of a task to itself are trivial
+    if len(m.calA) > 0:
+        port = pd.concat([
+            get_param_frame(m.calA, ['fm', 'pm', 'k', 't']).merge(flow, on=['fm', 'pm', 'k', 't']),
+            get_param_frame(m.calB, ['fm', 'pm', 'k', 't']).merge(ssf_m, on=['fm', 'pm', 'k', 't']),
+            get_param_frame(m.calC, ['fm', 'pm', 'ft', 'pt', 'k', 't']).merge(smtf,
+                                                                             on=['fm', 'pm', 'ft', 'pt', 'k', 't'])
+        ])[['k', 't', 'Col', 'Value']]
+        arcs = [(k1, k2) for k1, k2 in m.task_link if k1 != k2 and m.Arc[k1, k2]]
+        rows = pd.DataFrame([(k1, k2, t) for k1, k2 in arcs for t in m.T], columns=['k1', 'k2', 't'])
+        rows['Row'] = np.arange(len(rows))
+        source = rows.merge(port.rename(columns={'k': 'k1'}), on=['k1', 't'])
+        destination = rows.merge(port.rename(columns={'k': 'k2'}), on=['k2', 't'])
+        terms = pd.concat([source, destination.assign(Value=-destination['Value'])])
+        families.append(('task_arc_flow_equality', rows, 'E', 0, terms))
+
+    # number the rows of the constraint families in turn
+    constraints, coefficients = [], []
+    offset = 0
+    for name, rows, sense, rhs, terms in families:
+        index = list(rows.drop(columns='Row').itertuples(index=False, name=None))
+        constraints.append(pd.DataFrame({'Constraint': name, 'Index': index, 'Sense': sense, 'RHS': rhs},
+                                        columns=['Constraint', 'Index', 'Sense', 'RHS']))
+        coefficients.append(pd.DataFrame({'Row': terms['Row'].values + offset, 'Col': terms['Col'].values,
+                                          'Value': terms['Value'].values}))
+        offset += len(rows)
+    constraints = pd.concat(constraints, ignore_index=True)
+    coefficients = pd.concat(coefficients, ignore_index=True).groupby(['Row', 'Col'], as_index=False)['Value'].sum()
+    coefficients = coefficients[coefficients['Value'] != 0].reset_index(drop=True)
+
+    return MatrixModel(variables, constraints, coefficients, get_objective(m, objective, flow, ssf, stf))
+
+
+def read_glpk_solution(file_name):
+    """
+    Reads a solution written by glpsol with the -w option.
+
+    :param str file_name: path of the solution file
+    :return: tuple of the solution status, objective value and array of column values
+    """
+    status, objective, values = None, None, {}
+    with open(file_name) as fp:
+        for line in fp:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 's':
+                kind = fields[1]
+                # basic solutions have primal and dual status, integer solutions a single status
+                status = fields[4]
+                objective = float(fields[-1])
+            elif fields[0] == 'j':
+                values[int(fields[1]) - 1] = float(fields[3] if kind == 'bas' else fields[2])
+
+    return status, objective, np.array([values[i] for i in range(len(values))])
+
+
+def solve(model_instance, objective='Environmental_Cost_Impact', executable='glpsol', keepfiles=False):
+    """
+    Solves a GeneralSpecification model instance with glpk by writing its matrix to an MPS file, and loads an optimal
+    or feasible solution into the instance variables.
+
+    :param model_instance: concrete model populated by GeneralSpecification with the matrix_build setting
+    :param objective: name of the objective, see get_objective
+    :param str executable: glpk command line solver
+    :param bool keepfiles: keep the MPS and solution files in the temporary directory
+    :return: dict of the solver Status, Objective value, Log and the Directory of the files if kept
+    """
+    matrix = build_general_matrix(model_instance, objective)
+    tmp_dir = tempfile.mkdtemp(prefix='mola_')
+    mps_file, solution_file = os.path.join(tmp_dir, 'model.mps'), os.path.join(tmp_dir, 'model.sol')
+    matrix.write_mps(mps_file)
+    run = subprocess.run([executable, '--freemps', mps_file, '--min', '-w', solution_file],
+                         capture_output=True, text=True)
+    if run.returncode != 0 or not os.path.exists(solution_file):
+        raise RuntimeError('%s failed:\n%s' % (executable, run.stdout + run.stderr))
+
+    status, value, values = read_glpk_solution(solution_file)
+    if status in ['o', 'f']:
+        matrix.load_solution(model_instance, values)
+    if not keepfiles:
+        os.remove(mps_file)
+        os.remove(solution_file)
+        os.rmdir(tmp_dir)
+
+    return {'Status': status, 'Objective': value, 'Log': run.stdout, 'Directory': tmp_dir if keepfiles else None}
@@ -48,6 +48,49 @@ def get_parameters_frame(model_instance, max_object_size=100, active=None):
     return param_df
 
 
+def get_component_bytes(cpt):
+    """
+    Approximate memory of a pyomo component from the sizes of the component, its data dict, index keys and data
+    objects and the members of sets. Objects referenced by the data such as index strings and expressions are not
+    counted.
+
+    :param cpt: pyomo component
+    :return: int number of bytes
+    """
+    size = sys.getsizeof(cpt)
+    data = getattr(cpt, '_data', {})
+    size += sys.getsizeof(data)
+    for key, obj in data.items():
+        size += sys.getsizeof(key)
+        if obj is not cpt:
+            size += sys.getsizeof(obj)
+        values = getattr(obj, '_values', None)
+        if values is not None:
+            size += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+
+    return size
+
+
+def get_footprint_frame(model_instance, active=None):
+    """
+    Get a model footprint report of the number of elements and approximate memory of each component in a pyomo
+    model, see get_component_bytes.
+
+    :param model_instance: concrete pyomo model
+    :param active: active components only?
+    :return: DataFrame sorted by memory
+    """
+    def get_footprints():
+        for o in model_instance.component_objects(active=active):
+            # params with a default have an element for each index but only store the values set
+            stored = len(o) if o.ctype is pe.Set else len(getattr(o, '_data', o))
+            yield [o.name, o.ctype.__name__, len(o), stored, get_component_bytes(o)]
+    footprint_df = pd.DataFrame(get_footprints(), columns=['Component', 'Type', 'Number of elements',
+                                                           'Stored elements', 'Approximate bytes'])
+
+    return footprint_df.sort_values('Approximate bytes', ascending=False, ignore_index=True)
+
+
 def get_constraints_frame(model_instance, explode=False, active=None):
     constraints_df = pd.DataFrame(
         ([o.name, [index for index in o], [str(o[index].expr) for index in o]] for o in
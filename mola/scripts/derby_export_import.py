@@ -45,16 +45,20 @@ db_dir = csv_path.joinpath(db)
 # convert Derby database to CSV
 conn = di.get_jdbc_connection(derby_db_dir.joinpath(db), derby_driver)
 table_names = di.get_derby_tables(conn)
-table_cols = di.get_derby_table_column_names(conn, table_names)
+table_types = di.get_derby_table_column_types(conn, table_names)
 csv_output_dir = di.derby_to_csv(conn, db_dir, separate_lob=True)
 conn.close()
 
 # generate sqlite db
 sqlite_file = sqlite_dir.joinpath('CSV_' + csv_output_dir.name + '.sqlite')
-di.csv_to_sqlite(csv_output_dir, sqlite_file, table_cols, chunk_size=1000000)
-di.create_csv_indices(sqlite_file)
+di.csv_to_sqlite(csv_output_dir, sqlite_file, None, chunk_size=1000000, bulk_load=True, table_types=table_types)
+di.build_sparse_matrices(sqlite_file)
 
-# compress the sqlite file
+# compress the sqlite file with its sparse matrices, which are extracted next to it on import
 zip_file = zip_dir.joinpath(sqlite_file.with_suffix('.zip').name)
-zipfile.ZipFile(zip_file, mode='w', compression=zipfile.ZIP_DEFLATED).write(sqlite_file, arcname=sqlite_file.name)
+matrix_dir = Path(di.get_sparse_matrix_folder(sqlite_file))
+with zipfile.ZipFile(zip_file, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+    zf.write(sqlite_file, arcname=sqlite_file.name)
+    for matrix_file in sorted(matrix_dir.rglob('*')):
+        zf.write(matrix_file, arcname=matrix_file.relative_to(sqlite_dir).as_posix())
 print('Generated', zip_file)
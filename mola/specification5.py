@@ -4,7 +4,10 @@ A Specification object contains a pyomo model and methods to build the model.
 """
 import pygeodesy.formy as pygeo
 import math
+import itertools
+import functools
 
+import numpy as np
 import pandas as pd
 import pyomo.environ as pe
 from pyomo.environ import units as pu
@@ -13,7 +16,9 @@ import pyomo.network as pn
 
 import mola.sqlgenerator as sq
 import mola.dataimport as di
+import mola.dataview as dv
 import mola.build as mb
+from mola import Package
 
 # units
 pu.load_definitions_from_strings([
@@ -29,6 +34,145 @@ pu.load_definitions_from_strings([
 ])
 
 
+def get_impact_intensity(impact_factors, process_breakdown, kpis, elementary_flows, flows, processes):
+    """
+    Impact of a unit of product flow from a process for each KPI, EI = sum over E of Ef * EF.
+
+    Computed as a sparse product over the non-zero entries of Ef and EF rather than by summing over every
+    elementary flow for each KPI, flow and process.
+
+    :param dict impact_factors: Ef parameter data keyed by (kpi, e) or None if not loaded e.g. with no KPIs
+    :param dict process_breakdown: EF parameter data keyed by (e, f, p) or None if not loaded
+    :param kpis: KPI set data
+    :param elementary_flows: E set data
+    :param flows: F set data
+    :param processes: P set data
+    :return: EI parameter data keyed by (kpi, f, p)
+    """
+    if not impact_factors or not process_breakdown:
+        return {}
+    ef_dfr = pd.DataFrame(list(impact_factors.keys()), columns=['KPI', 'E'])
+    ef_dfr['Ef'] = list(impact_factors.values())
+    pe_dfr = pd.DataFrame(list(process_breakdown.keys()), columns=['E', 'F', 'P'])
+    pe_dfr['EF'] = list(process_breakdown.values())
+    ef_dfr = ef_dfr[ef_dfr['KPI'].isin(list(kpis)) & ef_dfr['E'].isin(list(elementary_flows)) & (ef_dfr['Ef'] != 0)]
+    pe_dfr = pe_dfr[pe_dfr['E'].isin(list(elementary_flows)) & pe_dfr['F'].isin(list(flows)) &
+                    pe_dfr['P'].isin(list(processes)) & (pe_dfr['EF'] != 0)]
+
+    ei_dfr = ef_dfr.merge(pe_dfr, on='E')
+    ei_dfr['EI'] = ei_dfr['Ef'] * ei_dfr['EF']
+    ei = ei_dfr.groupby(['KPI', 'F', 'P'], sort=False)['EI'].sum()
+    return {k: float(v) for k, v in ei.items()}
+
+
+def get_loaded_data(data_portal, name):
+    """
+    :param pe.DataPortal data_portal: model data
+    :param str name: component name
+    :return: data of the component or None if no data was loaded for it e.g. Ef of a model with no KPIs
+    """
+    return data_portal.data(name) if name in data_portal.keys() else None
+
+
+def get_links(link_values, default, index_sets):
+    """
+    Index tuples of a binary link parameter such as J or L that are set, so that variables and constraints are only
+    declared over the links that can carry flow rather than over the full product of the index sets.
+
+    :param dict link_values: parameter data keyed by index tuple, which may be sparse
+    :param default: parameter default for the tuples without a value, None or Param.NoValue for no default
+    :param list index_sets: list of set data making up the parameter index
+    :return: list of index tuples with a non-zero value
+    """
+    if default is None or default is pe.Param.NoValue or not default:
+        return [k for k, v in link_values.items() if v]
+    return [k for k in itertools.product(*index_sets) if link_values.get(k, default)]
+
+
+def get_link_groups(links, group, index_sets):
+    """
+    Links grouped by the index positions of one end of the link, so that a constraint over the processes at that end
+    iterates only its own links rather than scanning all of them.
+
+    :param list links: link index tuples from get_links
+    :param list group: positions in each link tuple of the group key e.g. [0, 1] for the material flow and process
+    :param list index_sets: list of set data making up the group key, every key gets a possibly empty group
+    :return: dict of lists of the remaining link positions keyed by group
+    """
+    groups = {k: [] for k in itertools.product(*index_sets)}
+    for link in links:
+        groups[tuple(link[i] for i in group)].append(tuple(v for i, v in enumerate(link) if i not in group))
+    return groups
+
+
+@functools.lru_cache(maxsize=16)
+def get_haversine_distances(process_coordinates, task_coordinates):
+    """
+    Great circle distances between process and task locations using the haversine formula in a single vectorised
+    pass, memoised by the coordinates so that rebuilding a model with unchanged locations does no work.
+
+    :param tuple process_coordinates: tuple of (longitude, latitude) pairs of processes in degrees
+    :param tuple task_coordinates: tuple of (longitude, latitude) pairs of tasks in degrees
+    :return: read-only numpy array of distances in km with a row for each process and a column for each task
+    """
+    lon1, lat1 = np.radians(np.array(process_coordinates, dtype=float).reshape(-1, 2)).T
+    lon2, lat2 = np.radians(np.array(task_coordinates, dtype=float).reshape(-1, 2)).T
+    with np.errstate(invalid='ignore'):
+        h = np.sin((lat2[None, :] - lat1[:, None]) / 2) ** 2 + \
+            np.cos(lat1[:, None]) * np.cos(lat2[None, :]) * np.sin((lon2[None, :] - lon1[:, None]) / 2) ** 2
+        distances = 2 * np.arctan2(np.sqrt(h), np.sqrt(1 - h)) * pygeo.R_M / 1000
+    distances.flags.writeable = False
+    return distances
+
+
+@functools.lru_cache(maxsize=None)
+def get_abstract_model(spec_class, settings, mutable_parameters):
+    """
+    Abstract model of a Specification class, built once for each combination of settings and shared by its
+    Specification objects. Creating a Specification to read its default sets and parameters does not build a model.
+
+    :param spec_class: Specification class
+    :param tuple settings: sorted (name, value) pairs of the specification settings
+    :param bool mutable_parameters: build.mutable_parameters package setting the model is built with
+    :return: pyomo AbstractModel
+    """
+    return spec_class.build_abstract_model()
+
+
+@functools.lru_cache(maxsize=None)
+def get_matrix_abstract_model(spec_class, settings, mutable_parameters):
+    """
+    Abstract model of a Specification class without constraints, objectives, ports and arcs for the matrix_build
+    setting, built once for each combination of settings like get_abstract_model.
+
+    :param spec_class: Specification class
+    :param tuple settings: sorted (name, value) pairs of the specification settings
+    :param bool mutable_parameters: build.mutable_parameters package setting the model is built with
+    :return: pyomo AbstractModel
+    """
+    abstract_model = spec_class.build_abstract_model()
+    for cpt in list(abstract_model.component_objects([pe.Constraint, pe.Objective, pn.Port, pn.Arc],
+                                                     descend_into=False)):
+        abstract_model.del_component(cpt)
+    return abstract_model
+
+
+def restores_parameter_defaults(method):
+    """
+    Decorator of the Specification methods that load sparse parameters, which set the defaults of the shared abstract
+    model. The defaults of the specification are restored before and after the method so they never leak into
+    another model.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.reset_parameter_defaults()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.reset_parameter_defaults()
+    return wrapper
+
+
 class Specification:
     """ Abstract Specification of a Pyomo model for configuration in a GUI """
     name: str
@@ -40,17 +184,44 @@ class Specification:
     controllers: dict
     default_settings: dict
     viewers: dict
+    structural_parameters: list
 
     def __init__(self):
         if type(self) is Specification:
             raise NotImplementedError()
 
+    @property
+    def abstract_model(self):
+        """ Abstract model built on first use with get_abstract_model """
+        return get_abstract_model(type(self), tuple(sorted(self.settings.items())),
+                                  Package.config('build.mutable_parameters'))
+
+    @property
+    def matrix_abstract_model(self):
+        """ Abstract model without constraints and objectives built on first use with get_matrix_abstract_model """
+        return get_matrix_abstract_model(type(self), tuple(sorted(self.settings.items())),
+                                         Package.config('build.mutable_parameters'))
+
+    @classmethod
+    def build_abstract_model(cls):
+        """ Returns a new abstract model of the specification """
+        raise NotImplementedError()
+
+    def reset_parameter_defaults(self):
+        """ Restore the user parameter defaults of the shared abstract models after loading sparse parameters """
+        abstract_models = [self.abstract_model]
+        if self.settings.get('matrix_build', False):
+            abstract_models.append(self.matrix_abstract_model)
+        for abstract_model in abstract_models:
+            for param, val in self.user_defined_parameters.items():
+                abstract_model.component(param).set_default(val.get('default', pe.Param.NoValue))
+
     def build_network(self):
         """ Dynamically build model network using Ports and Arcs """
         pass
 
     def populate(self, json_files: list, db_file: str):
-        """ Make abstract model concrete using db_file and json files """
+        """ Make abstract model concrete using db_file and json files or dicts of sets and parameters """
         pass
 
     def get_default_sets(self):
@@ -70,7 +241,6 @@ class Specification:
         return {}
 
 
-# TODO remove the unneeded large db sets from the specification that affect the size of the model and so performance
 class GeneralSpecification(Specification):
     """
     General pyomo specification
@@ -89,37 +259,42 @@ class GeneralSpecification(Specification):
         'KPI': {'doc': 'Performance indicators for optimisation problem', 'lookup': True},
     }
     db_sets = {
-        'AF': 'All flows in openLCA database',
-        'E': 'Elementary Flows in OpenLCA database',
-        'AP': 'All processes from in OpenLCA database',
-        'AKPI': 'All key performance indicators in an openLCA database',
+        'E': 'Elementary flows in the exchanges of the processes in the optimisation problem',
     }
     user_defined_parameters = {
-        'C': {'index': ['F_m', 'K', 'D', 'T'], 'doc': 'Conversion factor for material flows', 'unit': pu.D/pu.P_m},
-        'U': {'index': ['F_m', 'F_t'], 'doc': '(NOT USED) Conversion factor for material flow units in transport flow units',
+        'C': {'index': ['F_m', 'K', 'D', 'T'], 'default': 0, 'doc': 'Conversion factor for material flows',
+              'unit': pu.D/pu.P_m},
+        'U': {'index': ['F_m', 'F_t'], 'default': 0.001,
+              'doc': '(NOT USED) Conversion factor for material flow units in transport flow units',
               'unit': pu.P_t / pu.P_m},
-        'Demand': {'index': ['D', 'K', 'T'], 'doc': 'Specific demand', 'unit': pu.D},
-        'Total_Demand': {'index': ['D', 'K'], 'doc': 'Total demand', 'unit': pu.D},
-        'L': {'index': ['F_m', 'P_m', 'F_s', 'P_s'], 'doc': 'Binary conversion factor between service flows',
+        'Demand': {'index': ['D', 'K', 'T'], 'default': 0, 'doc': 'Specific demand', 'unit': pu.D},
+        'Total_Demand': {'index': ['D', 'K'], 'default': 0, 'doc': 'Total demand', 'unit': pu.D},
+        'L': {'index': ['F_m', 'P_m', 'F_s', 'P_s'], 'default': 0,
+              'doc': 'Binary conversion factor between service flows',
               'within': 'Binary', 'nodes': [1, 3], 'edges': [0, 2]},
-        'X': {'index': ['K', 'T'], 'doc': 'Longitude', 'unit': pu.degree},
-        'Y': {'index': ['K', 'T'], 'doc': 'Latitude', 'unit': pu.degree},
-        'd': {'index': ['P_m', 'F_m', 'K', 'T'], 'doc': 'Distance', 'unit': pu.km},
-        'J': {'index': ['F_m', 'P_m', 'F_t', 'P_t'],
+        'X': {'index': ['K', 'T'], 'default': math.inf, 'doc': 'Longitude', 'unit': pu.degree},
+        'Y': {'index': ['K', 'T'], 'default': math.inf, 'doc': 'Latitude', 'unit': pu.degree},
+        'd': {'index': ['P_m', 'F_m', 'K', 'T'], 'default': 0, 'doc': 'Distance', 'unit': pu.km},
+        'J': {'index': ['F_m', 'P_m', 'F_t', 'P_t'], 'default': 0,
               'doc': 'Binary conversion factor between material and transport flows', 'within': 'Binary',
               'nodes': [1, 3], 'edges': [0, 2]},
-        'w': {'index': ['KPI'], 'doc': 'Environmental objective weights', 'unit': pu.KPI_ref/pu.KPI},
-        'u': {'index': ['OBJ'], 'doc': 'Objective weights', 'unit': pu.Output/pu.OBJ},
-        'calA': {'index': ['F_m', 'P_m', 'K', 'T'], 'doc': 'Material flow task coefficient'},
-        'calB': {'index': ['F_m', 'P_m', 'K', 'T'], 'doc': 'Service flow task coefficient'},
-        'calC': {'index': ['F_m', 'P_m', 'F_t', 'P_t', 'K', 'T'], 'doc': 'Transport flow task coefficient'},
-        'Arc': {'index': ['K', 'K'], 'doc': 'Arc to link tasks',
+        'w': {'index': ['KPI'], 'default': 0, 'doc': 'Environmental objective weights', 'unit': pu.KPI_ref/pu.KPI},
+        'u': {'index': ['OBJ'], 'default': 1, 'doc': 'Objective weights', 'unit': pu.Output/pu.OBJ},
+        'calA': {'index': ['F_m', 'P_m', 'K', 'T'], 'default': 0, 'doc': 'Material flow task coefficient'},
+        'calB': {'index': ['F_m', 'P_m', 'K', 'T'], 'default': 0, 'doc': 'Service flow task coefficient'},
+        'calC': {'index': ['F_m', 'P_m', 'F_t', 'P_t', 'K', 'T'], 'default': 0,
+                 'doc': 'Transport flow task coefficient'},
+        'Arc': {'index': ['K', 'K'], 'default': 0, 'doc': 'Arc to link tasks',
                 'within': 'Binary', 'nodes': [0, 1]},
     }
+    # user parameters that define the model structure or db parameters in populate, so are never mutable
+    structural_parameters = ['J', 'L', 'Arc', 'X', 'Y', 'd']
     # db parameters need to be constructed explicitly
     controllers = {"Standard": "StandardController"}
     default_settings = {
         'distance_calculated': {'value': False, 'type': 'boolean', 'doc': 'Calculate distance using openLCA data'},
+        'matrix_build': {'value': False, 'type': 'boolean',
+                         'doc': 'Build constraints and objectives as matrices for mola.matrix.solve'},
         'test_setting': {'value': False, 'type': 'boolean', 'doc': 'Test Setting'}
     }
 
@@ -128,11 +303,15 @@ class GeneralSpecification(Specification):
         # instance object to hold just the setting values
         self.settings = {k: v['value'] for k, v in self.default_settings.items()}
 
+    @classmethod
+    def build_abstract_model(cls):
+        """ Returns a new abstract model of the specification, see Specification.abstract_model """
+
         # setup abstract model
-        abstract_model = self.abstract_model = pe.AbstractModel()
+        abstract_model = pe.AbstractModel()
 
         # user-defined sets
-        for s, d in self.user_defined_sets.items():
+        for s, d in cls.user_defined_sets.items():
             abstract_model.add_component(s, pe.Set(doc=d['doc']))
 
         abstract_model.F = abstract_model.F_m | abstract_model.F_t | abstract_model.F_s
@@ -142,11 +321,11 @@ class GeneralSpecification(Specification):
         abstract_model.OBJ = pe.Set(doc='Set of objective functions')
 
         # Database sets
-        for var, doc in self.db_sets.items():
+        for var, doc in cls.db_sets.items():
             abstract_model.add_component(var, pe.Set(doc=doc))
 
         # User-defined parameters
-        for param, val in self.user_defined_parameters.items():
+        for param, val in cls.user_defined_parameters.items():
             idx = [abstract_model.component(i) for i in val['index']]
             if 'within' in val and val['within'] == 'Binary':
                 within = pe.Binary
@@ -156,34 +335,50 @@ class GeneralSpecification(Specification):
                 unit = val['unit']
             else:
                 unit = None
-            abstract_model.add_component(param, pe.Param(*idx, doc=val['doc'], within=within, units=unit))
+            # parameters with a default are stored sparsely with only their other values
+            default = val.get('default', pe.Param.NoValue)
+            # mutable parameters can be updated in a built model with mola.build.update_instance, pyomo requires
+            # parameters with units to be mutable
+            mutable = bool(Package.config('build.mutable_parameters') and param not in cls.structural_parameters) \
+                or unit is not None
+            abstract_model.add_component(param, pe.Param(*idx, doc=val['doc'], within=within, units=unit,
+                                                         default=default, mutable=mutable))
+
+        # links that can carry flow, from the non-zero values of J and L
+        abstract_model.JL = pe.Set(within=abstract_model.F_m * abstract_model.P_m * abstract_model.F_t *
+                                   abstract_model.P_t, doc='Links between material and transport flows in J')
+        abstract_model.LL = pe.Set(within=abstract_model.F_m * abstract_model.P_m * abstract_model.F_s *
+                                   abstract_model.P_s, doc='Links between material and service flows in L')
+        abstract_model.JL_m = pe.Set(abstract_model.F_m, abstract_model.P_m,
+                                     within=abstract_model.F_t * abstract_model.P_t,
+                                     doc='Transport links of JL by material')
+        abstract_model.JL_t = pe.Set(abstract_model.F_t, abstract_model.P_t,
+                                     within=abstract_model.F_m * abstract_model.P_m,
+                                     doc='Material links of JL by transport')
+        abstract_model.LL_s = pe.Set(abstract_model.F_s, abstract_model.P_s,
+                                     within=abstract_model.F_m * abstract_model.P_m,
+                                     doc='Material links of LL by service')
 
         # Database parameters
         abstract_model.Ef = pe.Param(abstract_model.KPI, abstract_model.E, default=0)
         abstract_model.EF = pe.Param(abstract_model.E, abstract_model.F, abstract_model.P, default=0)
         abstract_model.phi = pe.Param(abstract_model.F, abstract_model.P, abstract_model.T, default=0)
 
-        def ei_rule(model, kpi, f, p):
-            return sum(model.Ef[kpi, e]*model.EF[e, f, p] for e in model.E)
-        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, rule=ei_rule)
+        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, default=0,
+                                     doc="Impact of product flow from process, the sparse product of Ef and EF")
         abstract_model.XI = pe.Param(abstract_model.P_m, abstract_model.F_m, doc="Longitude", units=pu.degree)
         abstract_model.YI = pe.Param(abstract_model.P_m, abstract_model.F_m, doc="Latitude", units=pu.degree)
 
         # Unit conversion factors
         abstract_model.UU = pe.Param(abstract_model.F, abstract_model.P, default='', within=pe.Any)
+        abstract_model.UC = pe.Param(abstract_model.JL,
+                                     doc='Conversion factor from material flow units times km to transport flow units')
 
-        # distances calculated from db
+        # distances calculated from db locations are loaded in populate, otherwise the user distance is used
         def distance_rule(model, pm, fm, k, t):
-            if self.settings['distance_calculated']:
-                # need to strip units for call to pygeo.haversine
-                return pygeo.haversine(
-                    model.Y[k, t].value, model.X[k, t].value,
-                    model.YI[pm, fm].value, model.XI[pm, fm].value) / 1000 * pu.km
-            else:
-                return model.d[pm, fm, k, t]
-        self.abstract_model.dd = pe.Param(abstract_model.P_m, abstract_model.F_m, abstract_model.K,
-                                          abstract_model.T, rule=distance_rule, doc='Calculated distance',
-                                          units=pu.km)
+            return model.d[pm, fm, k, t]
+        abstract_model.dd = pe.Param(abstract_model.P_m, abstract_model.F_m, abstract_model.K,
+                                     abstract_model.T, rule=distance_rule, doc='Calculated distance', units=pu.km)
 
         # Variables
         abstract_model.Flow = pe.Var(abstract_model.F_m, abstract_model.P_m, abstract_model.K, abstract_model.T,
@@ -191,8 +386,7 @@ class GeneralSpecification(Specification):
         abstract_model.Storage_Service_Flow = pe.Var(abstract_model.F, abstract_model.P, abstract_model.K,
                                                      abstract_model.T, within=pe.NonNegativeReals,
                                                      doc='Storage Service Flow', units=pu.P)
-        abstract_model.Specific_Material_Transport_Flow = pe.Var(abstract_model.F_m, abstract_model.P_m,
-                                                                 abstract_model.F_t, abstract_model.P_t,
+        abstract_model.Specific_Material_Transport_Flow = pe.Var(abstract_model.JL,
                                                                  abstract_model.K, abstract_model.T,
                                                                  within=pe.NonNegativeReals,
                                                                  doc='Specific Material Transport Flow',
@@ -246,7 +440,7 @@ class GeneralSpecification(Specification):
         def material_flow_rule(model, fm, pm, k, t):
             return model.Flow[fm, pm, k, t] == sum(model.J[fm, pm, ft, pt] *
                                                    model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t]
-                                                   for ft in model.F_t for pt in model.P_t)
+                                                   for ft, pt in model.JL_m[fm, pm])
         abstract_model.material_flow_constraint = \
             pe.Constraint(abstract_model.F_m, abstract_model.P_m,
                           abstract_model.K, abstract_model.T, rule=material_flow_rule)
@@ -254,18 +448,11 @@ class GeneralSpecification(Specification):
         def specific_transport_flow_rule(model, ft, pt, k, t):
             rhs = 0
             # sum over connected processes
-            for fm in model.F_m:
-                for pm in model.P_m:
-                    if model.J[fm, pm, ft, pt]:
-                        unit_conversion = pu.convert_value(
-                            1,
-                            from_units=mb.map_units(model.UU[fm, pm]) * pu.km,
-                            to_units=mb.map_units(model.UU[ft, pt])
-                        )
-                        rhs += model.J[fm, pm, ft, pt] * \
-                               unit_conversion * \
-                               model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t] * \
-                               model.dd[pm, fm, k, t]
+            for fm, pm in model.JL_t[ft, pt]:
+                rhs += model.J[fm, pm, ft, pt] * \
+                       model.UC[fm, pm, ft, pt] * \
+                       model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t] * \
+                       model.dd[pm, fm, k, t]
 
             return model.Specific_Transport_Flow[ft, pt, k, t] == rhs
 
@@ -300,7 +487,7 @@ class GeneralSpecification(Specification):
         def service_flow_link_rule(model, fs, ps, k, t):
             return model.Storage_Service_Flow[fs, ps, k, t] == \
                    sum(model.L[fm, pm, fs, ps] * model.Storage_Service_Flow[fm, pm, k, t]
-                       for fm in model.F_m for pm in model.P_m)
+                       for fm, pm in model.LL_s[fs, ps])
 
         abstract_model.service_flow_link_constraint = pe.Constraint(
             abstract_model.F_s, abstract_model.P_s, abstract_model.K, abstract_model.T, rule=service_flow_link_rule)
@@ -313,7 +500,7 @@ class GeneralSpecification(Specification):
                            fm in model.F_m for pm in model.P_m)
                 rhs2 = sum(model.calC[fm, pm, ft, pt, k, t] *
                            model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t] for
-                           fm in model.F_m for pm in model.P_m for ft in model.F_t for pt in model.P_t)
+                           fm, pm, ft, pt in model.JL)
                 port['flow'] = rhs1 + rhs2
             return port
 
@@ -333,54 +520,64 @@ class GeneralSpecification(Specification):
         abstract_model.task_arc = pn.Arc(abstract_model.task_link, abstract_model.T,
                                          rule=task_arc_rule)
 
+        return abstract_model
 
+    @restores_parameter_defaults
     def populate(self, json_files=None, elementary_flow_ref_ids=None,
                  db_file=di.get_default_db_file()):
 
         olca_dp = pyod.DataPortal()
 
-        # user data
-        for json_file in json_files:
-            if json_file:
-                olca_dp.load(filename=json_file)
+        # user data, the sparse parameters of which set defaults in the shared abstract model
+        for user_data in json_files:
+            if user_data:
+                mb.load_data(olca_dp, user_data, self.abstract_model)
 
-        # simple set data from db (this data is not currently using in the model)
-        olca_dp.load(filename=db_file, using='sqlite3', query="SELECT REF_ID FROM TBL_FLOWS",
-                     set=self.abstract_model.AF)
-        olca_dp.load(filename=db_file, using='sqlite3', query="SELECT REF_ID FROM TBL_PROCESSES",
-                     set=self.abstract_model.AP)
-        olca_dp.load(filename=db_file, using='sqlite3', query="SELECT REF_ID FROM TBL_IMPACT_CATEGORIES",
-                     set=self.abstract_model.AKPI)
+        # the db is queried through an on-disk cache so that rebuilding a model of an unchanged db skips sqlite
+        cache = dv.QueryCache(db_file)
 
         # import impact breakdown which needs elementary flows and query generator
         flows = list(olca_dp.data('F_m')) + list(olca_dp.data('F_s')) + list(olca_dp.data('F_t'))
         processes = list(olca_dp.data('P_m')) + list(olca_dp.data('P_s')) + list(olca_dp.data('P_t'))
-        if elementary_flow_ref_ids is None:
-            # elementary flows
-            olca_dp.load(filename=db_file, using='sqlite3',
-                         query="SELECT REF_ID FROM TBL_FLOWS WHERE FLOW_TYPE='ELEMENTARY_FLOW'",
-                         set=self.abstract_model.E)
 
-            # only load KPI if required in optimisation
-            if len(olca_dp.data('KPI')) > 0:
-                ice_sql = sq.build_impact_category_elementary_flow(ref_ids=olca_dp.data('KPI'))
-                olca_dp.load(filename=db_file, using='sqlite3', query=ice_sql,
-                             param=self.abstract_model.Ef, index=(self.abstract_model.KPI, self.abstract_model.E))
+        # scan the process exchanges once for all the process parameters, the elementary flows are only
+        # needed if there is no faster source for the process breakdown. The exchanges are cached by process so
+        # only processes new to the model are queried. The cache holds one connection for all the queries so
+        # that reference ids bound to temporary tables are reused.
+        flow_types = ['PRODUCT_FLOW']
+        pe_source = dv.get_model_table_source(db_file, 'process_elementary_flow')
+        if elementary_flow_ref_ids is None and pe_source == 'sqlite':
+            flow_types.append('ELEMENTARY_FLOW')
+        exchanges_dfr = cache.get_build_df_by_ref_id(sq.build_process_exchanges, 'processes', processes, flow_types)
+        product_dfr = exchanges_dfr[exchanges_dfr['FLOW_TYPE'] == 'PRODUCT_FLOW']
 
+        if elementary_flow_ref_ids is None:
             # breakdown of process into elementary flows
-            pe_sql = sq.build_process_elementary_flow(process_ref_ids=processes)
-            olca_dp.load(filename=db_file, using='sqlite3', query=pe_sql, param=self.abstract_model.EF,
-                         index=(self.abstract_model.KPI, self.abstract_model.F, self.abstract_model.P))
+            pe_dfr = dv.get_model_table(db_file, 'process_elementary_flow', processes, exchanges_dfr=exchanges_dfr,
+                                        cache=cache)
+            olca_dp.__setitem__('EF', {(e, f, p): v for e, f, p, v in pe_dfr.itertuples(index=False)})
 
-            # cost of product flow from process
-            pfc_sql = sq.build_product_flow_cost(process_ref_ids=processes, time=olca_dp.data('T'))
-            olca_dp.load(filename=db_file, using='sqlite3', query=pfc_sql, param=self.abstract_model.phi,
-                         index=(self.abstract_model.F, self.abstract_model.P, self.abstract_model.T))
+            # elementary flows restricted to those in the exchanges of the processes
+            elementary_flows = list(dict.fromkeys(pe_dfr['E'].dropna()))
+            olca_dp.__setitem__('E', elementary_flows)
+
+            # only load KPI if required in optimisation, from the sparse matrices or parquet dataset if built
+            if len(olca_dp.data('KPI')) > 0:
+                ice_dfr = dv.get_model_table(db_file, 'impact_category_elementary_flow', olca_dp.data('KPI'),
+                                             cache=cache)
+                ice_dfr = ice_dfr[ice_dfr['E'].isin(elementary_flows)]
+                olca_dp.__setitem__('Ef', {(kpi, e): v for kpi, e, v in ice_dfr.itertuples(index=False)})
+
+            # cost of product flow from process in the first time interval
+            t = olca_dp.data('T')[0]
+            cost_dfr = product_dfr.dropna(subset=['COST_VALUE'])
+            olca_dp.__setitem__('phi', {(f, p, t): c for f, p, c in
+                                        cost_dfr[['FLOW_REF_ID', 'P', 'COST_VALUE']].itertuples(index=False)})
 
             # db units TODO: allow the user to define the unit conversion using a setting and model.U
-            olca_dp.load(filename=db_file, using='sqlite3',
-                         query=sq.build_product_flow_units(process_ref_ids=processes),
-                         param=self.abstract_model.UU, index=(self.abstract_model.F, self.abstract_model.P))
+            units_dfr = product_dfr.dropna(subset=['Units'])
+            olca_dp.__setitem__('UU', {(f, p): u for f, p, u in
+                                       units_dfr[['FLOW_REF_ID', 'P', 'Units']].itertuples(index=False)})
 
         else:
             # for testing
@@ -389,18 +586,68 @@ class GeneralSpecification(Specification):
             process_breakdown = {(e, f, p): 3 for e in olca_dp.data('E') for f in flows for p in processes}
             olca_dp.__setitem__('Ef', impact_factors)
             olca_dp.__setitem__('EF', process_breakdown)
-
-        # load locations
-        p_m = list(olca_dp.data('P_m'))
-        olca_dp.load(filename=db_file, using='sqlite3', query=sq.build_location(process_ref_ids=p_m),
-                     param=(self.abstract_model.XI, self.abstract_model.YI))
+        cache.close()
+
+        # impact of product flows from the non-zero impact factors and process breakdown
+        olca_dp.__setitem__('EI', get_impact_intensity(get_loaded_data(olca_dp, 'Ef'), get_loaded_data(olca_dp, 'EF'),
+                                                       olca_dp.data('KPI'), olca_dp.data('E'), flows, processes))
+
+        # load locations of material processes
+        location_dfr = product_dfr[product_dfr['P'].isin(list(olca_dp.data('P_m')))]
+        olca_dp.__setitem__('XI', {(p, f): x for p, f, x in
+                                   location_dfr[['P', 'FLOW_REF_ID', 'X']].dropna().itertuples(index=False)})
+        olca_dp.__setitem__('YI', {(p, f): y for p, f, y in
+                                   location_dfr[['P', 'FLOW_REF_ID', 'Y']].dropna().itertuples(index=False)})
+
+        # distances from material processes to tasks in one pass over the process and task coordinates
+        if self.settings['distance_calculated']:
+            # coordinates that are not finite e.g. the X and Y defaults have no distance so dd falls back to d
+            xi, yi = olca_dp.data('XI'), olca_dp.data('YI')
+            locations = [loc for loc in xi if loc in yi and math.isfinite(xi[loc]) and math.isfinite(yi[loc])]
+            x = olca_dp.data('X') if 'X' in olca_dp.keys() else {}
+            y = olca_dp.data('Y') if 'Y' in olca_dp.keys() else {}
+            task_coordinates = {task: (x.get(task, self.abstract_model.X.default()),
+                                       y.get(task, self.abstract_model.Y.default()))
+                                for task in itertools.product(olca_dp.data('K'), olca_dp.data('T'))}
+            tasks = [task for task, xy in task_coordinates.items() if all(map(math.isfinite, xy))]
+            distances = get_haversine_distances(
+                tuple((xi[loc], yi[loc]) for loc in locations),
+                tuple(task_coordinates[task] for task in tasks))
+            olca_dp.__setitem__('dd', {(pm, fm, k, t): float(distances[i, j])
+                                       for i, (pm, fm) in enumerate(locations) for j, (k, t) in enumerate(tasks)})
+
+        # links from J and L so that transport flows are only declared for connected processes
+        for link_set, param, index in [('JL', 'J', ['F_m', 'P_m', 'F_t', 'P_t']),
+                                       ('LL', 'L', ['F_m', 'P_m', 'F_s', 'P_s'])]:
+            link_values = olca_dp.data(param) if param in olca_dp.keys() else {}
+            olca_dp.__setitem__(link_set, get_links(link_values, self.abstract_model.component(param).default(),
+                                                    [olca_dp.data(i) for i in index]))
+
+        # links grouped by each end so that the transport and service rules only iterate their own links
+        for group_set, link_set, group, index in [('JL_m', 'JL', [0, 1], ['F_m', 'P_m']),
+                                                  ('JL_t', 'JL', [2, 3], ['F_t', 'P_t']),
+                                                  ('LL_s', 'LL', [2, 3], ['F_s', 'P_s'])]:
+            olca_dp.__setitem__(group_set, get_link_groups(olca_dp.data(link_set), group,
+                                                           [olca_dp.data(i) for i in index]))
+
+        # unit conversion factors of the transport links from the memoised table in mola.build
+        units = olca_dp.data('UU') if 'UU' in olca_dp.keys() else {}
+        olca_dp.__setitem__('UC', mb.get_unit_conversion_table(olca_dp.data('JL'), units))
 
         # Generate task edges TODO: use an indexed set rather than a parameter
         edges = [(k1, k2) for k1 in olca_dp.data('K') for k2 in olca_dp.data('K')
-                 if 'Arc' in olca_dp.keys() and olca_dp.data('Arc')[k1, k2]]
+                 if 'Arc' in olca_dp.keys() and olca_dp.data('Arc').get((k1, k2), self.abstract_model.Arc.default())]
         olca_dp.__setitem__('task_link', edges)
 
         # use DataPortal to build concrete instance
+        if self.settings.get('matrix_build', False):
+            # only sets, parameters and variables are constructed, mola.matrix assembles the constraints and
+            # objectives directly from the parameters, with the defaults set by loading sparse parameters
+            abstract_model = self.matrix_abstract_model
+            for param in self.user_defined_parameters:
+                abstract_model.component(param).set_default(self.abstract_model.component(param).default())
+            return abstract_model.create_instance(olca_dp)
+
         model_instance = self.abstract_model.create_instance(olca_dp)
 
         # Generate the constraints for the tasks
@@ -430,43 +677,8 @@ class GeneralSpecification(Specification):
         return user_sets
 
     def get_default_parameters(self, user_sets, user_indexed_sets=[]):
-        user_params = {
-            'C': [{'index': [fm, k, d, t], 'value': 0}
-                  for fm in user_sets['F_m'] for d in user_sets['D'] for k in user_sets['K']
-                  for t in user_sets['T']],
-            # kg to tonnes
-            'U': [{'index': [fm, ft], 'value': 0.001}
-                  for fm in user_sets['F_m'] for ft in user_sets['F_t']],
-            'd': [{'index': [pm, fm, k, t], 'value': 0}
-                  for pm in user_sets['P_m'] for fm in user_sets['F_m'] for k in user_sets['K']
-                  for t in user_sets['T']],
-            'X': [{'index': [k, t], 'value': math.inf} for k in user_sets['K'] for t in user_sets['T']],
-            'Y': [{'index': [k, t], 'value': math.inf} for k in user_sets['K'] for t in user_sets['T']],
-            'Demand': [{'index': [d, k, t], 'value': 0}
-                       for d in user_sets['D'] for k in user_sets['K'] for t in user_sets['T']],
-            'Total_Demand': [{'index': [d, k], 'value': 0}
-                             for d in user_sets['D'] for k in user_sets['K']],
-            'J': [{'index': [fm, pm, ft, pt], 'value': 0}
-                  for fm in user_sets['F_m'] for pm in user_sets['P_m']
-                  for ft in user_sets['F_t'] for pt in user_sets['P_t']],
-            'L': [{'index': [fm, pm, fs, ps], 'value': 0}
-                  for fm in user_sets['F_m'] for pm in user_sets['P_m']
-                  for fs in user_sets['F_s'] for ps in user_sets['P_s']],
-            'w': [{'index': [kpi], 'value': 0} for kpi in user_sets['KPI']],
-            'u': [{'index': [obj], 'value': 1} for obj in user_sets['OBJ']],
-            'calA': [{'index': [fm, pm, k, t], 'value': 0}
-                     for fm in user_sets['F_m'] for pm in user_sets['P_m']
-                     for k in user_sets['K'] for t in user_sets['T']],
-            'calB': [{'index': [fm, pm, k, t], 'value': 0}
-                     for fm in user_sets['F_m'] for pm in user_sets['P_m']
-                     for k in user_sets['K'] for t in user_sets['T']],
-            'calC': [{'index': [fm, pm, ft, pt, k, t], 'value': 0}
-                     for fm in user_sets['F_m'] for pm in user_sets['P_m']
-                     for ft in user_sets['F_t'] for pt in user_sets['P_t']
-                     for k in user_sets['K'] for t in user_sets['T']],
-            'Arc': [{'index': [k1, k2], 'value': 0}
-                    for k1 in user_sets['K'] for k2 in user_sets['K']],
-        }
+        """ Returns a dict of default parameters in the sparse format of a default value with no other values """
+        user_params = {p: {'default': v['default'], 'values': []} for p, v in self.user_defined_parameters.items()}
 
         return user_params
 
@@ -519,9 +731,10 @@ class GeneralSpecification(Specification):
 
         return {**user_sets, **user_params}
 
+    @restores_parameter_defaults
     def get_param_dfr(self, filename, param_list=['C', 'U', 'Total_Demand', 'd', 'Demand', 'J', 'L']):
         user_dp = pyod.DataPortal()
-        user_dp.load(filename=filename)
+        mb.load_data(user_dp, filename, self.abstract_model)
         config_instance = self.abstract_model.create_instance(user_dp)
         param_dfr = pd.DataFrame(
             ([o.name, o.doc, [index for index in o], [pe.value(o[index]) for index in o]]
@@ -560,6 +773,8 @@ class SimpleSpecification(Specification):
               'doc': 'Binary conversion factor between material and transport flows', 'within': 'Binary',
               'nodes': [1, 3], 'edges': [0, 2]},
     }
+    # user parameters that define the model structure in populate, so are never mutable
+    structural_parameters = ['J']
     # db parameters need to be constructed explicitly
     controllers = {"Customised": "CustomController", "Standard": "StandardController"}
     default_settings = {
@@ -572,11 +787,15 @@ class SimpleSpecification(Specification):
         # instance object to hold just the setting values
         self.settings = {k: v['value'] for k, v in self.default_settings.items()}
 
+    @classmethod
+    def build_abstract_model(cls):
+        """ Returns a new abstract model of the specification, see Specification.abstract_model """
+
         # setup abstract model
-        abstract_model = self.abstract_model = pe.AbstractModel()
+        abstract_model = pe.AbstractModel()
 
         # user-defined sets
-        for s, d in self.user_defined_sets.items():
+        for s, d in cls.user_defined_sets.items():
             abstract_model.add_component(s, pe.Set(doc=d['doc']))
 
         abstract_model.F = abstract_model.F_m | abstract_model.F_t
@@ -586,34 +805,45 @@ class SimpleSpecification(Specification):
         abstract_model.OBJ = pe.Set(doc='Set of objective functions')
 
         # database sets
-        for var, doc in self.db_sets.items():
+        for var, doc in cls.db_sets.items():
             abstract_model.add_component(var, pe.Set(doc=doc))
 
         # user-defined parameters
-        for param, val in self.user_defined_parameters.items():
+        for param, val in cls.user_defined_parameters.items():
             idx = [abstract_model.component(i) for i in val['index']]
             if 'within' in val and val['within'] == 'Binary':
                 within = pe.Binary
             else:
                 within = pe.Reals
-            abstract_model.add_component(param, pe.Param(*idx, doc=val['doc'], within=within))
+            mutable = bool(Package.config('build.mutable_parameters') and param not in cls.structural_parameters)
+            abstract_model.add_component(param, pe.Param(*idx, doc=val['doc'], within=within, mutable=mutable))
+
+        # links that can carry flow, from the non-zero values of J
+        abstract_model.JL = pe.Set(within=abstract_model.F_m * abstract_model.P_m * abstract_model.F_t *
+                                   abstract_model.P_t, doc='Links between material and transport flows in J')
+        abstract_model.JL_m = pe.Set(abstract_model.F_m, abstract_model.P_m,
+                                     within=abstract_model.F_t * abstract_model.P_t,
+                                     doc='Transport links of JL by material')
+        abstract_model.JL_t = pe.Set(abstract_model.F_t, abstract_model.P_t,
+                                     within=abstract_model.F_m * abstract_model.P_m,
+                                     doc='Material links of JL by transport')
 
         # database parameters
         abstract_model.Ef = pe.Param(abstract_model.KPI, abstract_model.E, default=0)
         abstract_model.EF = pe.Param(abstract_model.E, abstract_model.F, abstract_model.P, default=0)
 
-        def ei_rule(model, kpi, f, p):
-            return sum(model.Ef[kpi, e]*model.EF[e, f, p] for e in model.E)
-        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, rule=ei_rule)
+        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, default=0,
+                                     doc="Impact of product flow from process, the sparse product of Ef and EF")
 
         # unit conversion factors
         abstract_model.UU = pe.Param(abstract_model.F, abstract_model.P, within=pe.Any)
+        abstract_model.UC = pe.Param(abstract_model.JL,
+                                     doc='Conversion factor from material flow units times km to transport flow units')
 
         # variables
         abstract_model.Flow = pe.Var(abstract_model.F_m, abstract_model.P_m,
                                      within=pe.NonNegativeReals, doc='Material flow', units=pu.P_m)
-        abstract_model.Specific_Material_Transport_Flow = pe.Var(abstract_model.F_m, abstract_model.P_m,
-                                                                 abstract_model.F_t, abstract_model.P_t,
+        abstract_model.Specific_Material_Transport_Flow = pe.Var(abstract_model.JL,
                                                                  within=pe.NonNegativeReals,
                                                                  doc='Specific Material Transport Flow',
                                                                  units=pu.P_m)
@@ -648,25 +878,18 @@ class SimpleSpecification(Specification):
         def material_flow_rule(model, fm, pm):
             return model.Flow[fm, pm] == sum(
                 model.J[fm, pm, ft, pt] * model.Specific_Material_Transport_Flow[fm, pm, ft, pt]
-                for ft in model.F_t for pt in model.P_t)
+                for ft, pt in model.JL_m[fm, pm])
         abstract_model.material_flow_constraint = \
             pe.Constraint(abstract_model.F_m, abstract_model.P_m, rule=material_flow_rule)
 
         def specific_transport_flow_rule(model, ft, pt):
             rhs = 0
             # sum over connected processes
-            for fm in model.F_m:
-                for pm in model.P_m:
-                    if model.J[fm, pm, ft, pt]:
-                        unit_conversion = pu.convert_value(
-                            1,
-                            from_units=mb.map_units(model.UU[fm, pm]) * pu.km,
-                            to_units=mb.map_units(model.UU[ft, pt])
-                        )
-                        rhs += model.J[fm, pm, ft, pt] * \
-                               unit_conversion * \
-                               model.Specific_Material_Transport_Flow[fm, pm, ft, pt] * \
-                               model.d[pm, fm]
+            for fm, pm in model.JL_t[ft, pt]:
+                rhs += model.J[fm, pm, ft, pt] * \
+                       model.UC[fm, pm, ft, pt] * \
+                       model.Specific_Material_Transport_Flow[fm, pm, ft, pt] * \
+                       model.d[pm, fm]
             return model.Specific_Transport_Flow[ft, pt] == rhs
 
         abstract_model.transport_constraint = pe.Constraint(abstract_model.F_t,
@@ -693,14 +916,17 @@ class SimpleSpecification(Specification):
 
         # TODO: service_flow_constraint
 
+        return abstract_model
+
+    @restores_parameter_defaults
     def populate(self, json_files=None, elementary_flow_ref_ids=None, db_file=di.get_default_db_file()):
 
         olca_dp = pyod.DataPortal()
 
-        # user data
-        for json_file in json_files:
-            if json_file:
-                olca_dp.load(filename=json_file)
+        # user data, the sparse parameters of which set defaults in the shared abstract model
+        for user_data in json_files:
+            if user_data:
+                mb.load_data(olca_dp, user_data, self.abstract_model)
 
         # import impact breakdown which needs elementary flows and query generator
         flows = list(olca_dp.data('F_m')) + list(olca_dp.data('F_t'))
@@ -722,11 +948,26 @@ class SimpleSpecification(Specification):
             olca_dp.__setitem__('Ef', impact_factors)
             olca_dp.__setitem__('EF', process_breakdown)
 
+        # impact of product flows from the non-zero impact factors and process breakdown
+        olca_dp.__setitem__('EI', get_impact_intensity(get_loaded_data(olca_dp, 'Ef'), get_loaded_data(olca_dp, 'EF'),
+                                                       olca_dp.data('KPI'), olca_dp.data('E'), flows, processes))
+
         # db units
         olca_dp.load(filename=db_file, using='sqlite3',
                      query=sq.build_product_flow_units(process_ref_ids=processes),
                      param=self.abstract_model.UU, index=(self.abstract_model.F, self.abstract_model.P))
 
+        # links from J so that transport flows are only declared for connected processes
+        link_values = olca_dp.data('J') if 'J' in olca_dp.keys() else {}
+        olca_dp.__setitem__('JL', get_links(link_values, self.abstract_model.J.default(),
+                                            [olca_dp.data(i) for i in ['F_m', 'P_m', 'F_t', 'P_t']]))
+        for group_set, group, index in [('JL_m', [0, 1], ['F_m', 'P_m']), ('JL_t', [2, 3], ['F_t', 'P_t'])]:
+            olca_dp.__setitem__(group_set, get_link_groups(olca_dp.data('JL'), group,
+                                                           [olca_dp.data(i) for i in index]))
+
+        # unit conversion factors of the transport links from the memoised table in mola.build
+        units = olca_dp.data('UU') if 'UU' in olca_dp.keys() else {}
+        olca_dp.__setitem__('UC', mb.get_unit_conversion_table(olca_dp.data('JL'), units))
 
         # use DataPortal to build concrete instance
         model_instance = self.abstract_model.create_instance(olca_dp)
@@ -800,9 +1041,10 @@ class SimpleSpecification(Specification):
 
         return {**user_sets, **user_params}
 
+    @restores_parameter_defaults
     def get_param_dfr(self, filename, param_list=['C', 'U', 'Total_Demand', 'd', 'Demand', 'J', 'L']):
         user_dp = pyod.DataPortal()
-        user_dp.load(filename=filename)
+        mb.load_data(user_dp, filename, self.abstract_model)
         config_instance = self.abstract_model.create_instance(user_dp)
         param_dfr = pd.DataFrame(
             ([o.name, o.doc, [index for index in o], [pe.value(o[index]) for index in o]]
@@ -838,15 +1080,19 @@ class AIMMSExampleSpecification(Specification):
         # instance object to hold just the setting values
         self.settings = {k: v['value'] for k, v in self.default_settings.items()}
 
+    @classmethod
+    def build_abstract_model(cls):
+        """ Returns a new abstract model of the specification, see Specification.abstract_model """
+
         # setup abstract model
-        abstract_model = self.abstract_model = pe.AbstractModel()
+        abstract_model = pe.AbstractModel()
 
         # user-defined sets
-        for var, d in self.user_defined_sets.items():
+        for var, d in cls.user_defined_sets.items():
             abstract_model.add_component(var, pe.Set(doc=d['doc']))
 
         # user-defined parameters
-        for param, val in self.user_defined_parameters.items():
+        for param, val in cls.user_defined_parameters.items():
             idx = [abstract_model.component(i) for i in val['index']]
             abstract_model.add_component(param, pe.Param(*idx, doc=val['doc'], within=pe.Reals))
 
@@ -868,14 +1114,17 @@ class AIMMSExampleSpecification(Specification):
             return sum([model.x[p, c] for p in model.P]) >= model.D[c]
         abstract_model.demand_constraint = pe.Constraint(abstract_model.C, rule=demand_rule)
 
+        return abstract_model
+
+    @restores_parameter_defaults
     def populate(self, json_files=None, elementary_flow_ref_ids=None, db_file=None):
 
         olca_dp = pyod.DataPortal()
 
-        # user data
-        for json_file in json_files:
-            if json_file:
-                olca_dp.load(filename=json_file)
+        # user data, the sparse parameters of which set defaults in the shared abstract model
+        for user_data in json_files:
+            if user_data:
+                mb.load_data(olca_dp, user_data, self.abstract_model)
 
         # use DataPortal to build concrete instance
         model_instance = self.abstract_model.create_instance(olca_dp)
@@ -942,15 +1191,19 @@ class KondiliSpecification(Specification):
         # instance object to hold just the setting values
         self.settings = {k: v['value'] for k, v in self.default_settings.items()}
 
+    @classmethod
+    def build_abstract_model(cls):
+        """ Returns a new abstract model of the specification, see Specification.abstract_model """
+
         # setup abstract model
-        abstract_model = self.abstract_model = pe.AbstractModel()
+        abstract_model = pe.AbstractModel()
 
         # user-defined sets
-        for s, d in self.user_defined_sets.items():
+        for s, d in cls.user_defined_sets.items():
             abstract_model.add_component(s, pe.Set(doc=d['doc']))
 
         # user-defined indexed sets
-        for s, val in self.user_defined_indexed_sets.items():
+        for s, val in cls.user_defined_indexed_sets.items():
             idx = [abstract_model.component(i) for i in val['index']]
             abstract_model.add_component(s, pe.Set(*idx, doc=val['doc'],
                                                    within=abstract_model.component(val['within'][0])))
@@ -977,8 +1230,7 @@ class KondiliSpecification(Specification):
                                     doc='Tasks that can be performed by unit j')
 
         # user-defined parameters
-        for param, val in self.user_defined_parameters.items():
-            print(param)
+        for param, val in cls.user_defined_parameters.items():
             if 'index' in val:
                 idx = [abstract_model.component(i) for i in val['index']]
                 abstract_model.add_component(param, pe.Param(*idx, doc=val['doc'], within=pe.Reals))
@@ -1084,14 +1336,17 @@ class KondiliSpecification(Specification):
         abstract_model.material_balances = pe.Constraint(abstract_model.States, abstract_model.T,
                                                          rule=material_balances_rule)
 
+        return abstract_model
+
+    @restores_parameter_defaults
     def populate(self, json_files=None, elementary_flow_ref_ids=None, db_file=None):
 
         olca_dp = pyod.DataPortal()
 
-        # user data
-        for json_file in json_files:
-            if json_file:
-                olca_dp.load(filename=json_file)
+        # user data, the sparse parameters of which set defaults in the shared abstract model
+        for user_data in json_files:
+            if user_data:
+                mb.load_data(olca_dp, user_data, self.abstract_model)
 
         # built-in sets
         map_I_J = {}
@@ -2,20 +2,90 @@
 Module for generating SQL queries for a abstract model in a Specification
 """
 from pypika import Query, Table
-from pypika.terms import PseudoColumn
-import pypika.functions as pf
+from pypika.terms import Parameter, ValueWrapper
+from pypika.utils import format_alias_sql
 
+# prefix of the temporary tables of reference ids created by dataview.bind_ref_ids
+ref_id_table_prefix = 'MOLA_REF_IDS_'
 
-def build_process_elementary_flow(process_ref_ids):
+
+class RefIdTable:
+    """
+    Reference ids bound to a connection-scoped temporary table by dataview.bind_ref_ids. Passed to a build
+    function in place of a list of reference ids, the query joins the table instead of inlining the ids and the
+    other literal values of the query are bound to the named parameters in params, see bind_value.
+    """
+
+    def __init__(self, set_name):
+        self.set_name = set_name
+        self.table = Table(ref_id_table_prefix + set_name, schema='temp')
+        self.params = {}
+
+
+class NamedParameter(Parameter):
+    """
+    Named query parameter e.g. :T that keeps its alias when selected.
+    """
+
+    def get_sql(self, with_alias=False, **kwargs):
+        return format_alias_sql(str(self.placeholder), self.alias if with_alias else None, **kwargs)
+
+
+def bind_value(ref_ids, name, value):
+    """
+    Literal value of a query, bound to a named parameter if the reference ids of the query are a RefIdTable so
+    that the query text does not depend on the value.
+
+    :param list[str] | RefIdTable ref_ids: reference ids of the query
+    :param str name: parameter name, a valid identifier
+    :param value: literal value
+    :return: pypika term
+    """
+    if isinstance(ref_ids, RefIdTable):
+        ref_ids.params[name] = value
+        return NamedParameter(':' + name)
+    return ValueWrapper(value)
+
+
+def bind_flow_type(ref_ids, flow_type):
+    """
+    :param list[str] | RefIdTable ref_ids: reference ids of the query
+    :param str flow_type: flow type e.g. PRODUCT_FLOW, also the name of its parameter
+    :return: pypika term of the flow type, see bind_value
+    """
+    return bind_value(ref_ids, flow_type, flow_type)
+
+
+def get_params(ref_ids):
+    """
+    :param list[str] | RefIdTable ref_ids: reference ids of a query
+    :return: dict of the named parameters of the query or None if its values are inlined
+    """
+    return ref_ids.params if isinstance(ref_ids, RefIdTable) else None
+
+
+def isin_ref_ids(field, ref_ids):
+    """
+    Criterion for a reference id field to be in a list of reference ids or a RefIdTable.
+
+    :param field: pypika field e.g. processes.REF_ID
+    :param list[str] | RefIdTable ref_ids: reference ids
+    :return: pypika criterion
+    """
+    if isinstance(ref_ids, RefIdTable):
+        return field.isin(Query.from_(ref_ids.table).select(ref_ids.table.REF_ID))
+    return field.isin(ref_ids)
+
+
+def build_process_elementary_flow(process_ref_ids=None):
     """
     Build a query to create a table of processes versus elementary flows from a sqlite db
     sourced from derby.
 
-    :param str[list] process_ref_ids: processes reference ids
+    :param list[str] | RefIdTable process_ref_ids: processes reference ids or None for all processes
     :return: SQL string
     """
     processes = Table('TBL_PROCESSES')
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
     exchanges = Table('TBL_EXCHANGES')
     flows = Table('TBL_FLOWS')
     # flow_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
@@ -23,16 +93,18 @@ def build_process_elementary_flow(process_ref_ids):
 
     # find exchanges corresponding to process ref ids
     exchange_query = exchanges \
-        .select(exchanges.F_OWNER, exchanges.F_FLOW, exchanges.F_UNIT, exchanges.RESULTING_AMOUNT_VALUE) \
-        .where(exchanges.F_OWNER.isin(process_ids))
+        .select(exchanges.F_OWNER, exchanges.F_FLOW, exchanges.F_UNIT, exchanges.RESULTING_AMOUNT_VALUE)
         # .as_('e')
+    if process_ref_ids is not None:
+        process_ids = processes.select(processes.ID).where(isin_ref_ids(processes.REF_ID, process_ref_ids))
+        exchange_query = exchange_query.where(exchanges.F_OWNER.isin(process_ids))
 
     # product flows
     product_flows = Query \
         .from_(exchange_query) \
         .left_join(flows).on(flows.ID == exchange_query.F_FLOW) \
         .select(flows.REF_ID, exchange_query.F_OWNER, exchange_query.RESULTING_AMOUNT_VALUE) \
-        .where(flows.FlOW_TYPE == 'PRODUCT_FLOW') \
+        .where(flows.FlOW_TYPE == bind_flow_type(process_ref_ids, 'PRODUCT_FLOW')) \
         .as_('product_flows')
 
     # left join exchanges to flow and process tables
@@ -45,17 +117,59 @@ def build_process_elementary_flow(process_ref_ids):
             flows.REF_ID.as_('E'), product_flows.REF_ID.as_('F'),
             processes.REF_ID.as_('P'), exchange_query.RESULTING_AMOUNT_VALUE.as_('EF')
         ) \
-        .where(flows.FlOW_TYPE == 'ELEMENTARY_FLOW')
+        .where(flows.FlOW_TYPE == bind_flow_type(process_ref_ids, 'ELEMENTARY_FLOW'))
+
+    return str(q)
+
+
+def build_process_exchanges(process_ref_ids, flow_types=('PRODUCT_FLOW', 'ELEMENTARY_FLOW')):
+    """
+    Build a query to get the exchanges of processes joined once to their flows, units and process locations,
+    from which the process parameters of a model can be derived in memory.
+
+    :param list[str] | RefIdTable process_ref_ids: process reference ids
+    :param list[str] flow_types: types of exchange flows to include
+    :return: SQL string
+    """
+    exchanges = Table('TBL_EXCHANGES')
+    flows = Table('TBL_FLOWS')
+    processes = Table('TBL_PROCESSES')
+    locations = Table('TBL_LOCATIONS')
+    units = Table('TBL_UNITS')
+
+    # convert reference ids to openLCA process ids
+    process_ids = processes.select(processes.ID).where(isin_ref_ids(processes.REF_ID, process_ref_ids))
+
+    # sub-query the exchanges table to limit join
+    sq = Query \
+        .from_(exchanges) \
+        .select(exchanges.F_OWNER, exchanges.F_FLOW, exchanges.F_UNIT, exchanges.RESULTING_AMOUNT_VALUE,
+                exchanges.COST_VALUE) \
+        .where(exchanges.F_OWNER.isin(process_ids))
+
+    # join exchanges to flows, processes, locations and units
+    q = Query \
+        .from_(sq) \
+        .left_join(flows).on(flows.ID == sq.F_FLOW) \
+        .left_join(processes).on(processes.ID == sq.F_OWNER) \
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
+        .left_join(units).on(units.ID == sq.F_UNIT) \
+        .select(
+            processes.REF_ID.as_('P'), flows.REF_ID.as_('FLOW_REF_ID'), flows.FLOW_TYPE,
+            sq.RESULTING_AMOUNT_VALUE, sq.COST_VALUE, units.NAME.as_('Units'),
+            locations.LONGITUDE.as_('X'), locations.LATITUDE.as_('Y')
+        ) \
+        .where(flows.FLOW_TYPE.isin([bind_flow_type(process_ref_ids, t) for t in flow_types]))
 
     return str(q)
 
 
-def build_impact_category_elementary_flow(ref_ids):
+def build_impact_category_elementary_flow(ref_ids=None):
     """
     Build a query to create a table of impact category versus elementary flow from a sqlite openLCA
     database.
 
-    :param str[list] ref_ids: list of impact category reference ids
+    :param list[str] | RefIdTable ref_ids: impact category reference ids or None for all impact categories
     :return: SQL string
     """
 
@@ -65,9 +179,10 @@ def build_impact_category_elementary_flow(ref_ids):
     flows = Table('TBL_FLOWS')
 
     ic = impact_categories \
-        .select(impact_categories.ID, impact_categories.REF_ID) \
-        .where(impact_categories.REF_ID.isin(ref_ids)) \
-        .as_('ic')
+        .select(impact_categories.ID, impact_categories.REF_ID)
+    if ref_ids is not None:
+        ic = ic.where(isin_ref_ids(impact_categories.REF_ID, ref_ids))
+    ic = ic.as_('ic')
 
     # no need to select ELEMENTARY_FLOW
     q = Query\
@@ -88,7 +203,7 @@ def build_location(process_ref_ids=None):
     """
     Create a table of longitudes and latitudes for each material process and its product flow.
 
-    :param list[str] process_ref_ids: list of material process reference ids
+    :param list[str] | RefIdTable process_ref_ids: list of material process reference ids
     :return: SQL string
     """
     exchanges = Table('TBL_EXCHANGES')
@@ -98,7 +213,7 @@ def build_location(process_ref_ids=None):
     e = Table('e')
 
     # convert reference ids to openLCA process ids
-    process_id = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_id = processes.select(processes.ID).where(isin_ref_ids(processes.REF_ID, process_ref_ids))
 
     # sub-query exchanges table to limit
     sq = Query\
@@ -112,12 +227,12 @@ def build_location(process_ref_ids=None):
         .from_(sq).as_('e') \
         .left_join(flows).on(flows.ID == sq.F_FLOW) \
         .left_join(processes).on(processes.ID == sq.F_OWNER) \
-        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
         .select(
             processes.REF_ID.as_('P_m'), flows.REF_ID.as_('F_m'),
             locations.LONGITUDE.as_('X'), locations.LATITUDE.as_('Y')
         )\
-        .where(flows.FlOW_TYPE == 'PRODUCT_FLOW')
+        .where(flows.FlOW_TYPE == bind_flow_type(process_ref_ids, 'PRODUCT_FLOW'))
 
     return str(q)
 
@@ -165,7 +280,7 @@ def build_product_flow_units(process_ref_ids):
     """
     Build a query to get processes and their product flow units.
 
-    :param list[str] process_ref_ids: list of process reference ids
+    :param list[str] | RefIdTable process_ref_ids: list of process reference ids
     :return: SQL string
     """
 
@@ -175,7 +290,7 @@ def build_product_flow_units(process_ref_ids):
     units = Table('TBL_UNITS')
 
     # convert reference ids to openLCA process ids
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ids = processes.select(processes.ID).where(isin_ref_ids(processes.REF_ID, process_ref_ids))
 
     # sub-query the exchanges table to limit join
     sq = Query \
@@ -193,7 +308,7 @@ def build_product_flow_units(process_ref_ids):
         .select(
             flows.REF_ID.as_('F'), processes.REF_ID.as_('P'), units.NAME.as_('Units')
         )\
-        .where(flows.FlOW_TYPE == 'PRODUCT_FLOW')
+        .where(flows.FlOW_TYPE == bind_flow_type(process_ref_ids, 'PRODUCT_FLOW'))
 
     return str(q)
 
@@ -203,7 +318,7 @@ def build_product_flow_cost(process_ref_ids, time):
     Build a query to get the product flow costs from a list of process reference ids using a sqlite openLCA database.
 
     :param sqlite3.Connection conn: database connection
-    :param list[str] process_ref_ids: list of process reference ids
+    :param list[str] | RefIdTable process_ref_ids: list of process reference ids
     :param list time: list of time labels
     :return SQL string
     """
@@ -213,7 +328,7 @@ def build_product_flow_cost(process_ref_ids, time):
     locations = Table('TBL_LOCATIONS')
 
     # get the process ids from the ref ids
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ids = processes.select(processes.ID).where(isin_ref_ids(processes.REF_ID, process_ref_ids))
 
     # sub-query the exchanges table to limit join
     sq = Query\
@@ -223,15 +338,15 @@ def build_product_flow_cost(process_ref_ids, time):
         .where(exchanges.F_OWNER.isin(process_ids))
 
     # join exchanges to flows, processes, locations
-    first_time = PseudoColumn("'" + time[0] + "'")
+    first_time = bind_value(process_ref_ids, 'T', time[0])
     q = Query\
         .from_(sq) \
         .left_join(flows).on(flows.ID == sq.F_FLOW) \
         .left_join(processes).on(processes.ID == sq.F_OWNER) \
-        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
+        .left_join(locations).on(processes.F_LOCATION == locations.ID) \
         .select(
             flows.REF_ID.as_('F'), processes.REF_ID.as_('P'), first_time.as_('T'), sq.COST_VALUE
         )\
-        .where(flows.FlOW_TYPE == 'PRODUCT_FLOW')
+        .where(flows.FlOW_TYPE == bind_flow_type(process_ref_ids, 'PRODUCT_FLOW'))
 
     return str(q)
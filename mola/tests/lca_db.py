@@ -0,0 +1,56 @@
+# small openLCA sqlite database shared by the dataimport, dataview and sqlgenerator tests
+import sqlite3
+
+import pandas as pd
+
+import mola.dataview as dv
+import mola.sqlgenerator as sq
+
+
+def create_lca_db(db_file):
+    """
+    Create a small openLCA database of five processes with product and elementary flow exchanges, two locations and
+    two impact categories.
+
+    :param db_file: full path to sqlite db
+    :return: open connection to the db
+    """
+    conn = sqlite3.connect(db_file)
+    conn.execute('CREATE TABLE TBL_EXCHANGES (ID INTEGER PRIMARY KEY, F_OWNER INTEGER, F_FLOW INTEGER, '
+                 'F_UNIT INTEGER, RESULTING_AMOUNT_VALUE REAL, COST_VALUE REAL)')
+    conn.execute('CREATE TABLE TBL_PROCESSES (ID INTEGER PRIMARY KEY, REF_ID TEXT, F_LOCATION INTEGER)')
+    conn.execute('CREATE TABLE TBL_LOCATIONS (ID INTEGER PRIMARY KEY, LONGITUDE REAL, LATITUDE REAL)')
+    conn.execute('CREATE TABLE TBL_UNITS (ID INTEGER PRIMARY KEY, NAME TEXT)')
+    conn.execute('CREATE TABLE TBL_FLOWS (ID INTEGER PRIMARY KEY, REF_ID TEXT, FLOW_TYPE TEXT)')
+    conn.execute('CREATE TABLE TBL_IMPACT_FACTORS (ID INTEGER PRIMARY KEY, F_IMPACT_CATEGORY INTEGER, '
+                 'F_FLOW INTEGER, F_UNIT INTEGER, VALUE REAL)')
+    conn.execute('CREATE TABLE TBL_IMPACT_CATEGORIES (ID INTEGER PRIMARY KEY, REF_ID TEXT)')
+    conn.executemany('INSERT INTO TBL_PROCESSES VALUES (?, ?, ?)', [(i, 'p%d' % i, i % 2) for i in range(5)])
+    conn.executemany('INSERT INTO TBL_LOCATIONS VALUES (?, ?, ?)', [(0, 1.0, 51.0), (1, -2.0, 53.0)])
+    conn.execute("INSERT INTO TBL_UNITS VALUES (1, 'kg')")
+    conn.executemany('INSERT INTO TBL_FLOWS VALUES (?, ?, ?)',
+                     [(i, 'f%d' % i, 'PRODUCT_FLOW' if i < 5 else 'ELEMENTARY_FLOW') for i in range(12)])
+    conn.executemany('INSERT INTO TBL_EXCHANGES (F_OWNER, F_FLOW, RESULTING_AMOUNT_VALUE) VALUES (?, ?, ?)',
+                     [(p, p, 1.0) for p in range(4)] +
+                     [(p, e, p * 10 + e) for p in range(5) for e in range(5, 12) if (p + e) % 3])
+    conn.executemany('INSERT INTO TBL_IMPACT_CATEGORIES VALUES (?, ?)', [(1, 'k1'), (2, 'k2')])
+    conn.executemany('INSERT INTO TBL_IMPACT_FACTORS (F_IMPACT_CATEGORY, F_FLOW, VALUE) VALUES (?, ?, ?)',
+                     [(1, 5, 1.0), (1, 7, 2.0), (2, 6, 3.0)])
+    conn.commit()
+    return conn
+
+
+def assert_model_tables_equal(test_case, conn, db_file):
+    """
+    Assert that the model tables read by dataview.get_model_table are the same as the results of their queries.
+
+    :param unittest.TestCase test_case: test case making the assertion
+    :param sqlite3.Connection conn: connection to the db
+    :param db_file: full path to sqlite db
+    """
+    for name, ref_ids in [('process_elementary_flow', ['p1', 'p4']),
+                          ('impact_category_elementary_flow', ['k2'])]:
+        query_dfr = pd.read_sql(getattr(sq, 'build_' + name)(ref_ids), conn)
+        model_dfr = dv.get_model_table(db_file, name, ref_ids)
+        test_case.assertEqual(sorted(query_dfr.fillna('').itertuples(index=False), key=str),
+                              sorted(model_dfr.fillna('').itertuples(index=False), key=str))
@@ -2,6 +2,15 @@
 from unittest import TestCase
 import mola.build as mb
 import mola.specification5 as ms
+import mola.dataimport as di
+from mola import Package
+import pyomo.environ as pe
+import pyomo.dataportal as pyod
+import tempfile
+import json
+import os
+import io
+import pickle
 
 
 class TestBuild(TestCase):
@@ -23,3 +32,176 @@ class TestBuild(TestCase):
 
         spec1 = mb.create_specification(cls, settings={'distance_calculated': True})
         self.assertEqual(spec1.settings['distance_calculated'], True)
+
+    def test_sparse_parameters(self):
+        dense = [{'index': ['f1', 'p1'], 'value': 0}, {'index': ['f1', 'p2'], 'value': 2},
+                 {'index': ['f2', 'p1'], 'value': 0}, {'index': ['f2', 'p2'], 'value': 0}]
+        sparse = mb.get_sparse_parameter(dense, 0)
+        self.assertEqual(sparse, {'default': 0, 'values': [{'index': ['f1', 'p2'], 'value': 2}]})
+        self.assertTrue(mb.is_sparse_parameter(sparse))
+        self.assertFalse(mb.is_sparse_parameter(dense))
+        self.assertEqual(mb.get_parameter_elements(sparse, [['f1', 'f2'], ['p1', 'p2']]), dense)
+        self.assertEqual(mb.get_parameter_elements(sparse), sparse['values'])
+
+        # load a sparse parameter with a new default into a model
+        model = pe.AbstractModel()
+        model.F = pe.Set()
+        model.P = pe.Set()
+        model.a = pe.Param(model.F, model.P, default=0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_file = os.path.join(tmp_dir, 'data.json')
+            with open(json_file, 'w') as fp:
+                json.dump({'F': ['f1', 'f2'], 'P': ['p1', 'p2'], 'a': {'default': 1, 'values': sparse['values']}}, fp)
+            data_portal = pyod.DataPortal()
+            mb.load_json(data_portal, json_file, model)
+        instance = model.create_instance(data_portal)
+        self.assertEqual([instance.a[f, p] for f in ['f1', 'f2'] for p in ['p1', 'p2']], [1, 2, 1, 1])
+
+    def test_load_data(self):
+        config = {'sets': {'F': ['f1', 'f2']}, 'indexed_sets': {},
+                  'parameters': {'a': {'default': 1, 'values': [{'index': ['f2'], 'value': 2}]}}}
+        data_list = mb.config_to_data(config)
+        self.assertEqual(data_list, [config['sets'], config['parameters']])
+
+        # the configuration is loaded into the DataPortal without json files
+        model = pe.AbstractModel()
+        model.F = pe.Set()
+        model.a = pe.Param(model.F, default=0)
+        data_portal = pyod.DataPortal()
+        for data in data_list:
+            mb.load_data(data_portal, data, model)
+        instance = model.create_instance(data_portal)
+        self.assertEqual([instance.a[f] for f in ['f1', 'f2']], [1, 2])
+
+    def test_build_parameters(self):
+        spec = ms.GeneralSpecification()
+        sets = spec.get_default_sets({'F_m': ['f1', 'f2'], 'P_m': ['p1', 'p2']})
+        parameters = {'d': {'default': 5, 'values': [{'index': ['p1', 'f2', 'k1', 't1'], 'value': 3}]}}
+        par = mb.build_parameters(sets, parameters, spec)
+        self.assertEqual(par['d']['Value'].tolist(), [5, 3, 5, 5])
+        self.assertEqual(par['C']['Value'].tolist(), [0, 0])
+
+        # edited parameters are written back in the sparse format with their own default
+        defaults = mb.get_parameter_defaults(sets, parameters, spec)
+        self.assertEqual((defaults['d'], defaults['C']), (5, 0))
+        par['d'].loc[0, 'Value'] = 4
+        self.assertEqual(mb.get_index_value_parameters(par, defaults)['d'],
+                         {'default': 5, 'values': [{'index': ['p1', 'f1', 'k1', 't1'], 'value': 4},
+                                                   {'index': ['p1', 'f2', 'k1', 't1'], 'value': 3}]})
+
+        # saved dense parameters are converted to the sparse format
+        default_parameters = spec.get_default_parameters(sets)
+        mb.update_parameters(default_parameters, {'C': [{'index': ['f1', 'k1', 'd1', 't1'], 'value': 2},
+                                                        {'index': ['f2', 'k1', 'd1', 't1'], 'value': 0}]})
+        self.assertEqual(default_parameters['C'],
+                         {'default': 0, 'values': [{'index': ['f1', 'k1', 'd1', 't1'], 'value': 2}]})
+
+    def test_set_parameter_value(self):
+        link = ['fm1', 'pm1', 'ft1', 'pt1']
+        sparse = {'default': 0, 'values': []}
+        mb.set_parameter_value(sparse, link, 1)
+        self.assertEqual(sparse['values'], [{'index': link, 'value': 1}])
+        mb.set_parameter_value(sparse, link, 0)
+        self.assertEqual(sparse['values'], [])
+        dense = [{'index': link, 'value': 0}]
+        mb.set_parameter_value(dense, link, 1)
+        mb.set_parameter_value(dense, ['fm2', 'pm1', 'ft1', 'pt1'], 1)
+        self.assertEqual(dense, [{'index': link, 'value': 1}])
+
+    def test_parameter_defaults_restored(self):
+        # loading a sparse parameter sets its default in the shared abstract model only while loading
+        spec = ms.GeneralSpecification()
+        sets = spec.get_default_sets({'F_m': ['f1'], 'P_m': ['p1']})
+        sets = {k: v for k, v in sets.items() if k not in ['F', 'P']}
+        param_dfr = spec.get_param_dfr({**sets, 'd': {'default': 5, 'values': []}}, ['d'])
+        self.assertEqual(param_dfr['Value'].tolist(), [[5]])
+        self.assertEqual(spec.abstract_model.d.default(), 0)
+
+    def test_get_unit_conversion_table(self):
+        links = [('fm1', 'pm1', 'ft1', 'pt1'), ('fm2', 'pm1', 'ft1', 'pt1')]
+        units = {('fm1', 'pm1'): 'kg', ('fm2', 'pm1'): 'kg', ('ft1', 'pt1'): 't*km'}
+        mb.get_transport_unit_conversion.cache_clear()
+        table = mb.get_unit_conversion_table(links, units)
+        self.assertEqual(list(table.keys()), links)
+        self.assertAlmostEqual(table[links[0]], 0.001)
+        # the conversion is memoised so only one factor was calculated
+        self.assertEqual(mb.get_transport_unit_conversion.cache_info().misses, 1)
+        self.assertIs(mb.map_units('kg'), mb.map_units('kg'))
+
+    def test_update_instance(self):
+        config = mb.get_config('../../config/Lemon_Toy_Model.json')
+        Package.set('build.mutable_parameters', True)
+        try:
+            instance = mb.build_instance(config)
+        finally:
+            Package.set('build.mutable_parameters', False)
+
+        # parameter edits are pushed into the existing model
+        config['parameters']['Total_Demand']['values'][0]['value'] = 2000
+        config['parameters']['w']['values'][0]['value'] = 2
+        updated = mb.update_instance(instance, config)
+        self.assertIs(updated, instance)
+        self.assertEqual(pe.value(instance.Total_Demand['d1', 'k1']), 2000)
+        self.assertEqual(pe.value(instance.w[config['parameters']['w']['values'][0]['index'][0]]), 2)
+
+        # a change to the link parameter J alters the model structure so the model is rebuilt
+        config['parameters']['J']['values'] = config['parameters']['J']['values'][:-1]
+        rebuilt = mb.update_instance(instance, config)
+        self.assertIsNot(rebuilt, instance)
+        self.assertEqual(pe.value(rebuilt.Total_Demand['d1', 'k1']), 2000)
+
+    def test_model_cache(self):
+        config = mb.get_config('../../config/AIMMS_Tutorial_Example.json')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Package.set('cache.folder', tmp_dir)
+            Package.set('cache.models', True)
+            try:
+                instance = mb.build_instance(config)
+                self.assertTrue(os.path.exists(mb.get_model_cache_file(config, config['settings'])))
+
+                # a second build loads the model from the cache
+                cached_instance = mb.build_instance(config)
+                self.assertIsNot(cached_instance, instance)
+                self.assertEqual([str(c.body) for c in cached_instance.component_data_objects(pe.Constraint)],
+                                 [str(c.body) for c in instance.component_data_objects(pe.Constraint)])
+                self.assertEqual(pe.value(cached_instance.S['Haarlem']), 47)
+
+                # a changed configuration misses the cache and the least recently used models are evicted
+                config['parameters']['S'][0]['value'] = 50
+                self.assertEqual(pe.value(mb.build_instance(config).S['Haarlem']), 50)
+                self.assertEqual(len(os.listdir(os.path.join(tmp_dir, 'models'))), 2)
+                Package.set('cache.max_bytes', 0)
+                config['parameters']['S'][0]['value'] = 51
+                mb.build_instance(config)
+                self.assertEqual(len(os.listdir(os.path.join(tmp_dir, 'models'))), 0)
+            finally:
+                Package.set('cache.folder', None)
+                Package.set('cache.models', False)
+                Package.set('cache.max_bytes', 512 * 2**20)
+
+    def test_model_cache_default_db(self):
+        # a configuration without a database is cached under the default database that populate reads
+        config = mb.get_config('test_model_config.json')
+        config.pop('db_file', None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Package.set('cache.folder', tmp_dir)
+            Package.set('cache.models', True)
+            try:
+                self.assertEqual(mb.get_model_cache_file(config, config['settings']),
+                                 mb.get_model_cache_file({**config, 'db_file': di.get_default_db_file()},
+                                                         config['settings']))
+            finally:
+                Package.set('cache.folder', None)
+                Package.set('cache.models', False)
+
+    def test_model_pickler(self):
+        # the rules of a specification are left out of a cached model but other local functions are not pickled
+        with io.BytesIO() as fp:
+            mb.ModelPickler(fp).dump(ms.GeneralSpecification().abstract_model)
+            self.assertGreater(len(fp.getvalue()), 0)
+
+        def user_rule(model):
+            return 0
+        with self.assertRaises((pickle.PicklingError, AttributeError)):
+            mb.ModelPickler(io.BytesIO()).dump(user_rule)
+
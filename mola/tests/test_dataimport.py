@@ -1,8 +1,16 @@
 # unit tests for dataimport module
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 from pathlib import Path
 import mola.dataimport as di
+import pandas as pd
 import tempfile
+import importlib.util
+import sqlite3
+import os
+import json
+import zipfile
+
+from mola.tests.lca_db import create_lca_db, assert_model_tables_equal
 
 
 class DataImport(TestCase):
@@ -13,6 +21,246 @@ class DataImport(TestCase):
         fn = di.json_to_sqlite(self.json_zip_filename, tfn)
         self.assertEqual(len(fn), 67)
 
+    def test_json_to_sqlite_process_grid(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zip_filename = os.path.join(tmp_dir, 'model.zip')
+            with zipfile.ZipFile(zip_filename, 'w') as zf:
+                zf.writestr('meta.info', '{}')
+                zf.writestr('flows/f1.json', json.dumps({'@id': 'f1', 'name': 'Juice'}))
+                for i in range(5):
+                    zf.writestr('processes/p%d.json' % i, json.dumps({'@id': 'p%d' % i, 'exchanges': [
+                        {'input': False, 'amount': 1.0 + i, 'flow': {'@id': 'f1'}},
+                        {'input': True, 'amount': 2.0, 'flow': {'@id': 'f2'}}]}))
+            db_file = di.json_to_sqlite(zip_filename, os.path.join(tmp_dir, 'model'), batch_size=2, processes=2)
+            conn = sqlite3.connect(db_file)
+            self.assertEqual(conn.execute('SELECT count(*) FROM processes').fetchone()[0], 5)
+            self.assertEqual(conn.execute('SELECT count(*) FROM flows').fetchone()[0], 1)
+            grid = conn.execute("SELECT flowid, amount FROM process_grid WHERE id = 'p3'").fetchall()
+            self.assertEqual(grid, [('f1', 4.0), ('f2', 2.0)])
+            conn.close()
+
+    def test_json_zip_lru(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zip_filename = os.path.join(tmp_dir, 'model.zip')
+            with zipfile.ZipFile(zip_filename, 'w') as zf:
+                zf.writestr('meta.info', json.dumps({'client': 'openLCA'}))
+                for i in range(5):
+                    zf.writestr('processes/p%d.json' % i, json.dumps({'@id': 'p%d' % i, 'name': 'x' * 100}))
+            with di.get_json_zip(zip_filename, max_bytes=300) as j:
+                self.assertEqual(len(j), 6)
+                self.assertEqual(j['meta.info']['client'], 'openLCA')
+                self.assertEqual(sorted(j.ids('processes')), ['p%d' % i for i in range(5)])
+                for i in range(5):
+                    self.assertEqual(j.get_entity('processes', 'p%d' % i)['@id'], 'p%d' % i)
+                self.assertLessEqual(j.cache_bytes, 300)
+                self.assertEqual(list(j.cache), ['processes/p3.json', 'processes/p4.json'])
+
+    def test_csv_to_sqlite_parallel(self):
+        table_cols = {'TBL_FLOWS': ['ID', 'REF_ID', 'FLOW_TYPE'],
+                      'TBL_EXCHANGES': ['ID', 'F_OWNER', 'F_FLOW', 'RESULTING_AMOUNT_VALUE']}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_folder = os.path.join(tmp_dir, 'csv')
+            os.makedirs(csv_folder)
+            with open(os.path.join(csv_folder, 'TBL_FLOWS.csv'), 'w') as fp:
+                fp.writelines('%d,"f%d",PRODUCT_FLOW\n' % (i, i) for i in range(10))
+            with open(os.path.join(csv_folder, 'TBL_EXCHANGES.csv'), 'w') as fp:
+                fp.writelines('%d,%d,%d,%f\n' % (i, i % 3, i % 10, i / 7) for i in range(100))
+
+            serial_db = di.csv_to_sqlite(csv_folder, os.path.join(tmp_dir, 'serial.sqlite'), table_cols,
+                                         chunk_size=30)
+            parallel_db = di.csv_to_sqlite(csv_folder, os.path.join(tmp_dir, 'parallel.sqlite'), table_cols,
+                                           chunk_size=30, processes=2)
+            dumps = []
+            for db_file in [serial_db, parallel_db]:
+                conn = sqlite3.connect(db_file)
+                dumps.append(list(conn.iterdump()))
+                conn.close()
+        self.assertEqual(dumps[0], dumps[1])
+
+    def test_csv_to_sqlite_typed(self):
+        table_types = {'TBL_PROCESSES': [('ID', 'BIGINT'), ('REF_ID', 'VARCHAR'), ('F_LOCATION', 'BIGINT'),
+                                         ('INFRASTRUCTURE_PROCESS', 'SMALLINT'), ('AMOUNT', 'DOUBLE')]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_folder = os.path.join(tmp_dir, 'csv')
+            os.makedirs(csv_folder)
+            with open(os.path.join(csv_folder, 'TBL_PROCESSES.csv'), 'w') as fp:
+                fp.writelines('%d,"%d",%s,0,%f\n' % (i, i, i % 3 if i % 2 else '', i / 7) for i in range(10))
+            for processes in [None, 2]:
+                db_file = di.csv_to_sqlite(csv_folder, os.path.join(tmp_dir, 'typed%s.sqlite' % processes), None,
+                                           chunk_size=4, processes=processes, table_types=table_types)
+                conn = sqlite3.connect(db_file)
+                col_types = [(c[1], c[2], c[5]) for c in conn.execute('PRAGMA table_info(TBL_PROCESSES)')]
+                self.assertEqual(col_types, [('ID', 'INTEGER', 1), ('REF_ID', 'TEXT', 0),
+                                             ('F_LOCATION', 'INTEGER', 0), ('INFRASTRUCTURE_PROCESS', 'INTEGER', 0),
+                                             ('AMOUNT', 'REAL', 0)])
+                row_types = conn.execute('SELECT typeof(REF_ID), typeof(F_LOCATION) FROM TBL_PROCESSES '
+                                         'WHERE ID = 1').fetchone()
+                self.assertEqual(row_types, ('text', 'integer'))
+                self.assertIsNone(conn.execute('SELECT F_LOCATION FROM TBL_PROCESSES WHERE ID = 2').fetchone()[0])
+                conn.close()
+
+    def test_csv_to_sqlite_incremental(self):
+        table_types = {'TBL_FLOWS': [('ID', 'BIGINT'), ('REF_ID', 'VARCHAR'), ('AMOUNT', 'DOUBLE')],
+                       'TBL_EXCHANGES': [('ID', 'BIGINT'), ('F_OWNER', 'BIGINT'), ('F_FLOW', 'BIGINT')]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_folder = os.path.join(tmp_dir, 'csv')
+            os.makedirs(csv_folder)
+            with open(os.path.join(csv_folder, 'TBL_EXCHANGES.csv'), 'w') as fp:
+                fp.writelines('%d,%d,%d\n' % (i, i % 3, i) for i in range(10))
+            csv_file = os.path.join(csv_folder, 'TBL_FLOWS.csv')
+            db_file = os.path.join(tmp_dir, 'flows.sqlite')
+            with open(csv_file, 'w') as fp:
+                fp.writelines('%d,"f%d",%d\n' % (i, i, i) for i in range(10))
+            di.csv_to_sqlite(csv_folder, db_file, None, chunk_size=3, table_types=table_types, incremental=True)
+
+            # change one row, delete one row and add one row
+            with open(csv_file, 'w') as fp:
+                fp.writelines('%d,"f%d",%d\n' % (i, i, 100 if i == 4 else i) for i in range(1, 11))
+            conn = sqlite3.connect(db_file)
+            self.assertEqual(di.csv_table_to_sqlite_incremental(csv_file, 'TBL_FLOWS', None, conn, chunk_size=3,
+                                                                column_types=table_types['TBL_FLOWS']), (2, 1))
+            rows = conn.execute('SELECT ID, AMOUNT FROM TBL_FLOWS ORDER BY ID').fetchall()
+            self.assertEqual(rows, [(i, 100 if i == 4 else i) for i in range(1, 11)])
+            self.assertEqual(di.csv_table_to_sqlite_incremental(csv_file, 'TBL_FLOWS', None, conn, chunk_size=3,
+                                                                column_types=table_types['TBL_FLOWS']), (0, 0))
+            conn.close()
+
+    def test_csv_to_sqlite_incremental_after_import(self):
+        table_types = {'TBL_FLOWS': [('ID', 'BIGINT'), ('REF_ID', 'VARCHAR'), ('AMOUNT', 'DOUBLE')]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_folder = os.path.join(tmp_dir, 'csv')
+            os.makedirs(csv_folder)
+            csv_file = os.path.join(csv_folder, 'TBL_FLOWS.csv')
+            with open(csv_file, 'w') as fp:
+                fp.writelines('%d,"f%d",%d\n' % (i, i, i) for i in range(10))
+            for types in [table_types, None]:
+                # a database imported without row hashes is updated in place
+                db_file = di.csv_to_sqlite(csv_folder, os.path.join(tmp_dir, 'flows%s.sqlite' % bool(types)),
+                                           {'TBL_FLOWS': ['ID', 'REF_ID', 'AMOUNT']}, chunk_size=3,
+                                           table_types=types)
+                with open(csv_file, 'w') as fp:
+                    fp.writelines('%d,"f%d",%d\n' % (i, i, 100 if i == 4 else i) for i in range(1, 11))
+                di.csv_to_sqlite(csv_folder, db_file, {'TBL_FLOWS': ['ID', 'REF_ID', 'AMOUNT']}, chunk_size=3,
+                                 table_types=types, incremental=True)
+                conn = sqlite3.connect(db_file)
+                rows = conn.execute('SELECT ID, AMOUNT FROM TBL_FLOWS ORDER BY ID').fetchall()
+                self.assertEqual(rows, [(i, 100 if i == 4 else i) for i in range(1, 11)])
+                conn.close()
+                with open(csv_file, 'w') as fp:
+                    fp.writelines('%d,"f%d",%d\n' % (i, i, i) for i in range(10))
+
+    def test_csv_to_sqlite_resume(self):
+        table_cols = {'TBL_FLOWS': ['ID', 'REF_ID']}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_file = os.path.join(tmp_dir, 'TBL_FLOWS.csv')
+            with open(csv_file, 'w') as fp:
+                fp.writelines('%d,"f%d"\n' % (i, i) for i in range(10))
+            conn = sqlite3.connect(os.path.join(tmp_dir, 'flows.sqlite'))
+            conn.execute('CREATE TABLE MOLA_IMPORT (TABLE_NAME TEXT PRIMARY KEY, SOURCE TEXT, RUN INTEGER, '
+                         'CHUNKS INTEGER, COMPLETE INTEGER)')
+
+            # simulate an import interrupted after the first two chunks
+            stat = os.stat(csv_file)
+            conn.execute("INSERT INTO MOLA_IMPORT VALUES ('TBL_FLOWS', ?, 1, 2, 0)",
+                         ('%d:%d' % (stat.st_size, stat.st_mtime_ns),))
+            di.insert_dataframe(conn, 'TBL_FLOWS', pd.DataFrame({'ID': range(6),
+                                                                 'REF_ID': ['f%d' % i for i in range(6)]}))
+            conn.commit()
+            self.assertEqual(di.csv_table_to_sqlite_incremental(csv_file, 'TBL_FLOWS', table_cols['TBL_FLOWS'], conn,
+                                                                chunk_size=3, incremental=False), (4, 0))
+            self.assertEqual(conn.execute('SELECT ID FROM TBL_FLOWS').fetchall(), [(i,) for i in range(10)])
+            conn.close()
+
+    def test_create_csv_indices(self):
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE TBL_EXCHANGES (ID INTEGER PRIMARY KEY, F_OWNER INTEGER, F_FLOW INTEGER, '
+                     'F_UNIT INTEGER, RESULTING_AMOUNT_VALUE REAL, COST_VALUE REAL, F_CURRENCY INTEGER)')
+        conn.execute('CREATE TABLE TBL_PROCESSES (ID INTEGER PRIMARY KEY, REF_ID TEXT, F_LOCATION INTEGER)')
+        conn.execute('CREATE INDEX TBL_EXCHANGES_F_OWNER ON TBL_EXCHANGES(F_OWNER)')
+        di.create_csv_indices(conn)
+        indices = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertEqual(sorted(indices), ['TBL_EXCHANGES_F_FLOW', 'TBL_EXCHANGES_F_OWNER_COVER', 'TBL_EXCHANGES_ID',
+                                           'TBL_PROCESSES_ID_COVER', 'TBL_PROCESSES_REF_ID'])
+        plan = conn.execute('EXPLAIN QUERY PLAN SELECT F_FLOW, RESULTING_AMOUNT_VALUE FROM TBL_EXCHANGES '
+                            'WHERE F_OWNER IN (SELECT ID FROM TBL_PROCESSES WHERE REF_ID = ?)', ('p',)).fetchall()
+        self.assertFalse(any(r[3].startswith('SCAN TBL_EXCHANGES') for r in plan))
+
+    def test_build_sparse_matrices(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'matrices.sqlite')
+            create_lca_db(db_file).close()
+            folder = di.build_sparse_matrices(db_file)
+            for name in di.sparse_matrices:
+                with open(os.path.join(folder, name, 'meta.json')) as fp:
+                    self.assertEqual(json.load(fp)['db_fingerprint'], di.get_db_fingerprint(db_file))
+
+    def test_create_subset_db(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'full.sqlite')
+            conn = create_lca_db(db_file)
+            di.create_csv_indices(conn)
+            conn.close()
+            subset_db_file = di.create_subset_db(db_file, os.path.join(tmp_dir, 'subset.sqlite'),
+                                                 config={'sets': {'P_m': ['p1'], 'P_t': ['p4'], 'KPI': ['k2']}})
+            conn = sqlite3.connect(subset_db_file)
+            self.assertEqual(conn.execute('SELECT REF_ID FROM TBL_PROCESSES ORDER BY ID').fetchall(),
+                             [('p1',), ('p4',)])
+            self.assertEqual(conn.execute('SELECT count(*) FROM TBL_EXCHANGES').fetchone()[0], 9)
+            self.assertEqual(conn.execute('SELECT count(*) FROM TBL_FLOWS').fetchone()[0], 5)
+            self.assertEqual(conn.execute('SELECT VALUE FROM TBL_IMPACT_FACTORS').fetchall(), [(3.0,)])
+            self.assertEqual(conn.execute('SELECT NAME FROM TBL_UNITS').fetchall(), [])
+            self.assertIsNotNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'TBL_PROCESSES_REF_ID'")
+                                 .fetchone())
+            assert_model_tables_equal(self, conn, subset_db_file)
+            conn.close()
+
+            # flows without the reference flow property column cannot be subset
+            conn = sqlite3.connect(db_file)
+            conn.execute('CREATE TABLE TBL_FLOW_PROPERTIES (ID INTEGER PRIMARY KEY)')
+            conn.commit()
+            conn.close()
+            self.assertRaises(sqlite3.OperationalError, di.create_subset_db, db_file, subset_db_file,
+                              config={'sets': {'P_m': ['p1']}})
+            self.assertFalse(os.path.exists(subset_db_file))
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_sqlite_to_parquet(self):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'parquet.sqlite')
+            conn = create_lca_db(db_file)
+            # columns that are null in whole chunks
+            conn.execute("UPDATE TBL_EXCHANGES SET F_UNIT = 1, COST_VALUE = 2.5 WHERE ID <= 5")
+            conn.execute("UPDATE TBL_FLOWS SET REF_ID = NULL WHERE ID >= 10")
+            conn.commit()
+            conn.close()
+            folder = di.sqlite_to_parquet(db_file, chunk_size=10)
+            with open(os.path.join(folder, 'meta.json')) as fp:
+                meta = json.load(fp)
+            self.assertEqual(meta['db_fingerprint'], di.get_db_fingerprint(db_file))
+            self.assertEqual(sorted(meta['tables']), ['TBL_EXCHANGES', 'TBL_FLOWS', 'TBL_IMPACT_CATEGORIES',
+                                                      'TBL_IMPACT_FACTORS', 'TBL_LOCATIONS', 'TBL_PROCESSES',
+                                                      'TBL_UNITS'])
+            exchanges = pq.read_table(os.path.join(folder, 'TBL_EXCHANGES')).to_pandas()
+            self.assertEqual(exchanges['COST_VALUE'].notna().sum(), 5)
+            flows = pq.read_table(os.path.join(folder, 'TBL_FLOWS')).to_pandas()
+            self.assertEqual(flows['REF_ID'].isna().sum(), 2)
+
+    def test_insert_dataframe(self):
+        dfr = pd.DataFrame({'id': ['a', 'b'], 'input': [True, False], 'amount': [1.5, None]})
+        to_sql_conn = sqlite3.connect(':memory:')
+        dfr.to_sql('processes', to_sql_conn, if_exists='append')
+        bulk_conn = sqlite3.connect(':memory:')
+        di.begin_bulk_load(bulk_conn)
+        bulk_conn.execute('BEGIN')
+        di.insert_dataframe(bulk_conn, 'processes', dfr, index=True)
+        bulk_conn.commit()
+        di.create_dataframe_index(bulk_conn, 'processes')
+        di.end_bulk_load(bulk_conn)
+        query = 'SELECT * FROM processes'
+        self.assertEqual(to_sql_conn.execute(query).fetchall(), bulk_conn.execute(query).fetchall())
+
     def test_get_json_zip(self):
         j = di.get_json_zip(self.json_zip_filename)
         self.assertEqual(j['meta.info']['client'], 'openLCA 1.10.2')
@@ -1,14 +1,30 @@
 # units tests on the dataview module
-from unittest import TestCase
+from unittest import TestCase, skipUnless
+import importlib.util
+import tempfile
+import sqlite3
+import os
+import glob
+import zipfile
+
+import pandas as pd
 
 import mola.dataview as dv
 import mola.dataimport as di
+import mola.sqlgenerator as sq
+from mola import Package
+from mola.tests.lca_db import create_lca_db, assert_model_tables_equal
 
 
 class DataView(TestCase):
     # testing from full default db
     conn = di.get_sqlite_connection()
 
+    def test_check_query_plans(self):
+        plans = dv.check_query_plans(DataView.conn)
+        self.assertGreater(len(plans), 0)
+        self.assertFalse(plans['FULL_SCAN'].any())
+
     def test_get_ids(self):
         dfr = dv.get_ids(DataView.conn, ref_ids=['64867712-23c4-3be5-a50e-3631e74571a6'],
                          table_name='TBL_PROCESSES')
@@ -77,7 +93,10 @@ class DataView(TestCase):
 
 class TestLookupTables(TestCase):
     conn = di.get_sqlite_connection()
-    lookup = dv.LookupTables(conn)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.lookup = dv.LookupTables(cls.conn)
 
     def test_get(self):
         pm = self.lookup.get('P_m')
@@ -90,4 +109,172 @@ class TestLookupTables(TestCase):
         self.assertEqual(pm.shape[1], 1)
 
 
+class DataViewTempDb(TestCase):
+    # testing from a small db created by each test
+
+    def test_get_process_exchanges(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'exchanges.sqlite')
+            conn = create_lca_db(db_file)
+            conn.execute("UPDATE TBL_EXCHANGES SET F_UNIT = 1, COST_VALUE = 2.5 WHERE F_FLOW < 5")
+            conn.commit()
+            exchanges_dfr = dv.get_process_exchanges(conn, ['p1', 'p4'])
+            self.assertEqual(len(exchanges_dfr), 9)
+            product_dfr = exchanges_dfr[exchanges_dfr['FLOW_TYPE'] == 'PRODUCT_FLOW']
+            self.assertEqual(product_dfr[['P', 'FLOW_REF_ID', 'COST_VALUE', 'Units', 'X', 'Y']].values.tolist(),
+                             [['p1', 'f1', 2.5, 'kg', -2.0, 53.0]])
+            query_dfr = pd.read_sql(sq.build_process_elementary_flow(['p1', 'p4']), conn)
+            self.assertEqual(sorted(query_dfr.fillna('').itertuples(index=False), key=str),
+                             sorted(dv.get_process_elementary_flow_from_exchanges(exchanges_dfr).fillna('')
+                                    .itertuples(index=False), key=str))
+            conn.close()
+
+    def test_bind_ref_ids(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'bind.sqlite')
+            conn = create_lca_db(db_file)
+            ref_id_table = dv.bind_ref_ids(conn, 'processes', ['p4', 'p1'])
+            self.assertEqual(conn.execute("SELECT REF_ID FROM temp.MOLA_REF_IDS_processes").fetchall(),
+                             [('p1',), ('p4',)])
+
+            # the same ref ids reuse the table, new ref ids replace its rows
+            conn.execute("INSERT INTO temp.MOLA_REF_IDS_processes VALUES ('marker')")
+            dv.bind_ref_ids(conn, 'processes', ['p1', 'p4', 'p1'])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM temp.MOLA_REF_IDS_processes").fetchone()[0], 3)
+            dv.bind_ref_ids(conn, 'processes', ['p1', 'p4'])
+            dv.bind_ref_ids(conn, 'processes', ['p1', 'p2', 'p4'])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM temp.MOLA_REF_IDS_processes").fetchone()[0], 3)
+            dv.bind_ref_ids(conn, 'processes', ['p1', 'p4'])
+
+            inline_dfr = dv.get_process_exchanges(conn, ['p1', 'p4'])
+            inline_units_dfr = dv.get_process_product_flow_units(conn, ['p1', 'p4'])
+            Package.set('sql.bind_ref_ids', True)
+            try:
+                bound_dfr = dv.get_process_exchanges(conn, ['p1', 'p4'])
+                bound_units_dfr = dv.get_process_product_flow_units(conn, ['p1', 'p4'])
+                self.assertEqual(dv.get_ids(conn, ['p2'], 'TBL_PROCESSES'), {2: 'p2'})
+                self.assertEqual(len(dv.get_ids(conn, None, 'TBL_PROCESSES')), 5)
+            finally:
+                Package.set('sql.bind_ref_ids', False)
+            self.assertTrue(inline_dfr.equals(bound_dfr))
+            self.assertTrue(inline_units_dfr.equals(bound_units_dfr))
+
+            self.assertRaises(ValueError, dv.bind_ref_ids, conn, 'processes; DROP TABLE TBL_FLOWS', ['p1'])
+            conn.close()
+
+    def test_query_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'cache.sqlite')
+            create_lca_db(db_file).close()
+            cache_folder = os.path.join(tmp_dir, 'cache')
+            with dv.QueryCache(db_file, folder=cache_folder, enabled=True) as cache:
+                exchanges_dfr = cache.get_build_df(sq.build_process_exchanges, 'processes', ['p1', 'p4'])
+                self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+            # an unchanged db is not connected to
+            with dv.QueryCache(db_file, folder=cache_folder, enabled=True) as cache:
+                self.assertTrue(cache.get_build_df(sq.build_process_exchanges, 'processes', ['p1', 'p4'])
+                                .equals(exchanges_dfr))
+                self.assertEqual((cache.hits, cache.misses), (1, 0))
+                self.assertIsNone(cache.conn)
+
+            # a changed db misses the cache
+            conn = sqlite3.connect(db_file)
+            conn.execute("DELETE FROM TBL_EXCHANGES WHERE F_OWNER = 4")
+            conn.commit()
+            conn.close()
+            stat = os.stat(db_file)
+            os.utime(db_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            with dv.QueryCache(db_file, folder=cache_folder, enabled=True) as cache:
+                self.assertLess(len(cache.get_build_df(sq.build_process_exchanges, 'processes', ['p1', 'p4'])),
+                                len(exchanges_dfr))
+                self.assertEqual(cache.misses, 1)
+
+            # the least recently used results are evicted
+            with dv.QueryCache(db_file, folder=cache_folder, max_bytes=0, enabled=True) as cache:
+                cache.get_df("SELECT REF_ID FROM TBL_FLOWS")
+                self.assertEqual(os.listdir(cache_folder), [])
+
+    def test_query_cache_by_ref_id(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'cache.sqlite')
+            create_lca_db(db_file).close()
+            cache_folder = os.path.join(tmp_dir, 'cache')
+            query_dfr = dv.QueryCache(db_file, enabled=False) \
+                .get_build_df(sq.build_process_exchanges, 'processes', ['p1', 'p2', 'p4', 'p5'])
+            with dv.QueryCache(db_file, folder=cache_folder, enabled=True) as cache:
+                cache.get_build_df_by_ref_id(sq.build_process_exchanges, 'processes', ['p1', 'p4'])
+                self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+            # only the new processes are queried, including one with no exchanges
+            for bind in [False, True]:
+                Package.set('sql.bind_ref_ids', bind)
+                try:
+                    with dv.QueryCache(db_file, folder=cache_folder, enabled=True) as cache:
+                        dfr = cache.get_build_df_by_ref_id(sq.build_process_exchanges, 'processes',
+                                                           ['p1', 'p2', 'p4', 'p5'])
+                        self.assertEqual((cache.hits, cache.misses), (4, 0) if bind else (2, 2))
+                finally:
+                    Package.set('sql.bind_ref_ids', False)
+                self.assertEqual(sorted(dfr.fillna('').itertuples(index=False), key=str),
+                                 sorted(query_dfr.fillna('').itertuples(index=False), key=str))
+
+            # a changed build function misses the cache
+            def build_process_exchanges(process_ref_ids, flow_types=('PRODUCT_FLOW', 'ELEMENTARY_FLOW')):
+                return sq.build_process_exchanges(process_ref_ids, flow_types[:1])
+            build_process_exchanges.__module__ = sq.build_process_exchanges.__module__
+            with dv.QueryCache(db_file, folder=cache_folder, enabled=True) as cache:
+                dfr = cache.get_build_df_by_ref_id(build_process_exchanges, 'processes', ['p1', 'p4'])
+                self.assertEqual((cache.hits, cache.misses), (0, 2))
+                self.assertEqual(set(dfr['FLOW_TYPE']), {'PRODUCT_FLOW'})
+
+    def test_get_sparse_matrix(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'matrices.sqlite')
+            conn = create_lca_db(db_file)
+            di.build_sparse_matrices(db_file)
+            self.assertEqual(dv.get_model_table_source(db_file, 'process_elementary_flow'), 'matrix')
+            assert_model_tables_equal(self, conn, db_file)
+
+            # the matrices are kept with a db extracted from a zip file, which has a new modification time
+            zip_file = os.path.join(tmp_dir, 'matrices.zip')
+            with zipfile.ZipFile(zip_file, 'w') as zf:
+                for f in [db_file] + glob.glob(os.path.join(di.get_sparse_matrix_folder(db_file), '*', '*')):
+                    zf.write(f, arcname=os.path.relpath(f, tmp_dir))
+            with zipfile.ZipFile(zip_file) as zf:
+                zf.extractall(os.path.join(tmp_dir, 'unzipped'))
+            unzipped_db_file = os.path.join(tmp_dir, 'unzipped', 'matrices.sqlite')
+            self.assertEqual(dv.get_model_table_source(unzipped_db_file, 'process_elementary_flow'), 'matrix')
+
+            # the matrices of another version of the database are ignored
+            conn.execute("UPDATE TBL_EXCHANGES SET RESULTING_AMOUNT_VALUE = 99 WHERE F_OWNER = 1")
+            conn.commit()
+            self.assertIsNone(dv.get_sparse_matrix(db_file, 'process_elementary_flow'))
+            self.assertEqual(dv.get_model_table_source(db_file, 'process_elementary_flow'), 'sqlite')
+            assert_model_tables_equal(self, conn, db_file)
+            conn.close()
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_read_parquet(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'parquet.sqlite')
+            conn = create_lca_db(db_file)
+            # columns that are null in whole chunks
+            conn.execute("UPDATE TBL_EXCHANGES SET F_UNIT = 1, COST_VALUE = 2.5 WHERE ID <= 5")
+            conn.execute("UPDATE TBL_FLOWS SET REF_ID = NULL WHERE ID >= 10")
+            conn.commit()
+            di.sqlite_to_parquet(db_file, chunk_size=10)
+            self.assertEqual(len(dv.read_parquet(db_file, 'TBL_FLOWS', filters=[('FLOW_TYPE', '==', 'PRODUCT_FLOW')])),
+                             5)
+            exchanges = dv.read_parquet(db_file, 'TBL_EXCHANGES', ['ID', 'F_UNIT', 'COST_VALUE'])
+            self.assertEqual(exchanges['COST_VALUE'].notna().sum(), 5)
+            self.assertEqual(dv.read_parquet(db_file, 'TBL_FLOWS', ['REF_ID'])['REF_ID'].isna().sum(), 2)
+            self.assertEqual(dv.get_model_table_source(db_file, 'process_elementary_flow'), 'parquet')
+            assert_model_tables_equal(self, conn, db_file)
 
+            # the parquet dataset of another version of the database is ignored
+            conn.execute("DELETE FROM TBL_UNITS")
+            conn.commit()
+            self.assertEqual(dv.get_model_table_source(db_file, 'process_elementary_flow'), 'sqlite')
+            self.assertRaises(ValueError, dv.read_parquet, db_file, 'TBL_FLOWS')
+            conn.close()
@@ -0,0 +1,92 @@
+from unittest import TestCase
+import collections
+import tempfile
+import os
+
+import numpy as np
+import pandas as pd
+import pyomo.environ as pe
+from pyomo.repn import generate_standard_repn
+
+import mola.build as mb
+import mola.matrix as mm
+
+
+def get_linear_terms(expr):
+    repn = generate_standard_repn(expr)
+    terms = collections.defaultdict(float)
+    for v, c in zip(repn.linear_vars, repn.linear_coefs):
+        terms[v.name] += pe.value(c)
+    return {k: round(v, 9) for k, v in terms.items() if v != 0}, pe.value(repn.constant)
+
+
+def get_row(terms, sense, rhs):
+    # rows as greater than or equal rows, with equality rows signed by their first variable
+    if sense == 'L' or (sense == 'E' and terms and terms[min(terms)] < 0):
+        terms, rhs = {k: -v for k, v in terms.items()}, -rhs
+    return 'E' if sense == 'E' else 'G', round(rhs + 0.0, 9), tuple(sorted(terms.items()))
+
+
+class TestMatrix(TestCase):
+
+    def test_build_general_matrix(self):
+        # the matrix engine should give the same rows and objective as the pyomo expressions
+        for config_file in ['../../config/Lemon_Toy_Model.json', '../../config/Orange_Toy_Model.json',
+                            'test_model_config.json']:
+            config = mb.get_config(config_file)
+            instance = mb.build_instance(config)
+            settings = {**config['settings'], 'matrix_build': True}
+            matrix_instance = mb.build_instance(mb.get_config(config_file), settings)
+            self.assertEqual(len(list(matrix_instance.component_objects(pe.Constraint))), 0)
+            matrix = mm.build_general_matrix(matrix_instance, 'Environmental_Cost_Impact')
+
+            pyomo_rows = collections.Counter()
+            for con in instance.component_data_objects(pe.Constraint, active=True):
+                terms, constant = get_linear_terms(con.body)
+                if terms:
+                    for sense, bound in [('E', con.lower)] if con.equality else \
+                            [('G', con.lower), ('L', con.upper)]:
+                        if bound is not None:
+                            pyomo_rows[get_row(terms, sense, pe.value(bound) - constant)] += 1
+
+            names = ['%s[%s]' % (v, ','.join(i if isinstance(i, tuple) else (i,)))
+                     for v, i in matrix.variables[['Var', 'Index']].itertuples(index=False)]
+            matrix_rows = collections.Counter()
+            for row, coefficients in matrix.coefficients.groupby('Row'):
+                terms = {names[c]: round(v, 9) for c, v in zip(coefficients['Col'], coefficients['Value'])}
+                matrix_rows[get_row(terms, *matrix.constraints.loc[row, ['Sense', 'RHS']])] += 1
+            self.assertEqual(matrix_rows, pyomo_rows)
+
+            objective, _ = get_linear_terms(instance.Environmental_Cost_Impact.expr)
+            self.assertEqual({names[c]: round(v, 9) for c, v in matrix.objective.items()}, objective)
+
+    def test_write_mps(self):
+        variables = pd.DataFrame({'Var': ['x', 'x', 'y'], 'Index': [('a',), ('b',), ('a',)],
+                                  'Binary': [False, False, True]})
+        constraints = pd.DataFrame({'Constraint': ['c', 'd'], 'Index': [('a',), ('a',)], 'Sense': ['G', 'E'],
+                                    'RHS': [2.5, 0]})
+        coefficients = pd.DataFrame({'Row': [0, 1, 1], 'Col': [0, 0, 2], 'Value': [1.0, 1.0, -3.0]})
+        matrix = mm.MatrixModel(variables, constraints, coefficients, pd.Series([4.0], index=[2]))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mps_file = os.path.join(tmp_dir, 'model.mps')
+            matrix.write_mps(mps_file)
+            with open(mps_file) as fp:
+                lines = fp.read().splitlines()
+        self.assertEqual(lines, ['NAME mola', 'ROWS', ' N OBJ', ' G R0', ' E R1', 'COLUMNS',
+                                 ' C0 R0 1', ' C0 R1 1', ' C1 OBJ 0', ' C2 OBJ 4', ' C2 R1 -3',
+                                 'RHS', ' RHS R0 2.5', 'BOUNDS', ' BV BND C2', 'ENDATA'])
+
+    def test_read_glpk_solution(self):
+        solutions = {
+            'bas': ['c Problem:', 's bas 2 3 f f 7.5', 'i 1 b 2.5 0', 'j 1 b 2.5 0', 'j 2 l 0 1', 'j 3 b 1 0', 'e o f'],
+            'mip': ['c Problem:', 's mip 2 3 o 7.5', 'i 1 2.5', 'j 1 2.5', 'j 2 0', 'j 3 1', 'e o f']
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for kind, lines in solutions.items():
+                solution_file = os.path.join(tmp_dir, kind + '.sol')
+                with open(solution_file, 'w') as fp:
+                    fp.write('\n'.join(lines) + '\n')
+                status, objective, values = mm.read_glpk_solution(solution_file)
+                self.assertEqual(status, 'f' if kind == 'bas' else 'o')
+                self.assertEqual(objective, 7.5)
+                np.testing.assert_array_equal(values, [2.5, 0, 1])
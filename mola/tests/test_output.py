@@ -26,6 +26,14 @@ class Output(TestCase):
         sets_df = mo.get_sets_frame(self.instance)
         self.assertGreater(len(sets_df), 0)
 
+    def test_get_footprint_frame(self):
+        footprint_df = mo.get_footprint_frame(self.instance)
+        self.assertEqual(len(footprint_df), len(list(self.instance.component_objects())))
+        self.assertNotIn('AF', footprint_df['Component'].values)
+        ef = footprint_df.set_index('Component').loc['EF']
+        self.assertLessEqual(ef['Stored elements'], ef['Number of elements'])
+        self.assertGreater(ef['Approximate bytes'], 0)
+
     def test_get_entity(self):
         # output the variables with and without units
         for v in self.instance.component_objects(pe.Var):
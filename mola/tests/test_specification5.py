@@ -5,6 +5,9 @@ import mola.specification5 as sp
 import mola.build as mb
 import mola.utils as mu
 import json
+import math
+import pygeodesy.formy as pygeo
+import pyomo.environ as pe
 
 # TODO add a SimpleSpecification test
 
@@ -61,3 +64,83 @@ class TestScheduleSpecification(TestCase):
         d = list(model_instance.dd.extract_values().values())
 
         self.assertEqual(int(d[0]), 4487)
+
+        # tasks without coordinates fall back to the user distance rather than an infinite one
+        self.assertTrue(all(math.isfinite(v) for v in d))
+
+    def test_abstract_model(self):
+        # the abstract model is built on first use and shared by specifications with the same settings
+        spec = sp.GeneralSpecification()
+        self.assertIs(spec.abstract_model, sp.GeneralSpecification().abstract_model)
+        spec.settings['test_setting'] = True
+        self.assertIsNot(spec.abstract_model, sp.GeneralSpecification().abstract_model)
+
+        # defaults set by loading sparse parameters into the shared model are restored
+        spec.abstract_model.w.set_default(5)
+        spec.reset_parameter_defaults()
+        self.assertEqual(spec.abstract_model.w.default(), 0)
+
+        # the model for the matrix_build setting has no constraints, is built once and has its defaults restored
+        spec.settings['matrix_build'] = True
+        matrix_model = spec.matrix_abstract_model
+        self.assertIs(matrix_model, spec.matrix_abstract_model)
+        self.assertEqual(len(list(matrix_model.component_objects(pe.Constraint))), 0)
+        matrix_model.w.set_default(5)
+        spec.reset_parameter_defaults()
+        self.assertEqual(matrix_model.w.default(), 0)
+
+    def test_get_impact_intensity(self):
+        kpis, elementary_flows, flows, processes = ['k1', 'k2'], ['e1', 'e2', 'e3'], ['f1', 'f2'], ['p1', 'p2']
+        impact_factors = {('k1', 'e1'): 2, ('k1', 'e3'): 0.5, ('k2', 'e2'): 3, ('k2', 'e4'): 7}
+        process_breakdown = {('e1', 'f1', 'p1'): 1, ('e3', 'f1', 'p1'): 4, ('e2', 'f2', 'p2'): 5,
+                             ('e2', 'f3', 'p2'): 6, ('e4', 'f1', 'p1'): 8}
+        ei = sp.get_impact_intensity(impact_factors, process_breakdown, kpis, elementary_flows, flows, processes)
+        dense_ei = {(kpi, f, p): sum(impact_factors.get((kpi, e), 0) * process_breakdown.get((e, f, p), 0)
+                                     for e in elementary_flows)
+                    for kpi in kpis for f in flows for p in processes}
+        self.assertEqual(ei, {k: v for k, v in dense_ei.items() if v != 0})
+
+        # a model with no KPIs has no impact factors loaded
+        data_portal = pe.DataPortal()
+        data_portal['EF'] = process_breakdown
+        self.assertIsNone(sp.get_loaded_data(data_portal, 'Ef'))
+        self.assertEqual(sp.get_impact_intensity(sp.get_loaded_data(data_portal, 'Ef'),
+                                                 sp.get_loaded_data(data_portal, 'EF'), [], elementary_flows, flows,
+                                                 processes), {})
+
+    def test_get_links(self):
+        index_sets = [['fm1', 'fm2'], ['pm1'], ['ft1'], ['pt1', 'pt2']]
+        sparse_links = {('fm1', 'pm1', 'ft1', 'pt2'): 1}
+        self.assertEqual(sp.get_links(sparse_links, 0, index_sets), [('fm1', 'pm1', 'ft1', 'pt2')])
+        dense_links = {('fm1', 'pm1', 'ft1', 'pt1'): 0, ('fm2', 'pm1', 'ft1', 'pt1'): 1}
+        self.assertEqual(sp.get_links(dense_links, None, index_sets), [('fm2', 'pm1', 'ft1', 'pt1')])
+        # a default link connects every tuple without a zero value
+        self.assertEqual(len(sp.get_links({('fm1', 'pm1', 'ft1', 'pt1'): 0}, 1, index_sets)), 3)
+
+    def test_get_link_groups(self):
+        links = [('fm1', 'pm1', 'ft1', 'pt2'), ('fm2', 'pm1', 'ft1', 'pt2')]
+        by_material = sp.get_link_groups(links, [0, 1], [['fm1', 'fm2'], ['pm1']])
+        self.assertEqual(by_material, {('fm1', 'pm1'): [('ft1', 'pt2')], ('fm2', 'pm1'): [('ft1', 'pt2')]})
+        # every transport process gets a group even if it has no links
+        by_transport = sp.get_link_groups(links, [2, 3], [['ft1'], ['pt1', 'pt2']])
+        self.assertEqual(by_transport, {('ft1', 'pt1'): [], ('ft1', 'pt2'): [('fm1', 'pm1'), ('fm2', 'pm1')]})
+
+    def test_populate_links(self):
+        # transport variables are only declared over the links in J
+        json_list = mb.config_to_json(self.config)
+        model_instance = self.spec.populate(json_list)
+        links = [k for k, v in model_instance.J.items() if v]
+        self.assertEqual(sorted(model_instance.JL), sorted(links))
+        self.assertEqual(len(model_instance.Specific_Material_Transport_Flow),
+                         len(links) * len(model_instance.K) * len(model_instance.T))
+
+    def test_get_haversine_distances(self):
+        process_coordinates = ((-1.5, 52.5), (2.35, 48.86))
+        task_coordinates = ((0.0, 0.0), (-0.13, 51.51), (139.7, 35.7))
+        distances = sp.get_haversine_distances(process_coordinates, task_coordinates)
+        self.assertEqual(distances.shape, (2, 3))
+        for i, (lon1, lat1) in enumerate(process_coordinates):
+            for j, (lon2, lat2) in enumerate(task_coordinates):
+                self.assertAlmostEqual(distances[i, j], pygeo.haversine(lat2, lon2, lat1, lon1) / 1000)
+        # memoised by coordinates
+        self.assertIs(sp.get_haversine_distances(process_coordinates, task_coordinates), distances)
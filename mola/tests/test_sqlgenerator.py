@@ -1,7 +1,12 @@
 from unittest import TestCase
 import mola.sqlgenerator as sq
 import mola.dataimport as di
+import mola.dataview as dv
 import pandas as pd
+import tempfile
+import os
+
+from mola.tests.lca_db import create_lca_db
 
 
 class TestSQLGenerator(TestCase):
@@ -69,3 +74,56 @@ class TestSQLGenerator(TestCase):
         z = pd.read_sql(pfu_sql, self.conn)
         self.assertEqual(len(z), 1)
 
+
+class TestSQLGeneratorTempDb(TestCase):
+    # testing from a small db created by each test
+
+    def test_ref_id_table(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'bind.sqlite')
+            conn = create_lca_db(db_file)
+            ref_id_table = dv.bind_ref_ids(conn, 'processes', ['p4', 'p1'])
+
+            # bound queries have no ref ids in the SQL and give the same results as inlined ids
+            bound_sql = str(sq.build_process_elementary_flow(ref_id_table))
+            self.assertNotIn("'p1'", bound_sql)
+            bound_query_dfr = pd.read_sql(bound_sql, conn, params=ref_id_table.params)
+            self.assertEqual(sorted(bound_query_dfr.fillna('').itertuples(index=False), key=str),
+                             sorted(pd.read_sql(sq.build_process_elementary_flow(['p1', 'p4']), conn).fillna('')
+                                    .itertuples(index=False), key=str))
+            conn.close()
+
+    def test_bind_value(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'bind.sqlite')
+            conn = create_lca_db(db_file)
+
+            # literals are inlined in queries of a list of ref ids
+            self.assertIsNone(sq.get_params(['p1']))
+            self.assertIn("'PRODUCT_FLOW'", sq.build_product_flow_cost(['p1'], ['t1']))
+
+            # other literals of queries of a RefIdTable are bound to named parameters
+            conn.execute("UPDATE TBL_EXCHANGES SET COST_VALUE = 2.5 WHERE F_FLOW < 5")
+            ref_id_table = dv.bind_ref_ids(conn, 'processes', ['p1', 'p4'])
+            bound_sql = sq.build_product_flow_cost(ref_id_table, ["t'1", 't2'])
+            self.assertNotIn("'PRODUCT_FLOW'", bound_sql)
+            self.assertEqual(ref_id_table.params, {'T': "t'1", 'PRODUCT_FLOW': 'PRODUCT_FLOW'})
+            bound_cost_dfr = pd.read_sql(bound_sql, conn, params=ref_id_table.params)
+            self.assertEqual(bound_cost_dfr.values.tolist(), [['f1', 'p1', "t'1", 2.5]])
+            self.assertTrue(bound_cost_dfr.equals(pd.read_sql(sq.build_product_flow_cost(['p1', 'p4'], ["t'1"]), conn)))
+            conn.close()
+
+    def test_build_process_exchanges(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_file = os.path.join(tmp_dir, 'exchanges.sqlite')
+            conn = create_lca_db(db_file)
+            inline_dfr = pd.read_sql(sq.build_process_exchanges(['p1', 'p4'], ['PRODUCT_FLOW']), conn)
+            self.assertEqual(inline_dfr['P'].tolist(), ['p1'])
+
+            # the flow types are bound with the ref ids
+            ref_id_table = dv.bind_ref_ids(conn, 'processes', ['p1', 'p4'])
+            bound_sql = sq.build_process_exchanges(ref_id_table, ['PRODUCT_FLOW'])
+            self.assertNotIn("'PRODUCT_FLOW'", bound_sql)
+            self.assertEqual(ref_id_table.params, {'PRODUCT_FLOW': 'PRODUCT_FLOW'})
+            self.assertTrue(pd.read_sql(bound_sql, conn, params=ref_id_table.params).equals(inline_dfr))
+            conn.close()
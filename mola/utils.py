@@ -13,7 +13,7 @@ def get_index_value(df_dict, value_key='value'):
     :param str value_key: name of value key in dicts
     :return: dict
     """
-    def fiv(g): return {'index': g[0], value_key: g[1]}
+    def fiv(g): return {'index': g.iloc[0], value_key: g.iloc[1]}
     d = {}
     for k, df in df_dict.items():
         if len(df) > 0:
@@ -57,8 +57,16 @@ class Package:
 
     __conf = {
         'show.SQL': True,
+        'show.footprint': False,
+        'sql.bind_ref_ids': False,
+        'cache.queries': False,
+        'cache.folder': None,
+        'cache.max_bytes': 512 * 2**20,
+        'cache.models': False,
+        'build.mutable_parameters': False,
     }
-    __setters = ["show.SQL"]
+    __setters = ["show.SQL", "show.footprint", "sql.bind_ref_ids", "cache.queries", "cache.folder", "cache.max_bytes",
+                 "cache.models", "build.mutable_parameters"]
 
     @staticmethod
     def config(name):
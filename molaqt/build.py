@@ -68,9 +68,20 @@ class ModelBuild(QWidget):
         logging.info('Build started')
         try:
             config = self.controller.get_config()
-            self.concrete_model = mb.build_instance(config, self.controller.spec.settings)
-            if self.controller.model_solve is not None:
-                self.controller.model_solve.concrete_model = self.concrete_model
+            if self.concrete_model is not None:
+                model = mb.update_instance(self.concrete_model, config, self.controller.spec.settings)
+            else:
+                model = mb.build_instance(config, self.controller.spec.settings)
+            model_solve = self.controller.model_solve
+            if model is self.concrete_model:
+                # parameters were updated in place so re-solve a solved model straight away
+                logging.info('Model updated')
+                if model_solve is not None and model_solve.results is not None:
+                    model_solve.run_button_clicked()
+            else:
+                self.concrete_model = model
+                if model_solve is not None:
+                    model_solve.concrete_model = self.concrete_model
             self.build_list.clear()
             self.build_list.addItems(self.build_items)
             logging.info('Build completed')
@@ -4,7 +4,6 @@ from PyQt5.QtWidgets import QTabWidget, QWidget, QHBoxLayout
 import mola.dataimport as di
 import mola.dataview as dv
 import mola.build as mb
-import mola.utils as mu
 import molaqt.build as mqb
 import molaqt.solve as ms
 import molaqt.view as mv
@@ -32,7 +31,7 @@ class Controller(QWidget):
         if 'indexed_sets' in user_config:
             self.indexed_sets.update(user_config['indexed_sets'])
         self.parameters = self.spec.get_default_parameters(self.sets, self.indexed_sets)
-        self.parameters.update(user_config['parameters'])
+        mb.update_parameters(self.parameters, user_config['parameters'])
 
         # if we need a db get lookups
         lookup_sets = [n for n, d in self.spec.user_defined_sets.items() if 'lookup' in d and d['lookup']]
@@ -113,7 +112,7 @@ class CustomController(Controller):
         self.setLayout(layout)
 
     def update_state(self):
-        self.parameters = mu.get_index_value(self.parameters_editor.par)
+        self.parameters = self.parameters_editor.get_parameters()
         # TODO: only allow process_flow to alter J
         p = self.process_flow.get_parameters()
         self.parameters.update({'J': p['J']})
@@ -172,7 +171,7 @@ class StandardController(Controller):
         self.setLayout(layout)
 
     def update_state(self):
-        self.parameters = mu.get_index_value(self.parameters_editor.par)
+        self.parameters = self.parameters_editor.get_parameters()
         if hasattr(self.spec, 'user_defined_indexed_sets'):
             self.indexed_sets = self.indexed_sets_editor.get_indexed_sets()
 
@@ -10,6 +10,7 @@ from PyQt5.QtWidgets import QMessageBox, QAction
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import QSize
 
+from mola import Package
 import molaqt.qrc_resources
 import molaqt.dbview as dbv
 import molaqt.manager as mt
@@ -58,6 +59,12 @@ class MolaMainWindow(QMainWindow):
         self.run_model_action.triggered.connect(self.run_model)
         close_model_action = QAction("&Close", self)
         close_model_action.triggered.connect(self.close_model)
+        # parameters are mutable so that edits update a built model in place and it is re-solved without a rebuild
+        Package.set('build.mutable_parameters', True)
+        mutable_parameters_action = QAction("&Mutable parameters", self, checkable=True)
+        mutable_parameters_action.setChecked(Package.config('build.mutable_parameters'))
+        mutable_parameters_action.setStatusTip('Update the parameters of a built model in place')
+        mutable_parameters_action.toggled.connect(lambda checked: Package.set('build.mutable_parameters', checked))
         exit_action = QAction("&Exit", self)
         exit_action.setShortcut("Alt+E")
         exit_action.setStatusTip('Exit mola')
@@ -88,6 +95,7 @@ class MolaMainWindow(QMainWindow):
         model_menu.addAction(self.new_model_action)
         model_menu.addAction(self.save_model_action)
         model_menu.addAction(close_model_action)
+        model_menu.addAction(mutable_parameters_action)
         model_menu.addAction(exit_action)
 
         db_menu = main_menu.addMenu('&Database')
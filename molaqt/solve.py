@@ -6,6 +6,7 @@ from PyQt5.QtWidgets import QWidget, QPushButton, QGridLayout, QTextEdit, QLabel
 from PyQt5.QtCore import Qt
 import pyomo.environ as pe
 
+import mola.matrix as mm
 import molaqt.dialogs as mdg
 
 
@@ -15,6 +16,7 @@ class ModelSolve(QWidget):
 
         super().__init__()
         self._concrete_model = None
+        self.matrix_build = False
         self.results = None
         self.lookup = lookup
         self.controller = controller
@@ -72,6 +74,12 @@ class ModelSolve(QWidget):
             else:
                 obj.deactivate()
 
+        # models built with the matrix_build setting have no pyomo objectives as mola.matrix assembles them
+        self.matrix_build = self.controller is not None and self.controller.spec.settings.get('matrix_build', False)
+        if self.matrix_build:
+            for name, objective in mm.get_objectives(model).items():
+                self.objective_combobox.addItem(name, objective)
+
     def objective_changed(self):
         for i, obj in enumerate(self._concrete_model.component_objects(pe.Objective)):
             if i == self.objective_combobox.currentIndex():
@@ -88,10 +96,14 @@ class ModelSolve(QWidget):
             opt = pe.SolverFactory("glpk")
 
             try:
-                self.results = opt.solve(self.concrete_model)
-                output = io.StringIO()
-                self.results.write(ostream=output)
-                self.log.setText(output.getvalue())
+                if self.matrix_build:
+                    self.results = mm.solve(self.concrete_model, self.objective_combobox.currentData())
+                    self.log.setText(self.results['Log'])
+                else:
+                    self.results = opt.solve(self.concrete_model)
+                    output = io.StringIO()
+                    self.results.write(ostream=output)
+                    self.log.setText(output.getvalue())
 
                 if self.controller.model_view_manager is not None:
                     self.controller.model_view_manager.concrete_model = self._concrete_model
@@ -17,7 +17,6 @@ from tempfile import NamedTemporaryFile
 
 import molaqt.datamodel as md
 import mola.build as mb
-import mola.utils as mu
 import mola.dataview as mdv
 import molaqt.utils as mqu
 
@@ -520,8 +519,10 @@ class ParametersEditor(QWidget):
         self.get_indexed_sets = get_indexed_sets
         self.lookup = lookup
 
-        # build a dictionary of DataFrames of default parameters from sets
+        # build a dictionary of DataFrames of default parameters from sets, keeping the defaults of the parameters in
+        # the sparse format to write them back in that format
         self.par = mb.build_parameters(sets, parameters, spec, indexed_sets=self.get_indexed_sets())
+        self.defaults = mb.get_parameter_defaults(sets, parameters, spec, indexed_sets=self.get_indexed_sets())
 
         # list widget for user-defined parameters
         self.parameters_list = QListWidget()
@@ -571,15 +572,19 @@ class ParametersEditor(QWidget):
     def rebuild_clicked(self):
         logging.info("Clicked rebuild button")
 
-        # get parameters state in index value form
-        p = mu.get_index_value(self.par)
-
         # rebuild parameters as a dict of DataFrames
-        self.par = mb.build_parameters(self.sets, p, self.spec, indexed_sets=self.get_indexed_sets())
+        self.par = mb.build_parameters(self.sets, self.get_parameters(), self.spec,
+                                       indexed_sets=self.get_indexed_sets())
 
         # update display
         self.parameter_clicked(self.parameters_list.selectedItems()[0])
 
+    def get_parameters(self):
+        """
+        :return: parameters state in index value form, which is the sparse format for the parameters with a default
+        """
+        return mb.get_index_value_parameters(self.par, self.defaults)
+
 
 class ParameterWidget(QWidget):
 
@@ -887,8 +892,7 @@ class ProcessFlow(QWidget):
         # for transport flows find if there is a connecting material flow
         if item.parent().text(0) == 'Transport':
             if product_flow_df.shape[0] > 0 and 'J' in self.parameters:
-                j_link = pd.DataFrame([j['index'] for j in self.parameters['J'] if j['value'] == 1],
-                                      columns=['F_m', 'P_m', 'F_t', 'P_t'])
+                j_link = pd.DataFrame(self.get_links(), columns=['F_m', 'P_m', 'F_t', 'P_t'])
                 df = j_link[(j_link.P_t == ref_id) & (j_link.F_t == product_flow_df.iloc[0, 0])]
                 if df.shape[0] > 0:
                     product_flow_df = pd.concat([product_flow_df] * len(df), ignore_index=True)
@@ -932,8 +936,7 @@ class ProcessFlow(QWidget):
                 flow_ids = list(product_flow_df.FLOW_REF_ID.unique())
                 if len(flow_ids) > 0:
                     self.sets['F_m'].extend([fid for fid in flow_ids if fid not in self.sets['F_m']])
-                params = mb.build_parameters(self.sets, self.get_parameters(), self.spec)
-                self.parameters = mu.get_index_value(params)
+                self.parameters = mb.build_parameters(self.sets, self.get_parameters(), self.spec, index_value=True)
                 self.process_tree.resizeColumnToContents(1)
 
     def remove_process(self):
@@ -971,8 +974,7 @@ class ProcessFlow(QWidget):
                         self.sets['F_t'].remove(fid)
 
         # rebuild sets and parameters
-        params = mb.build_parameters(self.sets, self.get_parameters(), self.spec)
-        self.parameters = mu.get_index_value(params)
+        self.parameters = mb.build_parameters(self.sets, self.get_parameters(), self.spec, index_value=True)
         self.process_tree.resizeColumnToContents(1)
 
     def add_transport_process_clicked(self):
@@ -998,8 +1000,7 @@ class ProcessFlow(QWidget):
                 flow_ids = list(product_flow_df.FLOW_REF_ID.unique())
                 if len(flow_ids) > 0:
                     self.sets['F_t'].extend([fid for fid in flow_ids if fid not in self.sets['F_t']])
-                params = mb.build_parameters(self.sets, self.get_parameters(), self.spec)
-                self.parameters = mu.get_index_value(params)
+                self.parameters = mb.build_parameters(self.sets, self.get_parameters(), self.spec, index_value=True)
                 self.process_tree.resizeColumnToContents(1)
 
     def material_transport_link(self, link: bool):
@@ -1024,10 +1025,9 @@ class ProcessFlow(QWidget):
             ft = None
 
         # link processes and flows
-        for i, j in enumerate(self.parameters['J']):
-            if j['index'] == [fm, pm, ft, pt]:
-                logging.info('%s %s' % (i, j['index']))
-                self.parameters['J'][i] = {'index': j['index'], 'value': link}
+        if fm is not None and ft is not None:
+            logging.info('Link %s %s' % ([fm, pm, ft, pt], link))
+            mb.set_parameter_value(self.parameters['J'], [fm, pm, ft, pt], link)
 
         # update display
         self.process_tree_clicked(item[1-m])
@@ -1052,6 +1052,15 @@ class ProcessFlow(QWidget):
     #
     #     return new_j
 
+    def get_links(self):
+        """
+        :return: list of the indices of the material and transport process links set in J
+        """
+        j = self.parameters['J']
+        index_sets = [self.sets[s] for s in self.spec.user_defined_parameters['J']['index']] \
+            if mb.is_sparse_parameter(j) and j['default'] == 1 else None
+        return [el['index'] for el in mb.get_parameter_elements(j, index_sets) if el['value'] == 1]
+
     def get_parameters(self):
         return self.parameters
 